@@ -0,0 +1,169 @@
+"""
+BTCA 审计分析：审计段 → 列式缓存 → 向量化指标
+
+列式缓存（数据目录/audit_columns/）：
+    meta.json      # 行数、各段已摄取条数、累计和
+    <列名>.f64     # 每列一个只追加的 float64 文件，读取时内存映射
+
+更新() 只摄取各段索引中新增的记录（段键取首条索引的 ts+turn，轮转压缩后不变；
+活动段轮转后读取器从新段的首行重新开始，新段有自己的段键），
+指标只在最近 窗口 行上计算，累计值由 meta 中的累计和给出：
+Streamlit 每次重跑的开销与审计历史总长度无关。
+
+同一缓存目录可被多个会话 / 进程共用（GUI 的各浏览器会话、多个 worker）：
+更新() 在线程锁与 audit_columns/columns.lock 上互斥，持锁后先重读 meta 再摄取。
+"""
+
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from btca_audit import BTCA审计读取器
+from btca_lock import BTCA进程锁
+
+列名 = (
+    "ts", "tokens", "energy", "telomere_after", "telomere_cost",
+    "blocked", "immune_hits", "proposals", "committed", "cycle",
+)
+
+累计列 = ("tokens", "energy", "blocked", "immune_hits", "proposals", "committed", "cycle")
+
+
+def _提取(记录: dict) -> tuple:
+    return (
+        记录.get("_ts", math.nan),
+        记录.get("tokens_used", 0),
+        记录.get("energy_cost", 0.0),
+        记录.get("telomere_after", math.nan),
+        记录.get("telomere_cost", 0.0),
+        1.0 if 记录.get("action") == "immune_block" else 0.0,
+        1.0 if 记录.get("immune_scan") or 记录.get("threats") else 0.0,
+        记录.get("writeback_proposals", 0),
+        记录.get("writeback_committed", 0),
+        1.0 if 记录.get("cycle_detected") else 0.0,
+    )
+
+
+class BTCA审计分析:
+    """审计日志的增量列式缓存 + 趋势指标（更新() 线程安全、可多进程共用缓存目录）"""
+
+    def __init__(self, 数据目录, 文件名="audit_log.jsonl"):
+        self.读取器 = BTCA审计读取器(数据目录, 文件名)
+        self.缓存目录 = os.path.join(数据目录, "audit_columns")
+        os.makedirs(self.缓存目录, exist_ok=True)
+        self.元数据文件 = os.path.join(self.缓存目录, "meta.json")
+        self._锁 = threading.Lock()
+        self.进程锁 = BTCA进程锁(os.path.join(self.缓存目录, "columns.lock"))
+        with self.进程锁.共享():
+            self.元数据 = self._读取元数据()
+
+    def _读取元数据(self) -> dict:
+        if not os.path.exists(self.元数据文件):
+            return {"rows": 0, "segments": {}, "sums": {列: 0.0 for 列 in 累计列}}
+        with open(self.元数据文件, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @property
+    def 行数(self):
+        return self.元数据["rows"]
+
+    # --- 增量摄取 ---
+    def 更新(self) -> int:
+        """摄取新增审计记录，返回新增行数"""
+        with self._锁, self.进程锁.独占():
+            # 其他进程（或共用目录的另一个实例）可能已摄取过：以磁盘上的 meta 为准
+            元数据 = self._读取元数据()
+            新增 = self._摄取(元数据)
+            # 写完列文件与 meta 后才替换：并发的 指标() 读到的总是完整的一版
+            self.元数据 = 元数据
+            return 新增
+
+    def _摄取(self, 元数据) -> int:
+        新行 = []
+        已摄取 = 元数据["segments"]
+        for 段 in self.读取器.段列表():
+            if not 段.索引:
+                continue
+            段键 = f"{段.索引[0]['ts']}:{段.索引[0]['turn']}"
+            起点 = 已摄取.get(段键, 0)
+            if 起点 > len(段.索引):
+                起点 = 0  # 同键但更短：已是另一个段（活动段轮转后重新开始）
+            if 起点 == len(段.索引):
+                continue
+            新项 = 段.索引[起点:]
+            已读 = 0
+            for 项, 记录 in zip(新项, 段.读取(新项)):
+                记录["_ts"] = 项["ts"]
+                新行.append(_提取(记录))
+                已读 += 1
+            # 读取途中活动段被轮转时只记已读的条数，其余在压缩段中补读
+            已摄取[段键] = 起点 + 已读
+        if not 新行:
+            return 0
+
+        矩阵 = np.asarray(新行, dtype=np.float64)
+        # 先追加列文件，再写 meta：崩溃时多出的尾部行会被 meta.rows 截掉
+        for i, 列 in enumerate(列名):
+            with open(self._列文件(列), "ab") as f:
+                f.truncate(元数据["rows"] * 8)
+                矩阵[:, i].tofile(f)
+        for 列 in 累计列:
+            元数据["sums"][列] += float(np.nansum(矩阵[:, 列名.index(列)]))
+        元数据["rows"] += len(新行)
+        临时文件 = self.元数据文件 + ".tmp"
+        with open(临时文件, "w", encoding="utf-8") as f:
+            json.dump(元数据, f)
+        os.replace(临时文件, self.元数据文件)
+        return len(新行)
+
+    def _列文件(self, 列):
+        return os.path.join(self.缓存目录, f"{列}.f64")
+
+    def 列(self, 列: str, 最近: int = None) -> np.ndarray:
+        """内存映射读取一列（可只取最近 N 行）"""
+        行数 = self.元数据["rows"]
+        if not 行数:
+            return np.empty(0)
+        起点 = max(行数 - 最近, 0) if 最近 else 0
+        映射 = np.memmap(self._列文件(列), dtype=np.float64, mode="r", shape=(行数,))
+        return np.array(映射[起点:])
+
+    # --- 指标 ---
+    def 指标(self, 窗口: int = 200) -> dict:
+        """最近 窗口 行的趋势 + 全量累计比率"""
+        累计 = self.元数据["sums"]
+        总行数 = self.元数据["rows"]
+        结果 = {
+            "rows": 总行数,
+            "writeback_acceptance": 累计["committed"] / 累计["proposals"] if 累计["proposals"] else None,
+            "immune_hit_rate": 累计["immune_hits"] / 总行数 if 总行数 else None,
+            "block_rate": 累计["blocked"] / 总行数 if 总行数 else None,
+            "tokens_per_turn": None,
+            "energy_burn_per_hour": None,
+            "telomere_slope_per_turn": None,
+        }
+        if not 总行数:
+            return 结果
+
+        ts = self.列("ts", 窗口)
+        tokens = self.列("tokens", 窗口)
+        energy = self.列("energy", 窗口)
+        telomere = self.列("telomere_after", 窗口)
+        推演轮 = self.列("blocked", 窗口) == 0
+
+        if 推演轮.any():
+            结果["tokens_per_turn"] = float(tokens[推演轮].mean())
+        跨度 = ts[-1] - ts[0]
+        if 跨度 > 0:
+            结果["energy_burn_per_hour"] = float(energy.sum() / 跨度 * 3600)
+        有效 = ~np.isnan(telomere)
+        if 有效.sum() >= 2:
+            结果["telomere_slope_per_turn"] = float(np.polyfit(np.arange(有效.sum()), telomere[有效], 1)[0])
+        return 结果
+
+    def 序列(self, 窗口: int = 200) -> dict:
+        """供图表使用的最近 窗口 行原始序列"""
+        return {列: self.列(列, 窗口) for 列 in ("ts", "tokens", "energy", "telomere_after")}
@@ -0,0 +1,204 @@
+"""
+BTCA M05 附属：抗体库存储（SQLite，WAL 模式）
+
+- antibodies.sqlite3 与 chroma.sqlite3 同目录；首次打开时自动迁移旧的 antibodies.json
+- 命中计数先累积在内存，每轮 提交() 时一个事务批量落盘
+- 支持按 id / 来源 / 命中频次查询，以及冷抗体剪枝
+- seq 列（AUTOINCREMENT）单调递增且不复用：调用方可用 新增抗体(序号水位) 增量同步其他进程学到的抗体；
+  删除抗体时 删除代数 加一，同步方据此整体重建
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+
+# seq 由 AUTOINCREMENT 分配：删除末尾的抗体后也不会被复用，可作增量同步的水位
+_建表 = """
+    CREATE TABLE IF NOT EXISTS antibodies (
+        seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+        id          TEXT NOT NULL UNIQUE,
+        signature   TEXT,
+        keywords    TEXT NOT NULL,
+        source      TEXT,
+        created_at  TEXT,
+        hit_count   INTEGER NOT NULL DEFAULT 0,
+        last_hit    TEXT
+    )
+"""
+_列 = "id, signature, keywords, source, created_at, hit_count, last_hit"
+
+
+class BTCA抗体库:
+    """适应性抗体的索引化存储"""
+
+    def __init__(self, 数据目录):
+        self.路径 = os.path.join(数据目录, "antibodies.sqlite3")
+        self._锁 = threading.Lock()
+        self._连接 = sqlite3.connect(self.路径, check_same_thread=False, isolation_level=None)
+        self._连接.row_factory = sqlite3.Row
+        self._连接.execute("PRAGMA journal_mode=WAL")
+        self._连接.execute("PRAGMA synchronous=NORMAL")
+        self._连接.execute(_建表)
+        self._连接.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_antibodies_source ON antibodies(source);
+            CREATE INDEX IF NOT EXISTS idx_antibodies_hits ON antibodies(hit_count);
+            CREATE TABLE IF NOT EXISTS antibody_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+        self._待计数 = Counter()
+        self._最近命中 = {}
+        self._迁移旧文件(os.path.join(数据目录, "antibodies.json"))
+
+    def _迁移旧文件(self, 旧文件):
+        if not os.path.exists(旧文件):
+            return
+        with open(旧文件, "r", encoding="utf-8") as f:
+            旧抗体 = json.load(f)
+        with self._锁, self._事务():
+            for 抗体 in 旧抗体:
+                self._插入(抗体)
+        os.replace(旧文件, 旧文件 + ".migrated")
+
+    @contextmanager
+    def _事务(self):
+        self._连接.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._连接.execute("ROLLBACK")
+            raise
+        self._连接.execute("COMMIT")
+
+    def _插入(self, 抗体: dict):
+        self._连接.execute(
+            f"INSERT OR IGNORE INTO antibodies ({_列}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (抗体["id"], 抗体.get("signature"), json.dumps(抗体.get("keywords", []), ensure_ascii=False),
+             抗体.get("source"), 抗体.get("created_at"), 抗体.get("hit_count", 0), 抗体.get("last_hit")),
+        )
+
+    def _转字典(self, 行) -> dict:
+        抗体 = dict(行)
+        抗体.pop("seq", None)
+        抗体["keywords"] = json.loads(抗体["keywords"])
+        抗体["hit_count"] += self._待计数.get(抗体["id"], 0)
+        if 抗体["id"] in self._最近命中:
+            抗体["last_hit"] = self._最近命中[抗体["id"]]
+        return 抗体
+
+    # --- 写入 ---
+    def 添加(self, 抗体: dict):
+        with self._锁:
+            self._插入(抗体)
+
+    def 记录命中(self, 抗体ID列表):
+        """命中计数只进内存，由 提交() 批量落盘"""
+        现在 = datetime.now().isoformat()
+        with self._锁:
+            for 抗体ID in 抗体ID列表:
+                self._待计数[抗体ID] += 1
+                self._最近命中[抗体ID] = 现在
+
+    def 提交(self):
+        """一个事务批量写入本轮累积的命中计数"""
+        with self._锁:
+            if not self._待计数:
+                return
+            with self._事务():
+                self._连接.executemany(
+                    "UPDATE antibodies SET hit_count = hit_count + ?, last_hit = ? WHERE id = ?",
+                    [(次数, self._最近命中[i], i) for i, 次数 in self._待计数.items()],
+                )
+            self._待计数.clear()
+            self._最近命中.clear()
+
+    def _删除代数加一(self):
+        """事务内调用"""
+        self._连接.execute("INSERT INTO antibody_meta (key, value) VALUES ('deletions', 1)"
+                         " ON CONFLICT(key) DO UPDATE SET value = value + 1")
+
+    def 替换全部(self, 抗体列表):
+        """一个事务内清空并整体写入（快照恢复用）；尚未落盘的命中计数一并丢弃"""
+        with self._锁, self._事务():
+            self._待计数.clear()
+            self._最近命中.clear()
+            self._连接.execute("DELETE FROM antibodies")
+            for 抗体 in 抗体列表:
+                self._插入(抗体)
+            self._删除代数加一()
+
+    def 剪枝(self, 最多命中=0, 闲置天数=30) -> list:
+        """删除冷抗体：命中数 ≤ 最多命中 且 闲置天数 内未被命中（按创建时间兜底），返回被删除的 id"""
+        self.提交()
+        截止 = (datetime.now() - timedelta(days=闲置天数)).isoformat()
+        with self._锁, self._事务():
+            冷抗体 = [r["id"] for r in self._连接.execute(
+                "SELECT id FROM antibodies WHERE hit_count <= ? AND COALESCE(last_hit, created_at, '') < ?",
+                (最多命中, 截止))]
+            self._连接.executemany("DELETE FROM antibodies WHERE id = ?", [(i,) for i in 冷抗体])
+            if 冷抗体:
+                self._删除代数加一()
+        return 冷抗体
+
+    # --- 查询 ---
+    def __len__(self):
+        with self._锁:
+            return self._连接.execute("SELECT COUNT(*) FROM antibodies").fetchone()[0]
+
+    def __iter__(self):
+        with self._锁:
+            行列表 = self._连接.execute("SELECT * FROM antibodies ORDER BY seq").fetchall()
+            return iter([self._转字典(行) for 行 in 行列表])
+
+    def 遍历(self, 批量: int = 1000):
+        """按 seq 分页产出抗体列表，每页至多 批量 条（不一次性读入全部）"""
+        水位 = 0
+        while True:
+            with self._锁:
+                行列表 = self._连接.execute(
+                    "SELECT * FROM antibodies WHERE seq > ? ORDER BY seq LIMIT ?", (水位, 批量)).fetchall()
+                if not 行列表:
+                    return
+                页 = [self._转字典(行) for 行 in 行列表]
+            水位 = 行列表[-1]["seq"]
+            yield 页
+
+    def 获取(self, 抗体ID: str):
+        with self._锁:
+            行 = self._连接.execute("SELECT * FROM antibodies WHERE id = ?", (抗体ID,)).fetchone()
+            return self._转字典(行) if 行 else None
+
+    def 按来源(self, 来源: str, 数量: int = 100) -> list:
+        with self._锁:
+            行列表 = self._连接.execute(
+                "SELECT * FROM antibodies WHERE source = ? ORDER BY seq DESC LIMIT ?", (来源, 数量)).fetchall()
+            return [self._转字典(行) for 行 in 行列表]
+
+    def 高频(self, 数量: int = 20) -> list:
+        self.提交()
+        with self._锁:
+            行列表 = self._连接.execute(
+                "SELECT * FROM antibodies ORDER BY hit_count DESC LIMIT ?", (数量,)).fetchall()
+            return [self._转字典(行) for 行 in 行列表]
+
+    def 删除代数(self) -> int:
+        """每次 剪枝 / 替换全部 删除抗体时加一（跨进程可见）：据此得知增量同步之外还需整体重建"""
+        with self._锁:
+            行 = self._连接.execute("SELECT value FROM antibody_meta WHERE key = 'deletions'").fetchone()
+        return 行[0] if 行 else 0
+
+    def 新增抗体(self, 序号水位: int = 0) -> tuple:
+        """返回 ([(seq, id, keywords)], 新水位)：只含 seq 大于水位的抗体"""
+        with self._锁:
+            行列表 = self._连接.execute(
+                "SELECT seq, id, keywords FROM antibodies WHERE seq > ? ORDER BY seq", (序号水位,)).fetchall()
+        新水位 = 行列表[-1][0] if 行列表 else 序号水位
+        return [(r[0], r[1], json.loads(r[2])) for r in 行列表], 新水位
+
+    def 关闭(self):
+        self.提交()
+        with self._锁:
+            self._连接.close()
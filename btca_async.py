@@ -0,0 +1,88 @@
+"""
+BTCA M01 异步编排器
+
+与 BTCA调度器 共用 Phase 0-7 的全部逻辑，差异仅在于：
+  - Phase 4 通过 AsyncOpenAI 等待模型，不阻塞事件循环
+  - 磁盘与 Chroma 相关的阶段经 asyncio.to_thread 移出事件循环
+  - 每个会话一把 asyncio.Lock + 独立的循环检测器与会话记忆；跨会话共享的端粒/能量/Treg
+    计数器由 存储.锁 保证原子更新
+  - 模型调用经 BTCA限流器.异步调用 排队、限速与重试（可与同步调度器共享同一实例）
+
+一个进程即可同时服务多路对话（方法命名沿用 OpenAI / AsyncOpenAI 的同名约定）。
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+from btca_dialogue import BTCA会话记忆
+from btca_main import BTCA调度器, BTCA循环检测器, BTCA存储器
+from btca_ratelimit import BTCA限流器
+from btca_respcache import BTCA回复缓存
+
+
+@dataclass
+class BTCA会话:
+    """单路对话的私有状态"""
+    会话ID: str
+    锁: asyncio.Lock = field(default_factory=asyncio.Lock)
+    循环检测: BTCA循环检测器 = field(default_factory=BTCA循环检测器)
+    记忆: BTCA会话记忆 = None
+
+
+class BTCA异步调度器(BTCA调度器):
+    """Ⅲ层外部引擎主控（asyncio 版）"""
+
+    def __init__(self, API密钥: str, 存储: BTCA存储器 = None, 客户端=None, 限流器: BTCA限流器 = None,
+                 回复缓存: BTCA回复缓存 = None, 记忆工厂=None):
+        super().__init__(API密钥, 存储=存储, 客户端=客户端, 限流器=限流器, 回复缓存=回复缓存,
+                         记忆工厂=记忆工厂)
+        self.会话表 = {}
+
+    @staticmethod
+    def _创建客户端(API密钥: str):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=API密钥, max_retries=0)  # 重试由 BTCA限流器 统一负责
+
+    def 获取会话(self, 会话ID: str) -> BTCA会话:
+        会话 = self.会话表.get(会话ID)
+        if 会话 is None:
+            会话 = self.会话表[会话ID] = BTCA会话(会话ID)
+            if self.记忆工厂 is not None:
+                会话.记忆 = self.记忆工厂()
+        return 会话
+
+    def 结束会话(self, 会话ID: str):
+        self.会话表.pop(会话ID, None)
+
+    async def 运行推演周期(self, 用户输入: str, 会话ID: str = "default") -> tuple:
+        """
+        M01 编排器（异步）：一轮对话的完整生命周期
+        同一会话内的轮次串行执行，不同会话之间并发
+        返回：(回复内容, 审计摘要字典)
+        """
+        with self.存储.使用中():
+            会话 = self.获取会话(会话ID)
+            async with 会话.锁:
+                开始 = time.perf_counter()
+                try:
+                    上下文 = await asyncio.to_thread(self._准备, 用户输入, 会话.记忆)
+                    if "回复" in 上下文:
+                        return 上下文["回复"], 上下文["审计"]
+                    命中 = await asyncio.to_thread(self._查回复缓存, 上下文)
+                    if 命中 is not None:
+                        return await asyncio.to_thread(self._结算缓存命中, 上下文, 命中)
+
+                    # ===== Phase 4: 调用GPT（不阻塞事件循环）=====
+                    try:
+                        with self.指标.计时("model_call", 上下文["审计"]):  # 含限流排队与重试
+                            响应 = await self.限流器.异步调用(self.客户端.chat.completions.create,
+                                                     self._请求参数(上下文), 上下文["审计"])
+                    except Exception as e:
+                        return f"【内核故障】GPT调用失败：{e}", 上下文["审计"]
+
+                    self._记录用量(上下文["审计"], 响应.usage)
+                    return await asyncio.to_thread(self._结算, 上下文, *self._解析响应(响应), 会话.循环检测)
+                finally:
+                    await asyncio.to_thread(self.存储.提交)
+                    self.指标.记录阶段("turn", (time.perf_counter() - 开始) * 1000)
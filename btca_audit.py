@@ -0,0 +1,366 @@
+"""
+BTCA M07 审计日志：缓冲写入 + 分段轮转压缩 + 旁路索引 + 区间查询
+
+写入端（BTCA审计写入器）
+  - 记录先进内存缓冲，按条数 / 时间间隔批量刷盘；进程内全部写入器共用一个后台刷盘线程兜底
+  - 文件句柄常驻；收起() 关闭空闲写入器的句柄与锁文件（多租户时由租户管理器调用），下次刷盘时重新打开
+  - 活动段 audit_log.jsonl 超过大小上限或跨日时轮转：
+        audit_log.jsonl  →  audit_log.<首条时间>.jsonl.gz
+  - 每个段有自己的旁路索引 <段名>.idx（JSON Lines：ts / off / len / turn / action），
+    随段一起轮转，因此轮转后无需改写索引
+  - 多进程共用同一目录时，刷盘与轮转在 audit_log.jsonl.lock 上互斥，
+    刷盘前按文件实际大小校正偏移（其他进程轮转过活动段则重新打开）
+
+读取端（BTCA审计读取器）
+  - 只读各段的索引即可按时间、action、turn_id 定位；时间区间用二分查找
+    （多进程并发追加使 ts 乱序的段退化为顺序扫描）
+  - 活动段按索引文件的 inode 识别：轮转后同一路径上的新段从头读取
+  - 活动段通过 mmap 按偏移切片读取；压缩段只解压被命中的段
+"""
+
+import bisect
+import gzip
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+import weakref
+from datetime import datetime
+
+from btca_lock import BTCA进程锁
+
+
+def _时间戳(记录: dict) -> float:
+    try:
+        return datetime.fromisoformat(记录["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+def _索引项(记录: dict, 偏移: int, 长度: int) -> dict:
+    return {"ts": _时间戳(记录), "off": 偏移, "len": 长度,
+            "turn": 记录.get("turn_id"), "action": 记录.get("action", "turn")}
+
+
+class _共享刷盘线程:
+    """进程内全部写入器共用的定时刷盘线程：按各写入器的 刷新间隔 把滞留的缓冲写出"""
+
+    def __init__(self):
+        self._写入器 = weakref.WeakSet()
+        self._锁 = threading.Lock()
+        self._线程 = None
+
+    def 登记(self, 写入器):
+        with self._锁:
+            self._写入器.add(写入器)
+            if self._线程 is None:
+                self._线程 = threading.Thread(target=self._循环, name="btca-audit-flush", daemon=True)
+                self._线程.start()
+
+    def 注销(self, 写入器):
+        with self._锁:
+            self._写入器.discard(写入器)
+
+    def _循环(self):
+        while True:
+            with self._锁:
+                写入器列表 = list(self._写入器)
+            time.sleep(min((w.刷新间隔 for w in 写入器列表), default=1.0))
+            for 写入器 in 写入器列表:
+                写入器._到期刷新()
+
+
+_刷盘线程 = _共享刷盘线程()
+
+
+class BTCA审计写入器:
+    """审计日志写入端（线程安全）"""
+
+    def __init__(self, 目录, 文件名="audit_log.jsonl", 缓冲条数=32, 刷新间隔=1.0,
+                 分段大小=64 * 1024 * 1024, 按日分段=True):
+        self.目录 = 目录
+        self.路径 = os.path.join(目录, 文件名)
+        self.索引路径 = self.路径 + ".idx"
+        self.缓冲条数 = 缓冲条数
+        self.刷新间隔 = 刷新间隔
+        self.分段大小 = 分段大小
+        self.按日分段 = 按日分段
+        self._锁 = threading.Lock()
+        # 多个进程共用同一目录时，追加与轮转都在该文件锁内进行
+        self.进程锁 = BTCA进程锁(self.路径 + ".lock")
+        self._缓冲 = []          # [(行字节, 记录)]
+        self._上次刷新 = time.monotonic()
+        self._段首日期 = None
+        self._已关闭 = False
+        self._打开活动段()
+        if 刷新间隔:
+            _刷盘线程.登记(self)
+
+    def _打开活动段(self):
+        if os.path.exists(self.路径) and not os.path.exists(self.索引路径):
+            重建索引(self.路径, self.索引路径)
+        self._文件 = open(self.路径, "ab")
+        self._索引文件 = open(self.索引路径, "a", encoding="utf-8")
+        self._偏移 = self._文件.tell()
+        self._段首日期 = None
+        if self._偏移:
+            with open(self.索引路径, "r", encoding="utf-8") as f:
+                首行 = f.readline()
+            if 首行:
+                self._段首日期 = datetime.fromtimestamp(json.loads(首行)["ts"]).date()
+
+    # --- 写入 ---
+    def 写入(self, 记录: dict):
+        行 = (json.dumps(记录, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._锁:
+            self._缓冲.append((行, 记录))
+            if (len(self._缓冲) >= self.缓冲条数
+                    or time.monotonic() - self._上次刷新 >= self.刷新间隔):
+                self._刷新()
+
+    def 刷新(self):
+        with self._锁:
+            self._刷新()
+
+    def _刷新(self):
+        self._上次刷新 = time.monotonic()
+        if not self._缓冲:
+            return
+        with self.进程锁.独占():
+            self._跟进()
+            self._写缓冲()
+
+    def _跟进(self):
+        """其他进程轮转了活动段（或句柄已被收起）则重新打开；其他进程追加过则把偏移移到文件末尾（持进程锁调用）"""
+        try:
+            当前 = os.stat(self.路径)
+        except FileNotFoundError:
+            当前 = None
+        if self._文件 is None:
+            self._打开活动段()
+        elif 当前 is None or 当前.st_ino != os.fstat(self._文件.fileno()).st_ino:
+            self._文件.close()
+            self._索引文件.close()
+            self._打开活动段()
+        else:
+            self._偏移 = 当前.st_size
+
+    def _写缓冲(self):
+        if self._需轮转(self._缓冲[0][1]):
+            self._轮转()
+        索引行 = []
+        for 行, 记录 in self._缓冲:
+            索引行.append(json.dumps(_索引项(记录, self._偏移, len(行)), ensure_ascii=False))
+            self._偏移 += len(行)
+            if self._段首日期 is None:
+                self._段首日期 = datetime.fromtimestamp(_时间戳(记录)).date()
+        self._文件.write(b"".join(行 for 行, _ in self._缓冲))
+        self._文件.flush()
+        # 先数据后索引：索引指向的字节一定已经在文件里
+        self._索引文件.write("\n".join(索引行) + "\n")
+        self._索引文件.flush()
+        self._缓冲.clear()
+
+    # --- 轮转 ---
+    def _需轮转(self, 下一条: dict) -> bool:
+        if not self._偏移:
+            return False
+        if self._偏移 >= self.分段大小:
+            return True
+        return (self.按日分段 and self._段首日期 is not None
+                and datetime.fromtimestamp(_时间戳(下一条)).date() != self._段首日期)
+
+    def _轮转(self):
+        self._文件.close()
+        self._索引文件.close()
+        with open(self.索引路径, "r", encoding="utf-8") as f:
+            首条时间 = datetime.fromtimestamp(json.loads(f.readline())["ts"])
+        前缀 = self.路径[:-len(".jsonl")] if self.路径.endswith(".jsonl") else self.路径
+        目标 = f"{前缀}.{首条时间.strftime('%Y%m%dT%H%M%S')}.jsonl.gz"
+        序号 = 1
+        while os.path.exists(目标):
+            目标 = f"{前缀}.{首条时间.strftime('%Y%m%dT%H%M%S')}-{序号}.jsonl.gz"
+            序号 += 1
+        with open(self.路径, "rb") as 源, gzip.open(目标 + ".tmp", "wb") as 压缩:
+            shutil.copyfileobj(源, 压缩)
+        os.replace(目标 + ".tmp", 目标)
+        os.replace(self.索引路径, 目标 + ".idx")
+        os.remove(self.路径)
+        self._打开活动段()
+
+    def 收起(self):
+        """写出缓冲后关闭活动段句柄与锁文件（空闲时释放文件描述符；下次刷盘时重新打开）"""
+        with self._锁:
+            if self._已关闭:
+                return
+            self._刷新()
+            if self._文件 is not None:
+                self._文件.close()
+                self._索引文件.close()
+                self._文件 = self._索引文件 = None
+            self.进程锁.收起()
+
+    def 关闭(self):
+        _刷盘线程.注销(self)
+        with self._锁:
+            self._刷新()
+            self._已关闭 = True
+            if self._文件 is not None:
+                self._文件.close()
+                self._索引文件.close()
+        self.进程锁.关闭()
+
+    def _到期刷新(self):
+        with self._锁:
+            if self._缓冲 and not self._已关闭 and time.monotonic() - self._上次刷新 >= self.刷新间隔:
+                self._刷新()
+
+
+def 重建索引(段路径, 索引路径):
+    """为没有索引的旧段（例如 v5.0 遗留的 audit_log.jsonl）扫描一遍生成索引"""
+    打开 = gzip.open if 段路径.endswith(".gz") else open
+    偏移 = 0
+    with 打开(段路径, "rb") as 源, open(索引路径 + ".tmp", "w", encoding="utf-8") as 索引:
+        for 行 in 源:
+            if not 行.endswith(b"\n"):
+                break
+            try:
+                记录 = json.loads(行)
+            except ValueError:
+                记录 = {}
+            索引.write(json.dumps(_索引项(记录, 偏移, len(行)), ensure_ascii=False) + "\n")
+            偏移 += len(行)
+    os.replace(索引路径 + ".tmp", 索引路径)
+
+
+class _段:
+    """一个审计段的索引（文件顺序；时间列 有序 时可二分）"""
+
+    def __init__(self, 路径):
+        self.路径 = 路径
+        self.压缩 = 路径.endswith(".gz")
+        self._重置()
+        self.刷新索引()
+
+    def _重置(self, 标识=None):
+        self.索引 = []
+        self.时间列 = []
+        self.有序 = True  # 多进程并发追加时 ts 可能乱序
+        self._已读字节 = 0
+        self._标识 = 标识
+
+    def 刷新索引(self):
+        """增量读取索引文件新增的完整行（活动段会持续增长）"""
+        索引路径 = self.路径 + ".idx"
+        if not os.path.exists(索引路径):
+            重建索引(self.路径, 索引路径)
+        try:
+            with open(索引路径, "rb") as f:
+                # 轮转后活动段路径不变但已是新文件：按索引文件的 inode 识别，索引变短同样视为新段
+                状态 = os.fstat(f.fileno())
+                if 状态.st_ino != self._标识 or 状态.st_size < self._已读字节:
+                    self._重置(状态.st_ino)
+                f.seek(self._已读字节)
+                for 行 in f:
+                    if not 行.endswith(b"\n"):
+                        break
+                    项 = json.loads(行)
+                    if self.时间列 and 项["ts"] < self.时间列[-1]:
+                        self.有序 = False
+                    self.索引.append(项)
+                    self.时间列.append(项["ts"])
+                    self._已读字节 += len(行)
+        except FileNotFoundError:  # 恰逢其他进程轮转
+            self._重置()
+
+    @property
+    def 起止(self):
+        if not self.时间列:
+            return None, None
+        return (self.时间列[0], self.时间列[-1]) if self.有序 else (min(self.时间列), max(self.时间列))
+
+    def 读取(self, 索引项列表):
+        if not 索引项列表:
+            return
+        if self.压缩:
+            # gzip 不支持随机访问：顺序解压一次，按偏移取所需记录
+            with gzip.open(self.路径, "rb") as f:
+                数据 = f.read()
+            for 项 in 索引项列表:
+                yield json.loads(数据[项["off"]:项["off"] + 项["len"]])
+            return
+        try:
+            if os.stat(self.路径 + ".idx").st_ino != self._标识:
+                return  # 刷新索引之后活动段已轮转：偏移属于旧段
+            f = open(self.路径, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as 映射:
+                for 项 in 索引项列表:
+                    yield json.loads(映射[项["off"]:项["off"] + 项["len"]])
+
+
+class BTCA审计读取器:
+    """按索引查询审计记录，不解析完整历史"""
+
+    def __init__(self, 目录, 文件名="audit_log.jsonl"):
+        self.目录 = 目录
+        self.文件名 = 文件名
+        self._段缓存 = {}
+
+    def 段列表(self) -> list:
+        """全部段，按时间先后排列（活动段在最后）"""
+        前缀 = self.文件名[:-len(".jsonl")] if self.文件名.endswith(".jsonl") else self.文件名
+        归档 = sorted(f for f in os.listdir(self.目录)
+                    if f.startswith(前缀 + ".") and f.endswith(".jsonl.gz"))
+        路径列表 = [os.path.join(self.目录, f) for f in 归档]
+        活动段 = os.path.join(self.目录, self.文件名)
+        if os.path.exists(活动段):
+            路径列表.append(活动段)
+
+        段列表 = []
+        for 路径 in 路径列表:
+            段 = self._段缓存.get(路径)
+            if 段 is None:
+                段 = self._段缓存[路径] = _段(路径)
+            elif not 段.压缩:
+                段.刷新索引()
+            段列表.append(段)
+        # 活动段轮转后旧路径已不存在，清理缓存
+        for 路径 in list(self._段缓存):
+            if 路径 not in 路径列表:
+                del self._段缓存[路径]
+        return 段列表
+
+    def 查询(self, 起始=None, 结束=None, action=None, turn_id=None):
+        """
+        起始 / 结束：datetime 或 epoch 秒（闭区间，None 表示不限）
+        action：例如 "immune_block"；普通推演轮次记为 "turn"
+        """
+        起始 = 起始.timestamp() if isinstance(起始, datetime) else 起始
+        结束 = 结束.timestamp() if isinstance(结束, datetime) else 结束
+        for 段 in self.段列表():
+            首, 末 = 段.起止
+            if 首 is None or (起始 is not None and 末 < 起始) or (结束 is not None and 首 > 结束):
+                continue
+            if 段.有序:
+                左 = bisect.bisect_left(段.时间列, 起始) if 起始 is not None else 0
+                右 = bisect.bisect_right(段.时间列, 结束) if 结束 is not None else len(段.时间列)
+                候选 = 段.索引[左:右]
+            else:
+                候选 = [项 for 项 in 段.索引
+                      if (起始 is None or 项["ts"] >= 起始) and (结束 is None or 项["ts"] <= 结束)]
+            命中 = [项 for 项 in 候选
+                  if (action is None or 项["action"] == action)
+                  and (turn_id is None or 项["turn"] == turn_id)]
+            yield from 段.读取(命中)
+
+    def 按轮次(self, turn_id: str):
+        for 记录 in self.查询(turn_id=turn_id):
+            return 记录
+        return None
@@ -0,0 +1,299 @@
+"""
+BTCA 批处理：把 JSONL 语料逐行送入完整推演流水线（免疫扫描 → 快照 → 模型 → RLT回写 → 审计）
+
+- 输入按行流式读取，每行一个 JSON 对象：{"input": "...", "id": 可选, "session": 可选}
+  （也接受 "prompt" 字段或整行 JSON 字符串）；未指定 session 的行各自独立成会话
+- 基于 BTCA异步调度器，以信号量限制并发轮次；结果逐行追加写入输出 JSONL
+- 检查点 <输出>.ckpt 记录连续完成的水位（含输入文件字节偏移）与水位之上已完成的行号；
+  中断后重新运行同一命令即从检查点续跑，检查点之后已写出的结果从输出文件补回
+- 输入本身无效的行（JSON 解析失败、缺少 input 字段）写入带 "rejected": true 的 error 记录并计入完成；
+  模型故障回复、调用异常、未走完流水线的行写入 error 记录但不计入完成，续跑时重新派发，
+  成功后输出中同一 line 会再追加一条结果
+- 能量储备低于下限、端粒耗尽或累计 token 超出预算时停止派发新轮次（进行中的轮次照常完成）
+
+用法：
+  python btca_batch.py prompts.jsonl --out results.jsonl --concurrency 8 --max-tokens 2000000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from btca_async import BTCA异步调度器
+from btca_dialogue import BTCA会话记忆
+from btca_main import BTCA存储器
+from btca_ratelimit import BTCA限流器
+from btca_respcache import BTCA回复缓存
+
+# 输出中保留的审计字段（完整审计仍写入存储器的审计日志）
+审计摘要字段 = ("turn_id", "status", "immune_scan", "tokens_used", "prompt_tokens", "cached_tokens",
+          "energy_cost", "telomere_after", "writeback_proposals", "writeback_committed",
+          "cycle_detected", "response_cache", "latency_saved_ms", "phase_ms")
+
+
+class BTCA批处理:
+    """JSONL 输入 → 并发推演 → JSONL 输出（可中断续跑）"""
+
+    def __init__(self, 引擎: BTCA异步调度器, 输入路径, 输出路径, 并发=8, token预算=None,
+                 能量下限=0.0, 检查点间隔=20):
+        """
+        token预算：本批次（含此前中断的各次运行）累计 tokens_used 的上限；None 表示不限
+        能量下限：能量储备不高于该值时停止派发
+        检查点间隔：每完成多少行写一次检查点（结束时总会再写一次）
+        """
+        self.引擎 = 引擎
+        self.输入路径 = 输入路径
+        self.输出路径 = 输出路径
+        self.检查点路径 = 输出路径 + ".ckpt"
+        self.并发 = 并发
+        self.token预算 = token预算
+        self.能量下限 = 能量下限
+        self.检查点间隔 = 检查点间隔
+
+        self.水位 = 0            # 此行之前的所有行均已完成
+        self._已完成 = set()     # 水位之上已完成的行号
+        self._行偏移 = {}        # 已读入、尚在水位之上的行号 → 字节偏移
+        self._读取行号 = 0       # 下一个待读入的行号及其字节偏移
+        self._读取位置 = 0
+        self.tokens累计 = 0
+        self.完成数 = 0
+        self.失败数 = 0
+        self.停止原因 = None
+        self._未落检查点 = 0
+
+    # --- 检查点 ---
+    def _恢复(self):
+        """读检查点，再从输出文件补回检查点之后写出的结果；截掉中断时写了一半的末行"""
+        输出起点 = 0
+        if os.path.exists(self.检查点路径):
+            with open(self.检查点路径, encoding="utf-8") as f:
+                检查点 = json.load(f)
+            if 检查点.get("input") != os.path.abspath(self.输入路径):
+                raise ValueError(f"检查点属于另一个输入文件：{检查点.get('input')}")
+            self.水位 = 检查点["next_line"]
+            self._读取行号, self._读取位置 = 检查点["input_line"], 检查点["input_offset"]
+            self._已完成 = set(检查点["done"])
+            self.tokens累计 = 检查点["tokens"]
+            输出起点 = 检查点["output_size"]
+        if not os.path.exists(self.输出路径):
+            return
+        with open(self.输出路径, "rb+") as f:
+            f.seek(输出起点)
+            有效末尾 = 输出起点
+            for 行 in f:
+                try:
+                    记录 = json.loads(行)
+                except ValueError:
+                    break
+                if not 行.endswith(b"\n"):
+                    break
+                有效末尾 += len(行)
+                if 记录["line"] >= self.水位:
+                    if "error" not in 记录 or 记录.get("rejected"):
+                        self._已完成.add(记录["line"])
+                    self.tokens累计 += (记录.get("audit") or {}).get("tokens_used") or 0
+            f.truncate(有效末尾)
+        while self.水位 in self._已完成:
+            self._已完成.remove(self.水位)
+            self.水位 += 1
+
+    def _写检查点(self, 输出):
+        输出.flush()
+        os.fsync(输出.fileno())
+        # 续跑时从该位置起读；它不晚于水位所在行（水位所在行尚未读入时取当前读取位置）
+        if self.水位 in self._行偏移:
+            起读行号, 起读偏移 = self.水位, self._行偏移[self.水位]
+        else:
+            起读行号, 起读偏移 = self._读取行号, self._读取位置
+        检查点 = {
+            "input": os.path.abspath(self.输入路径),
+            "next_line": self.水位,
+            "input_line": 起读行号,
+            "input_offset": 起读偏移,
+            "done": sorted(self._已完成),
+            "tokens": self.tokens累计,
+            "output_size": 输出.tell(),
+        }
+        临时 = self.检查点路径 + ".tmp"
+        with open(临时, "w", encoding="utf-8") as f:
+            json.dump(检查点, f)
+        os.replace(临时, self.检查点路径)
+        self._未落检查点 = 0
+
+    def _标记完成(self, 行号):
+        self._已完成.add(行号)
+        while self.水位 in self._已完成:
+            self._已完成.remove(self.水位)
+            self._行偏移.pop(self.水位, None)
+            self.水位 += 1
+
+    # --- 输入 ---
+    def _读取(self):
+        """从检查点位置起逐行产出 (行号, 条目或None, 解析错误或None)；跳过已完成的行"""
+        with open(self.输入路径, "rb") as f:
+            f.seek(self._读取位置)
+            for 原始 in iter(f.readline, b""):
+                行号, 偏移 = self._读取行号, self._读取位置
+                self._读取行号, self._读取位置 = 行号 + 1, 偏移 + len(原始)
+                if 行号 >= self.水位 and 行号 not in self._已完成:
+                    self._行偏移[行号] = 偏移
+                    条目, 错误 = None, None
+                    if 原始.strip():
+                        try:
+                            条目 = json.loads(原始)
+                            if isinstance(条目, str):
+                                条目 = {"input": 条目}
+                            elif not (条目.get("input") or 条目.get("prompt")):
+                                错误 = "缺少 input 字段"
+                        except (ValueError, AttributeError) as e:
+                            错误 = f"JSON 解析失败：{e}"
+                    yield 行号, 条目, 错误
+
+    # --- 停止条件 ---
+    def _应停止(self):
+        状态 = self.引擎.存储.状态
+        if 状态["能量储备"] <= self.能量下限:
+            return "energy_exhausted"
+        if self.引擎.存储.端粒状态() == "TERMINATED":
+            return "telomere_terminated"
+        if self.token预算 is not None and self.tokens累计 >= self.token预算:
+            return "token_budget"
+        return None
+
+    # --- 运行 ---
+    async def _一轮(self, 行号, 条目):
+        会话ID = 条目.get("session") or f"batch-{行号}"
+        try:
+            回复, 审计 = await self.引擎.运行推演周期(条目.get("input") or 条目["prompt"], 会话ID)
+            摘要 = {k: 审计[k] for k in 审计摘要字段 if k in 审计}
+            # 模型调用失败（故障回复）或未走完流水线（无 tokens_used，如端粒已耗尽）都算失败；免疫拦截是确定结果
+            if 回复.startswith("【内核故障】") or ("tokens_used" not in 审计 and 审计.get("status") != "immune_block"):
+                return {"error": 回复, "audit": 摘要}
+            return {"reply": 回复, "audit": 摘要}
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            if not 条目.get("session"):
+                self.引擎.结束会话(会话ID)
+
+    def _落盘(self, 输出, 行号, 条目, 结果):
+        记录 = {"line": 行号}
+        if 条目 is not None and "id" in 条目:
+            记录["id"] = 条目["id"]
+        记录.update(结果)
+        输出.write((json.dumps(记录, ensure_ascii=False) + "\n").encode("utf-8"))
+        输出.flush()
+
+        self.tokens累计 += (结果.get("audit") or {}).get("tokens_used") or 0
+        if (结果.get("audit") or {}).get("status") == "terminated":
+            self.停止原因 = self.停止原因 or "telomere_terminated"
+        if "error" in 结果:
+            self.失败数 += 1
+        else:
+            self.完成数 += 1
+        # 模型 / 传输失败的行不进检查点：水位停在它之前，续跑时重新派发；无效输入重跑也不会成功，照常计入完成
+        if "error" not in 结果 or 结果.get("rejected"):
+            self._标记完成(行号)
+        self._未落检查点 += 1
+        if self._未落检查点 >= self.检查点间隔:
+            self._写检查点(输出)
+
+    async def 运行(self) -> dict:
+        """跑完（或因预算停止）后返回统计"""
+        self._恢复()
+        开始 = time.perf_counter()
+        名额 = asyncio.Semaphore(self.并发)
+        进行中 = set()
+
+        with open(self.输出路径, "ab") as 输出:
+            async def 执行(行号, 条目):
+                try:
+                    self._落盘(输出, 行号, 条目, await self._一轮(行号, 条目))
+                finally:
+                    名额.release()
+
+            for 行号, 条目, 错误 in self._读取():
+                if 错误 is None and 条目 is None:  # 空行
+                    self._标记完成(行号)
+                    continue
+                if 错误 is not None:
+                    self._落盘(输出, 行号, None, {"error": 错误, "rejected": True})
+                    continue
+                await 名额.acquire()
+                self.停止原因 = self.停止原因 or self._应停止()
+                if self.停止原因:
+                    名额.release()
+                    break
+                任务 = asyncio.create_task(执行(行号, 条目))
+                进行中.add(任务)
+                任务.add_done_callback(进行中.discard)
+
+            if 进行中:
+                await asyncio.gather(*进行中)
+            self._写检查点(输出)
+
+        return {
+            "completed": self.完成数,
+            "failed": self.失败数,
+            "next_line": self.水位,
+            "pending_above_watermark": len(self._已完成),
+            "tokens": self.tokens累计,
+            "energy_reserve": self.引擎.存储.状态["能量储备"],
+            "stopped": self.停止原因,
+            "response_cache": self.引擎.回复缓存.统计() if self.引擎.回复缓存 is not None else None,
+            "seconds": round(time.perf_counter() - 开始, 3),
+        }
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="BTCA 批处理（JSONL 语料 → 推演流水线）")
+    解析器.add_argument("input", help="输入 JSONL，每行 {\"input\": ..., \"id\": ..., \"session\": ...}")
+    解析器.add_argument("--out", help="输出 JSONL（默认 <输入>.out.jsonl）；检查点为 <输出>.ckpt")
+    解析器.add_argument("--concurrency", type=int, default=8)
+    解析器.add_argument("--max-tokens", type=int, help="本批次累计 token 预算")
+    解析器.add_argument("--min-energy", type=float, default=0.0, help="能量储备不高于该值时停止")
+    解析器.add_argument("--rpm", type=float, help="每分钟请求数上限（默认读 BTCA_RPM）")
+    解析器.add_argument("--tpm", type=float, help="每分钟 token 数上限（默认读 BTCA_TPM）")
+    解析器.add_argument("--history-turns", type=int, default=0,
+                     help="同一 session 的行带上最近若干轮对话（原文 + 滚动摘要），0 为各行独立")
+    解析器.add_argument("--history-tokens", type=int, default=1500, help="对话上文的 token 上限")
+    解析器.add_argument("--response-cache", action="store_true", help="重复 / 近似输入复用已有回复")
+    解析器.add_argument("--cache-threshold", type=float, default=0.95, help="回复缓存语义命中的余弦相似度阈值")
+    解析器.add_argument("--cache-billing", choices=("full", "telomere", "none"), default="telomere",
+                     help="缓存命中时的计费：full=端粒+代谢，telomere=仅端粒，none=均不计")
+    解析器.add_argument("--checkpoint-every", type=int, default=20)
+    解析器.add_argument("--data-dir", default="./btca_memory")
+    解析器.add_argument("--restart", action="store_true", help="丢弃已有输出与检查点，从头开始")
+    参数 = 解析器.parse_args()
+
+    输出路径 = 参数.out or os.path.splitext(参数.input)[0] + ".out.jsonl"
+    if 参数.restart:
+        for 路径 in (输出路径, 输出路径 + ".ckpt"):
+            if os.path.exists(路径):
+                os.remove(路径)
+
+    try:
+        存储 = BTCA存储器(参数.data_dir)
+        回复缓存 = BTCA回复缓存(存储.嵌入服务, 相似度阈值=参数.cache_threshold,
+                        命中计费=参数.cache_billing) if 参数.response_cache else None
+        记忆工厂 = (lambda: BTCA会话记忆(参数.history_turns, 参数.history_tokens)) if 参数.history_turns > 0 else None
+        引擎 = BTCA异步调度器(os.environ.get("OPENAI_API_KEY", ""), 存储=存储, 回复缓存=回复缓存, 记忆工厂=记忆工厂,
+                       限流器=BTCA限流器.从环境变量(RPM=参数.rpm, TPM=参数.tpm, 最大并发=参数.concurrency))
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    批处理 = BTCA批处理(引擎, 参数.input, 输出路径, 参数.concurrency, 参数.max_tokens,
+                  参数.min_energy, 参数.checkpoint_every)
+    try:
+        统计 = asyncio.run(批处理.运行())
+    finally:
+        引擎.存储.关闭()
+    print(json.dumps(统计, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+"""
+BTCA 性能基准
+
+用法：
+  python btca_bench.py matcher      # 免疫扫描：逐关键词子串搜索 vs 模式自动机
+  python btca_bench.py async        # 异步编排器：桩模型下多会话并发吞吐
+  python btca_bench.py retrieval    # 检索DMA：有/无检索缓存的延迟
+  python btca_bench.py loop         # 循环检测器：2000轮生命周期的内存与耗时
+  python btca_bench.py history      # 会话记忆：2000轮生命周期中随请求发送的上文 token 数
+  python btca_bench.py pipeline     # 全流程：本地仿真模型服务下 引擎API / CLI 的分阶段延迟
+                                    # （加 --hash-embedding 用内容哈希向量代替嵌入模型，可完全离线运行）
+  python btca_bench.py startup      # 冷启动：导入 / 构造引擎 / 首轮耗时（每次全新子进程）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+
+from btca_matcher import BTCA模式自动机
+
+
+def _计时(函数, 次数):
+    """返回单次调用平均耗时（毫秒）"""
+    开始 = time.perf_counter()
+    for _ in range(次数):
+        函数()
+    return (time.perf_counter() - 开始) * 1000 / 次数
+
+
+def _随机关键词(rng, 长度):
+    字表 = string.ascii_lowercase + "免疫指令系统提示角色信念循环忽略假装相信承认"
+    return "".join(rng.choice(字表) for _ in range(长度))
+
+
+# ============================================================
+# matcher: 免疫扫描
+# ============================================================
+def bench_matcher(参数):
+    rng = random.Random(参数.seed)
+    输入文本 = _随机关键词(rng, 参数.input_len)
+    print(f"{'抗体数':>8} {'关键词数':>8} {'逐词子串(ms)':>14} {'自动机(ms)':>12} {'编译(ms)':>10}")
+    for 规模 in 参数.sizes:
+        抗体库 = [
+            {"id": f"AB_{i:06d}", "keywords": [_随机关键词(rng, rng.randint(4, 10)) for _ in range(3)]}
+            for i in range(规模)
+        ]
+
+        def 逐词扫描():
+            文本 = 输入文本.lower()
+            return [抗体["id"] for 抗体 in 抗体库 if any(kw.lower() in 文本 for kw in 抗体["keywords"])]
+
+        编译开始 = time.perf_counter()
+        自动机 = BTCA模式自动机()
+        for 抗体 in 抗体库:
+            自动机.添加(抗体["id"], 抗体["keywords"])
+        自动机.扫描("")
+        编译耗时 = (time.perf_counter() - 编译开始) * 1000
+
+        assert 逐词扫描() == 自动机.扫描(输入文本)
+        朴素 = _计时(逐词扫描, 参数.repeat)
+        编译版 = _计时(lambda: 自动机.扫描(输入文本), 参数.repeat)
+        print(f"{规模:>8} {规模 * 3:>8} {朴素:>14.3f} {编译版:>12.3f} {编译耗时:>10.1f}")
+
+
+# ============================================================
+# async: 异步编排器吞吐（桩模型，不产生真实API调用）
+# ============================================================
+_桩回复 = "推演正文……\n:DMA_Writeback \"桩模型生成的回写洞察，用于基准测试\"\n结论：我绝不去做无结构的推演。"
+
+
+def _桩响应(tokens):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=_桩回复))],
+        usage=SimpleNamespace(total_tokens=tokens, prompt_tokens=tokens - 50, completion_tokens=50),
+    )
+
+
+class _异步桩模型:
+    """模拟 AsyncOpenAI：固定延迟后返回固定回复"""
+
+    def __init__(self, 延迟, tokens=800):
+        async def create(**_):
+            await asyncio.sleep(延迟)
+            return _桩响应(tokens)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+def bench_async(参数):
+    from btca_async import BTCA异步调度器
+    from btca_main import BTCA存储器
+
+    async def 跑(并发会话数):
+        存储 = BTCA存储器(tempfile.mkdtemp(prefix="btca_bench_"))
+        引擎 = BTCA异步调度器("", 存储=存储, 客户端=_异步桩模型(参数.latency))
+
+        async def 会话(编号):
+            for 轮 in range(参数.turns):
+                await 引擎.运行推演周期(f"会话{编号}的第{轮}个问题", 会话ID=f"S{编号}")
+
+        开始 = time.perf_counter()
+        await asyncio.gather(*(会话(i) for i in range(并发会话数)))
+        耗时 = time.perf_counter() - 开始
+        总轮次 = 并发会话数 * 参数.turns
+        assert 存储.状态["总轮次"] == 总轮次
+        return 总轮次, 耗时
+
+    print(f"桩模型延迟 {参数.latency * 1000:.0f}ms，每会话 {参数.turns} 轮")
+    print(f"{'并发会话':>8} {'总轮次':>8} {'耗时(s)':>10} {'吞吐(轮/s)':>12}")
+    for n in 参数.sessions:
+        总轮次, 耗时 = asyncio.run(跑(n))
+        print(f"{n:>8} {总轮次:>8} {耗时:>10.2f} {总轮次 / 耗时:>12.1f}")
+
+
+# ============================================================
+# retrieval: 检索缓存
+# ============================================================
+def bench_retrieval(参数):
+    from btca_main import BTCA存储器
+
+    rng = random.Random(参数.seed)
+    问题池 = [f"关于{_随机关键词(rng, 6)}的推演问题" for _ in range(参数.distinct)]
+    查询序列 = [rng.choice(问题池) for _ in range(参数.queries)]
+    语料 = [f"DMA片段{i}：{_随机关键词(rng, 40)}" for i in range(参数.docs)]
+
+    print(f"DMA {参数.docs} 条，查询 {参数.queries} 次（{参数.distinct} 个不同问题）")
+    print(f"{'检索缓存':>8} {'平均(ms)':>10} {'p50(ms)':>10} {'p99(ms)':>10} {'命中率':>8}")
+    for 容量 in (0, 参数.capacity):
+        存储 = BTCA存储器(tempfile.mkdtemp(prefix="btca_bench_"), 检索缓存容量=容量)
+        for i in range(0, len(语料), 100):
+            存储.注入基因(语料[i:i + 100])
+        耗时 = []
+        for 查询 in 查询序列:
+            开始 = time.perf_counter()
+            存储.检索DMA(查询)
+            耗时.append((time.perf_counter() - 开始) * 1000)
+        耗时.sort()
+        统计 = 存储.检索缓存.统计()
+        print(f"{容量 or '关闭':>8} {sum(耗时) / len(耗时):>10.3f} {耗时[len(耗时) // 2]:>10.3f} "
+              f"{耗时[int(len(耗时) * 0.99)]:>10.3f} {统计['hit_rate']:>8.1%}")
+
+
+# ============================================================
+# loop: 循环检测器
+# ============================================================
+class _字符集循环检测器:
+    """v5.0 原实现（无界列表 + 字符集合 Jaccard），仅作对照"""
+
+    def __init__(self, 窗口大小=5, 重复阈值=0.8):
+        self.历史结论 = []
+        self.窗口大小 = 窗口大小
+        self.重复阈值 = 重复阈值
+
+    def 检测(self, 当前结论):
+        self.历史结论.append(当前结论)
+        if len(self.历史结论) < 3:
+            return {"is_cycle": False}
+        for 历史 in self.历史结论[-self.窗口大小 - 1:-1]:
+            a, b = set(当前结论), set(历史)
+            if len(a & b) / max(len(a | b), 1) > self.重复阈值:
+                return {"is_cycle": True}
+        return {"is_cycle": False}
+
+
+def bench_loop(参数):
+    from btca_main import BTCA循环检测器
+
+    rng = random.Random(参数.seed)
+    常用字 = "的是不了在人有我他这个们中来上大为和国地到以说时要就出会可也你对生能而子那得于着下自之年过发后作里"
+    结论序列 = [f"结论：{''.join(rng.choice(常用字) for _ in range(rng.randint(40, 120)))}。"
+            for _ in range(参数.turns)]
+
+    print(f"合成生命周期 {参数.turns} 轮（结论均为常用汉字随机组合，不应判为循环）")
+    print(f"{'检测器':<10} {'轮次':>6} {'内存(KB)':>10} {'单次(μs)':>10} {'误报':>6}")
+    for 名称, 类 in (("字符集", _字符集循环检测器), ("MinHash", BTCA循环检测器)):
+        # 第一遍计时（tracemalloc 会拖慢分配，单独测内存）
+        检测器 = 类()
+        检查点耗时 = {}
+        开始 = time.perf_counter()
+        for 轮, 结论 in enumerate(结论序列, 1):
+            检测器.检测(结论)
+            if 轮 % (参数.turns // 4) == 0:
+                检查点耗时[轮] = (time.perf_counter() - 开始) * 1e6 / 轮
+
+        tracemalloc.start()
+        检测器 = 类()
+        误报 = 0
+        for 轮, 结论 in enumerate(结论序列, 1):
+            误报 += 检测器.检测(结论)["is_cycle"]
+            if 轮 in 检查点耗时:
+                当前, _ = tracemalloc.get_traced_memory()
+                print(f"{名称:<10} {轮:>6} {当前 / 1024:>10.1f} {检查点耗时[轮]:>10.1f} {误报:>6}")
+        tracemalloc.stop()
+
+
+# ============================================================
+# history: 会话记忆（全量历史 vs 原文窗口 + 滚动摘要）
+# ============================================================
+def bench_history(参数):
+    from btca_dialogue import BTCA会话记忆
+    from btca_packer import 估算tokens
+
+    rng = random.Random(参数.seed)
+    常用字 = "的是不了在人有我他这个们中来上大为和国地到以说时要就出会可也你对生能而子那得于着下自之年过发后作里"
+
+    def 句子(最短, 最长):
+        return "".join(rng.choice(常用字) for _ in range(rng.randint(最短, 最长))) + "。"
+
+    记忆 = BTCA会话记忆(参数.keep, 参数.budget)
+    全量 = 0
+    耗时 = 0.0
+    print(f"合成生命周期 {参数.turns} 轮（保留 {参数.keep} 轮原文，上文预算 {参数.budget} tokens）")
+    print(f"{'轮次':>6} {'全量历史tokens':>14} {'原文+摘要tokens':>16} {'已折叠轮数':>10} {'单次追加(μs)':>12}")
+    for 轮 in range(1, 参数.turns + 1):
+        用户输入 = 句子(10, 80)
+        回复 = "\n".join(句子(30, 120) for _ in range(rng.randint(2, 6))) + f"\n结论：{句子(10, 40)}"
+        全量 += 估算tokens(用户输入) + 估算tokens(回复)
+        开始 = time.perf_counter()
+        记忆.追加(用户输入, 回复)
+        耗时 += time.perf_counter() - 开始
+        if 轮 % (参数.turns // 8 or 1) == 0 or 轮 in (1, 参数.keep):
+            print(f"{轮:>6} {全量:>14} {记忆.tokens:>16} {记忆.折叠轮数:>10} {耗时 * 1e6 / 轮:>12.1f}")
+
+
+# ============================================================
+# pipeline: 全流程分阶段延迟（本地仿真模型服务，不产生真实API调用）
+# ============================================================
+def _分位数(样本: list) -> dict:
+    有序 = sorted(样本)
+
+    def p(q):
+        return round(有序[min(int(len(有序) * q), len(有序) - 1)], 3)
+
+    return {"count": len(有序), "mean": round(sum(有序) / len(有序), 3),
+            "p50": p(0.50), "p90": p(0.90), "p99": p(0.99), "max": round(有序[-1], 3)}
+
+
+def _当前RSS() -> float:
+    """当前进程常驻内存（MB）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _长寿数据目录(目录=None) -> str:
+    """预置端粒 / 能量充足的初始状态，保证数千轮内不会触发生命周期终止"""
+    from btca_main import BTCA存储器
+
+    目录 = 目录 or tempfile.mkdtemp(prefix="btca_bench_")
+    os.makedirs(目录, exist_ok=True)
+    状态 = BTCA存储器._初始状态()
+    状态.update(端粒剩余=1e6, 端粒最大值=1e6, 能量储备=1e12)
+    with open(os.path.join(目录, "btca_state.json"), "w", encoding="utf-8") as f:
+        json.dump(状态, f, ensure_ascii=False)
+    return 目录
+
+
+def 哈希嵌入(文本列表, 维度=384):
+    """按内容哈希取种子的确定性向量（维度同默认的 MiniLM）：不加载嵌入模型，跨进程、跨次运行稳定"""
+    import numpy as np
+    from btca_embedding import 内容哈希
+
+    return [np.random.default_rng(int(内容哈希(t)[:8], 16)).standard_normal(维度).astype(np.float32)
+            for t in 文本列表]
+
+
+# CLI 子进程的入口：先把嵌入服务的模型换成 哈希嵌入，再照常运行 btca_main.py
+_哈希嵌入启动 = """
+import runpy, sys
+sys.path.insert(0, sys.argv[1])
+import btca_bench, btca_embedding
+btca_embedding.BTCA嵌入服务._模型 = lambda self: btca_bench.哈希嵌入
+sys.argv = sys.argv[2:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def _问题序列(参数) -> list:
+    rng = random.Random(参数.seed)
+    return [f"第{i}轮：关于{_随机关键词(rng, 8)}的推演问题" for i in range(参数.turns)]
+
+
+def _跑引擎API(参数, 服务, 流式):
+    from openai import OpenAI
+    from btca_embedding import BTCA嵌入服务
+    from btca_main import BTCA存储器, BTCA调度器
+
+    目录 = _长寿数据目录()
+    嵌入服务 = BTCA嵌入服务(os.path.join(目录, "embedding_cache"), 嵌入函数=哈希嵌入) if 参数.hash_embedding else None
+    存储 = BTCA存储器(目录, 嵌入服务=嵌入服务)
+    引擎 = BTCA调度器("", 存储=存储, 客户端=OpenAI(api_key="sk-bench", base_url=服务.base_url))
+    问题 = _问题序列(参数)
+
+    def 一轮(输入):
+        if 流式:
+            回合 = 引擎.运行推演周期_流式(输入)
+            list(回合)
+            return 回合.审计
+        return 引擎.运行推演周期(输入)[1]
+
+    for 输入 in 问题[:参数.warmup]:
+        一轮(输入)
+
+    # 分阶段耗时直接取自引擎写入审计的 phase_ms
+    样本 = defaultdict(list)
+    开始 = time.perf_counter()
+    for 输入 in 问题:
+        轮开始 = time.perf_counter()
+        审计 = 一轮(输入)
+        样本["turn"].append((time.perf_counter() - 轮开始) * 1000)
+        for 阶段, 毫秒 in 审计.get("phase_ms", {}).items():
+            样本[阶段].append(毫秒)
+    耗时 = time.perf_counter() - 开始
+    存储.关闭()
+    return {"turns": len(问题), "wall_s": round(耗时, 3), "throughput": round(len(问题) / 耗时, 2),
+            "rss_mb": round(_当前RSS(), 1), "dma_docs": 存储.集合.count(),
+            "phases": {阶段: _分位数(v) for 阶段, v in 样本.items()}}
+
+
+def _跑CLI(参数, 服务, 流式):
+    """以子进程运行 btca_main.py，通过 stdin 喂入全部问题；只能测端到端吞吐与子进程内存"""
+    from btca_journal import BTCA状态日志
+
+    # CLI 固定使用相对路径 ./btca_memory
+    工作目录 = tempfile.mkdtemp(prefix="btca_bench_cli_")
+    目录 = _长寿数据目录(os.path.join(工作目录, "btca_memory"))
+    环境 = dict(os.environ, OPENAI_BASE_URL=服务.base_url, OPENAI_API_KEY="sk-bench")
+    代码目录 = os.path.dirname(os.path.abspath(__file__))
+    命令 = [sys.executable, os.path.join(代码目录, "btca_main.py")]
+    if 参数.hash_embedding:
+        命令[1:1] = ["-c", _哈希嵌入启动, 代码目录]
+    if not 流式:
+        命令.append("--no-stream")
+    输入 = "\n".join(_问题序列(参数) + ["exit"]) + "\n"
+
+    开始 = time.perf_counter()
+    结果 = subprocess.run(命令, input=输入, text=True, cwd=工作目录, env=环境,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    耗时 = time.perf_counter() - 开始
+    if 结果.returncode:
+        raise RuntimeError(f"CLI 退出码 {结果.returncode}：{结果.stderr[-2000:]}")
+    完成轮次 = BTCA状态日志(os.path.join(目录, "btca_state.json")).加载()["总轮次"]
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    except ImportError:
+        rss = None
+    return {"turns": 完成轮次, "wall_s": round(耗时, 3), "throughput": round(完成轮次 / 耗时, 2),
+            "rss_mb": round(rss, 1) if rss else None, "phases": {}}
+
+
+def bench_pipeline(参数):
+    from btca_fakeserver import BTCA仿真模型服务
+
+    路径表 = {
+        "api": lambda 服务: _跑引擎API(参数, 服务, 流式=False),
+        "api-stream": lambda 服务: _跑引擎API(参数, 服务, 流式=True),
+        "cli": lambda 服务: _跑CLI(参数, 服务, 流式=False),
+        "cli-stream": lambda 服务: _跑CLI(参数, 服务, 流式=True),
+    }
+    报告 = {"timestamp": datetime.now().isoformat(), "python": sys.version.split()[0],
+          "config": {k: v for k, v in vars(参数).items() if k != "func"}, "results": {}}
+
+    print(f"仿真模型延迟 {参数.latency * 1000:.0f}ms，每条路径 {参数.turns} 轮，回写比例 {参数.writeback_ratio}")
+    for 路径 in 参数.paths:
+        with BTCA仿真模型服务(延迟=参数.latency, 回复tokens=参数.completion_tokens,
+                        回写比例=参数.writeback_ratio, 块间隔=参数.chunk_interval) as 服务:
+            结果 = 报告["results"][路径] = 路径表[路径](服务)
+        print(f"\n[{路径}] {结果['turns']} 轮  {结果['wall_s']:.1f}s  {结果['throughput']:.1f} 轮/s  "
+              f"RSS {结果['rss_mb']} MB")
+        if 结果["phases"]:
+            print(f"  {'阶段':<16} {'次数':>6} {'平均':>9} {'p50':>9} {'p90':>9} {'p99':>9}  (ms)")
+            for 名称, 统计 in 结果["phases"].items():
+                print(f"  {名称:<16} {统计['count']:>6} {统计['mean']:>9.3f} {统计['p50']:>9.3f} "
+                      f"{统计['p90']:>9.3f} {统计['p99']:>9.3f}")
+
+    with open(参数.out, "w", encoding="utf-8") as f:
+        json.dump(报告, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {参数.out}")
+    if 参数.baseline:
+        _对比基线(报告, 参数.baseline)
+
+
+def _对比基线(报告, 基线文件):
+    """与上一次结果对比吞吐与各阶段 p50 / p99（正数表示变慢）"""
+    with open(基线文件, "r", encoding="utf-8") as f:
+        基线 = json.load(f)["results"]
+    print(f"\n与基线 {基线文件} 对比：")
+    for 路径, 结果 in 报告["results"].items():
+        旧 = 基线.get(路径)
+        if not 旧:
+            continue
+        print(f"  [{路径}] 吞吐 {旧['throughput']:.1f} → {结果['throughput']:.1f} 轮/s "
+              f"({(结果['throughput'] / 旧['throughput'] - 1):+.1%})")
+        for 名称, 统计 in 结果["phases"].items():
+            旧统计 = 旧["phases"].get(名称)
+            if 旧统计 and 旧统计["p50"] and 旧统计["p99"]:
+                print(f"    {名称:<16} p50 {(统计['p50'] / 旧统计['p50'] - 1):+8.1%}   "
+                      f"p99 {(统计['p99'] / 旧统计['p99'] - 1):+8.1%}")
+
+
+# ============================================================
+# startup: 冷启动耗时（每次测量都是全新的子进程）
+# ============================================================
+_启动探针 = r'''
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+结果 = {}
+def 记(名称, 起点):
+    结果[名称] = round((time.perf_counter() - 起点) * 1000, 1)
+    return time.perf_counter()
+t = time.perf_counter()
+import btca_main
+t = 记("import_btca_main", t)
+import btca_tenant, btca_analytics
+t = 记("import_gui_deps", t)
+引擎 = btca_main.BTCA调度器("sk-bench", 存储=btca_main.BTCA存储器(sys.argv[2]))
+t = 记("construct", t)
+结果["ready"] = round((t - t0) * 1000, 1)
+if sys.argv[3] != "0":
+    线程 = 引擎.预热()
+    time.sleep(float(sys.argv[3]))   # 模拟用户输入第一句话的时间
+    线程.join()
+t = time.perf_counter()
+引擎.运行推演周期("第一个问题")
+t = 记("first_turn", t)
+引擎.运行推演周期("第二个问题")
+记("second_turn", t)
+结果["heavy_modules"] = sorted(m for m in ("chromadb", "openai", "pandas", "onnxruntime") if m in sys.modules)
+print(json.dumps(结果))
+'''
+
+
+def bench_startup(参数):
+    from btca_fakeserver import BTCA仿真模型服务
+
+    仓库目录 = os.path.dirname(os.path.abspath(__file__))
+    报告 = {"timestamp": datetime.now().isoformat(), "python": sys.version.split()[0],
+          "config": {k: v for k, v in vars(参数).items() if k != "func"}, "results": {}}
+    with BTCA仿真模型服务() as 服务:
+        环境 = dict(os.environ, OPENAI_BASE_URL=服务.base_url, OPENAI_API_KEY="sk-bench")
+        for 模式, 等待 in (("cold", 0), ("warmup", 参数.think)):
+            样本 = defaultdict(list)
+            for _ in range(参数.repeat):
+                输出 = subprocess.run(
+                    [sys.executable, "-c", _启动探针, 仓库目录, tempfile.mkdtemp(prefix="btca_bench_"), str(等待)],
+                    env=环境, capture_output=True, text=True, check=True).stdout
+                for 名称, 值 in json.loads(输出.strip().splitlines()[-1]).items():
+                    样本[名称].append(值)
+            结果 = 报告["results"][模式] = {
+                名称: sorted(v)[len(v) // 2] for 名称, v in 样本.items() if 名称 != "heavy_modules"}
+            结果["heavy_modules_after_turns"] = 样本["heavy_modules"][0]
+
+    print(f"每种模式 {参数.repeat} 个全新子进程，取中位数（ms）；warmup 模式在首轮前后台预热并等待 {参数.think}s")
+    列 = ("import_btca_main", "import_gui_deps", "construct", "ready", "first_turn", "second_turn")
+    print(f"{'模式':<8}" + "".join(f"{c:>18}" for c in 列))
+    for 模式, 结果 in 报告["results"].items():
+        print(f"{模式:<8}" + "".join(f"{结果[c]:>18.1f}" for c in 列))
+
+    with open(参数.out, "w", encoding="utf-8") as f:
+        json.dump(报告, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {参数.out}")
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="BTCA 性能基准")
+    子命令 = 解析器.add_subparsers(dest="command", required=True)
+
+    p = 子命令.add_parser("matcher", help="免疫扫描耗时 vs 抗体库规模")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000, 20000])
+    p.add_argument("--input-len", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_matcher)
+
+    p = 子命令.add_parser("async", help="异步编排器并发吞吐（桩模型）")
+    p.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16, 64])
+    p.add_argument("--turns", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.5, help="桩模型单次调用延迟（秒）")
+    p.set_defaults(func=bench_async)
+
+    p = 子命令.add_parser("retrieval", help="检索DMA 有/无检索缓存的延迟")
+    p.add_argument("--docs", type=int, default=2000)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--distinct", type=int, default=50, help="查询序列中不同问题的个数")
+    p.add_argument("--capacity", type=int, default=512)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_retrieval)
+
+    p = 子命令.add_parser("loop", help="循环检测器内存与耗时（合成长生命周期）")
+    p.add_argument("--turns", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_loop)
+
+    p = 子命令.add_parser("history", help="会话记忆上文 token 数（合成长生命周期）")
+    p.add_argument("--turns", type=int, default=2000)
+    p.add_argument("--keep", type=int, default=4, help="保留的原文轮数")
+    p.add_argument("--budget", type=int, default=1500, help="上文 token 预算")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_history)
+
+    p = 子命令.add_parser("pipeline", help="全流程分阶段延迟 / 吞吐 / 内存（本地仿真模型服务）")
+    p.add_argument("--paths", nargs="+", default=["api", "api-stream", "cli"],
+                   choices=["api", "api-stream", "cli", "cli-stream"])
+    p.add_argument("--turns", type=int, default=2000)
+    p.add_argument("--warmup", type=int, default=20, help="计时前的预热轮次（引擎API路径）")
+    p.add_argument("--latency", type=float, default=0.0, help="仿真模型响应延迟（秒）")
+    p.add_argument("--chunk-interval", type=float, default=0.0, help="流式块间隔（秒）")
+    p.add_argument("--completion-tokens", type=int, default=300)
+    p.add_argument("--writeback-ratio", type=float, default=0.3)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default="btca_bench_pipeline.json", help="结果 JSON 文件")
+    p.add_argument("--baseline", help="上一次的结果 JSON，用于对比回归")
+    p.add_argument("--hash-embedding", action="store_true",
+                   help="用确定性的内容哈希向量代替嵌入模型（离线运行；嵌入耗时不计入结果）")
+    p.set_defaults(func=bench_pipeline)
+
+    p = 子命令.add_parser("startup", help="冷启动：导入 / 构造引擎 / 首轮耗时")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--think", type=float, default=2.0, help="warmup 模式下首轮前的等待（秒）")
+    p.add_argument("--out", default="btca_bench_startup.json", help="结果 JSON 文件")
+    p.set_defaults(func=bench_startup)
+
+    参数 = 解析器.parse_args()
+    参数.func(参数)
+
+
+if __name__ == "__main__":
+    main()
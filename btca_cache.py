@@ -0,0 +1,95 @@
+"""
+BTCA M08 附属：DMA 检索缓存
+
+键 = (规范化查询文本的哈希, DMA版本, 返回数量)。DMA版本 在每次 注入基因 时递增，
+因此 DMA 有任何写入，旧条目自然失配，不需要显式失效。
+前提是 DMA版本 只增不减：重置体征、压实、快照恢复都让它继续前进，而不是回到 0。
+进程内 LRU；可选落盘（JSON，写临时文件后原子替换），重启后免去冷启动的重复检索。
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+def 规范化查询(文本: str) -> str:
+    """全半角统一、大小写折叠、空白压缩"""
+    文本 = unicodedata.normalize("NFKC", 文本).casefold()
+    return re.sub(r"\s+", " ", 文本).strip()
+
+
+class BTCA检索缓存:
+    """按 DMA版本 隔离的检索结果 LRU"""
+
+    def __init__(self, 容量=512, 持久化文件=None):
+        """容量为 0 时缓存关闭（所有读取都未命中，写入被忽略）"""
+        self.容量 = 容量
+        self.持久化文件 = 持久化文件
+        self.命中 = 0
+        self.未命中 = 0
+        self._条目 = OrderedDict()  # 键 → 文档列表
+        self._脏 = False
+        self._锁 = threading.Lock()
+        if 持久化文件 and os.path.exists(持久化文件):
+            self._加载()
+
+    def __len__(self):
+        return len(self._条目)
+
+    @staticmethod
+    def 键(查询文本: str, DMA版本: int, 数量: int) -> str:
+        摘要 = hashlib.sha256(规范化查询(查询文本).encode("utf-8")).hexdigest()[:32]
+        return f"{DMA版本}:{数量}:{摘要}"
+
+    def 读取(self, 键: str):
+        """命中返回文档列表（副本），未命中返回 None"""
+        with self._锁:
+            结果 = self._条目.get(键)
+            if 结果 is None:
+                self.未命中 += 1
+                return None
+            self._条目.move_to_end(键)
+            self.命中 += 1
+            return list(结果)
+
+    def 写入(self, 键: str, 文档列表: list):
+        if not self.容量:
+            return
+        with self._锁:
+            self._条目[键] = list(文档列表)
+            self._条目.move_to_end(键)
+            while len(self._条目) > self.容量:
+                self._条目.popitem(last=False)
+            self._脏 = True
+
+    def 统计(self) -> dict:
+        总数 = self.命中 + self.未命中
+        return {"hits": self.命中, "misses": self.未命中,
+                "hit_rate": round(self.命中 / 总数, 4) if 总数 else 0.0}
+
+    # --- 落盘 ---
+    def 保存(self, 当前版本: int = None):
+        """写回磁盘；给出 当前版本 时只保留该版本的条目（旧版本条目已不可能命中）"""
+        if not self.持久化文件 or not self._脏:
+            return
+        with self._锁:
+            条目 = [(k, v) for k, v in self._条目.items()
+                  if 当前版本 is None or k.startswith(f"{当前版本}:")]
+            self._脏 = False
+        临时文件 = self.持久化文件 + ".tmp"
+        with open(临时文件, "w", encoding="utf-8") as f:
+            json.dump(条目, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(临时文件, self.持久化文件)
+
+    def _加载(self):
+        try:
+            with open(self.持久化文件, "r", encoding="utf-8") as f:
+                条目 = json.load(f)
+        except ValueError:
+            return  # 损坏的缓存文件直接丢弃
+        for k, v in 条目[-self.容量:] if self.容量 else []:
+            self._条目[k] = v
@@ -0,0 +1,209 @@
+"""
+BTCA DMA 压实（离线任务，运行时请先停止引擎 / GUI）
+
+- 读出集合中全部片段及其向量，按创建时间从早到晚做"首领聚类"：尚未归类的片段成为首领，
+  其 HNSW 近邻中与首领余弦相似度 ≥ 阈值且尚未归类的片段并入该簇（以首领为准，避免链式漂移）
+- 每簇保留一条规范记录（簇内与其余成员平均相似度最高者），元数据记录来源：
+  merged_count / merged_from（被合并的 ID，JSON 列表）/ compacted_at，created_at 取簇内最早
+- 规范记录与单例写入临时集合（沿用已有向量，不重新嵌入），再删除旧集合并把临时集合改名，
+  HNSW 索引随之完整重建、不再残留删除标记；最后 DMA版本 +1，使检索缓存失效
+- 启用分层时热层与冷层集合各自压实（冷层结果在报告的 "cold" 下）
+
+用法：
+  python btca_compact.py                       # 默认租户
+  python btca_compact.py --tenant alice --threshold 0.88 --dry-run
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+from btca_embedding import 余弦相似度
+from btca_main import BTCA存储器
+from btca_tenant import 打开租户存储
+
+临时后缀 = ".compacting"  # "." 不会出现在租户名中
+
+
+def _读取全部(集合, 批量=1000):
+    ID, 文档, 元数据, 向量 = [], [], [], []
+    偏移 = 0
+    while True:
+        页 = 集合.get(include=["documents", "metadatas", "embeddings"], limit=批量, offset=偏移)
+        if not 页["ids"]:
+            break
+        ID += 页["ids"]
+        文档 += 页["documents"]
+        元数据 += [m or {} for m in 页["metadatas"]]
+        向量 += list(页["embeddings"])
+        偏移 += len(页["ids"])
+    矩阵 = np.asarray(向量, dtype=np.float32).reshape(len(ID), -1) if ID else np.zeros((0, 0), np.float32)
+    return ID, 文档, 元数据, 矩阵
+
+
+def _聚类(集合, ID, 元数据, 矩阵, 阈值, 近邻数, 批量=256):
+    """返回簇列表（每簇为下标列表，首元素为首领）"""
+    下标 = {i: k for k, i in enumerate(ID)}
+    近邻 = [[] for _ in ID]
+    for 起 in range(0, len(ID), 批量):
+        结果 = 集合.query(query_embeddings=矩阵[起:起 + 批量], n_results=min(近邻数 + 1, len(ID)), include=[])
+        for k, 邻ID in enumerate(结果["ids"]):
+            近邻[起 + k] = [下标[i] for i in 邻ID if i in 下标 and 下标[i] != 起 + k]
+
+    顺序 = sorted(range(len(ID)), key=lambda k: (元数据[k].get("created_at", 0), ID[k]))
+    已归类 = np.zeros(len(ID), dtype=bool)
+    簇列表 = []
+    for 首领 in 顺序:
+        if 已归类[首领]:
+            continue
+        已归类[首领] = True
+        候选 = [k for k in 近邻[首领] if not 已归类[k]]
+        成员 = [首领]
+        if 候选:
+            相似度 = 余弦相似度(矩阵[[首领]], 矩阵[候选])[0]
+            成员 += [k for k, s in zip(候选, 相似度) if s >= 阈值]
+            已归类[成员] = True
+        簇列表.append(成员)
+    return 簇列表
+
+
+def _规范记录(簇, ID, 文档, 元数据, 矩阵):
+    if len(簇) == 1:
+        k = 簇[0]
+        return ID[k], 文档[k], 元数据[k], 矩阵[k]
+    相似度 = 余弦相似度(矩阵[簇], 矩阵[簇])
+    规范 = 簇[int(np.argmax(相似度.sum(axis=1)))]
+    并入 = []
+    合计 = 0
+    for k in 簇:
+        合计 += 元数据[k].get("merged_count", 1)
+        并入 += json.loads(元数据[k].get("merged_from", "[]"))
+        if k != 规范:
+            并入.append(ID[k])
+    新元数据 = dict(元数据[规范])
+    新元数据.update(
+        merged_count=合计,
+        merged_from=json.dumps(并入, ensure_ascii=False),
+        compacted_at=int(time.time()),
+        created_at=min(元数据[k].get("created_at", 0) for k in 簇) or 新元数据.get("created_at", 0),
+    )
+    return ID[规范], 文档[规范], 新元数据, 矩阵[规范]
+
+
+def 向量段目录(数据目录, 集合ID) -> list:
+    """集合的 HNSW 段目录（读 Chroma 的 segments 表；读不到时返回空列表）"""
+    try:
+        with sqlite3.connect(f"file:{os.path.join(数据目录, 'chroma.sqlite3')}?mode=ro", uri=True) as 库:
+            行 = 库.execute("SELECT id FROM segments WHERE collection = ? AND type LIKE '%vector%'",
+                          (str(集合ID),)).fetchall()
+    except sqlite3.Error:
+        return []
+    return [os.path.join(数据目录, r[0]) for r in 行]
+
+
+def _查询耗时(集合, 矩阵, 次数=50, 数量=3):
+    if not len(矩阵):
+        return None
+    样本 = 矩阵[np.random.default_rng(0).integers(0, len(矩阵), 次数)]
+    开始 = time.perf_counter()
+    for v in 样本:
+        集合.query(query_embeddings=[v], n_results=数量, include=["documents"])
+    return round((time.perf_counter() - 开始) * 1000 / 次数, 3)
+
+
+def _压实集合(存储: BTCA存储器, 名称, 属性, 现有, 阈值, 近邻数, 演练, 批量) -> dict:
+    """压实 存储 的一个层（属性 为 "_集合" 或 "_冷集合"）；集合有改动时报告含 changed=True"""
+    客户端 = 存储.chroma_client
+    临时名 = 名称 + 临时后缀
+    if 临时名 in 现有:
+        if 名称 not in 现有 and not 演练:
+            # 上次在删除旧集合与改名之间中断：直接完成改名
+            客户端.get_collection(临时名).modify(name=名称)
+            setattr(存储, 属性, None)
+            return {"resumed": True, "changed": True}
+        if not 演练:
+            客户端.delete_collection(临时名)
+
+    集合 = 客户端.get_collection(名称)
+    ID, 文档, 元数据, 矩阵 = _读取全部(集合)
+    报告 = {"before": len(ID), "query_ms_before": _查询耗时(集合, 矩阵)}
+    簇列表 = _聚类(集合, ID, 元数据, 矩阵, 阈值, 近邻数) if ID else []
+    报告["after"] = len(簇列表)
+    报告["merged_clusters"] = sum(1 for 簇 in 簇列表 if len(簇) > 1)
+    if 演练 or 报告["after"] == 报告["before"]:
+        return 报告
+
+    新集合 = 客户端.get_or_create_collection(name=临时名)
+    记录 = [_规范记录(簇, ID, 文档, 元数据, 矩阵) for 簇 in 簇列表]
+    for 起 in range(0, len(记录), 批量):
+        段 = 记录[起:起 + 批量]
+        新集合.add(ids=[r[0] for r in 段], documents=[r[1] for r in 段],
+                metadatas=[r[2] or None for r in 段], embeddings=np.stack([r[3] for r in 段]))
+    # Chroma 删除集合后不一定立即移除其 HNSW 段目录：记下旧段目录，删除后清理残留
+    根目录 = getattr(getattr(客户端, "_settings", None), "persist_directory", None) or 存储.数据目录
+    旧段目录 = 向量段目录(根目录, 集合.id)
+    客户端.delete_collection(名称)
+    新集合.modify(name=名称)
+    setattr(存储, 属性, None)
+    for 目录 in 旧段目录:
+        if os.path.isdir(目录):
+            shutil.rmtree(目录, ignore_errors=True)
+    报告["query_ms_after"] = _查询耗时(新集合, np.stack([r[3] for r in 记录]))
+    报告["changed"] = True
+    return 报告
+
+
+def 压实(存储: BTCA存储器, 阈值=0.9, 近邻数=16, 演练=False, 批量=500) -> dict:
+    """
+    对 存储 的 DMA 热层与冷层集合分别做近重复合并与索引重建；演练=True 时只统计不改动
+    热层结果在报告顶层，冷层（存在时）在 "cold" 下；跨层的近重复由回写去重在写入时拦截
+    """
+    开始 = time.perf_counter()
+    客户端 = 存储.chroma_client
+    现有 = {c if isinstance(c, str) else c.name for c in 客户端.list_collections()}
+    报告 = {"threshold": 阈值, "size_before": 存储.存储占用()}
+    if 存储.集合名 not in 现有 and 存储.集合名 + 临时后缀 not in 现有:
+        存储.集合  # 尚未建立的热层：建一个空集合，报告 before/after 为 0
+        现有.add(存储.集合名)
+    热层 = _压实集合(存储, 存储.集合名, "_集合", 现有, 阈值, 近邻数, 演练, 批量)
+    报告.update(热层)
+    冷层名 = 存储.集合名 + 存储.冷层后缀
+    if 冷层名 in 现有 or 冷层名 + 临时后缀 in 现有:
+        报告["cold"] = 冷层 = _压实集合(存储, 冷层名, "_冷集合", 现有, 阈值, 近邻数, 演练, 批量)
+        if 冷层.pop("changed", False):
+            存储._冷层条数 = None
+            报告["changed"] = True
+
+    if 报告.pop("changed", False):
+        with 存储.事务() as 状态:
+            状态["DMA版本"] += 1
+        存储.提交()
+        报告["size_after"] = 存储.存储占用()
+    报告["seconds"] = round(time.perf_counter() - 开始, 3)
+    return 报告
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="BTCA DMA 压实（近重复合并 + 索引重建）")
+    解析器.add_argument("--data-dir", default="./btca_memory")
+    解析器.add_argument("--tenant", help="租户ID（默认租户使用数据目录根）")
+    解析器.add_argument("--threshold", type=float, default=0.9, help="余弦相似度阈值")
+    解析器.add_argument("--neighbors", type=int, default=16, help="每个首领考察的近邻数")
+    解析器.add_argument("--dry-run", action="store_true", help="只统计可合并的簇，不改动集合")
+    参数 = 解析器.parse_args()
+
+    存储 = 打开租户存储(参数.data_dir, 参数.tenant)
+    try:
+        报告 = 压实(存储, 参数.threshold, 参数.neighbors, 参数.dry_run)
+    finally:
+        存储.关闭()
+    print(json.dumps(报告, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+BTCA M01 附属：会话记忆（最近 N 轮原文 + 滚动摘要，总量受 token 预算约束）
+
+- 最近 保留轮数 轮的用户输入与回复原样放入请求（单条超长时按句截断到 单条上限）
+- 更早的轮次在移出原文窗口时折叠进滚动摘要：默认为抽取式（每轮一行：提问 + 回复的结论行），
+  也可传入 摘要器(旧摘要, 用户输入, 回复) → 新摘要，例如用模型生成的摘要
+- 摘要超过 摘要预算 时从最早的行开始略去；原文 + 摘要超过 预算tokens 时提前折叠最早的原文轮次，
+  因此无论会话多长，随请求发送的历史都不超过 预算tokens
+- token 计数复用 BTCA上下文打包器 的计数与截断（原文每条只在追加时计数一次）
+"""
+
+from collections import deque
+
+from btca_packer import BTCA上下文打包器
+
+
+class BTCA会话记忆:
+    """单路会话的历史消息：原文窗口 + 滚动摘要"""
+
+    def __init__(self, 保留轮数=4, 预算tokens=1500, 摘要预算=400, 单条上限=300, 打包器=None, 摘要器=None):
+        """
+        保留轮数：原样保留的最近轮数
+        预算tokens：原文窗口与摘要合计的 token 上限
+        摘要预算：滚动摘要的 token 上限（包含在 预算tokens 内）
+        单条上限：原文窗口中单条用户输入 / 回复的 token 上限
+        """
+        self.保留轮数 = 保留轮数
+        self.预算tokens = 预算tokens
+        self.摘要预算 = min(摘要预算, 预算tokens)
+        self.单条上限 = 单条上限
+        self.打包器 = 打包器 or BTCA上下文打包器()
+        self.摘要器 = 摘要器
+        self._原文 = deque()    # (用户输入, 回复, tokens)
+        self._原文tokens = 0
+        self._摘要行 = deque()  # 抽取式摘要：每个折叠轮次一行
+        self._摘要文本 = ""     # 自定义摘要器的输出
+        self.摘要tokens = 0
+        self.折叠轮数 = 0       # 已移出原文窗口的轮数
+        self.略去轮数 = 0       # 其中连摘要也已略去的轮数
+
+    def __len__(self):
+        return len(self._原文) + self.折叠轮数
+
+    @property
+    def tokens(self) -> int:
+        return self._原文tokens + self.摘要tokens
+
+    @property
+    def 摘要(self) -> str:
+        if self.摘要器 is not None:
+            return self._摘要文本
+        行 = list(self._摘要行)
+        if self.略去轮数:
+            行.insert(0, f"（更早的 {self.略去轮数} 轮从略）")
+        return "\n".join(行)
+
+    def 追加(self, 用户输入: str, 回复: str):
+        """本轮结束后调用；必要时把最早的轮次折叠进摘要"""
+        计数, 截断 = self.打包器.计数, self.打包器.截断
+        用户输入, 回复 = 截断(用户输入, self.单条上限), 截断(回复, self.单条上限)
+        n = 计数(用户输入) + 计数(回复)
+        self._原文.append((用户输入, 回复, n))
+        self._原文tokens += n
+        while self._原文 and (len(self._原文) > self.保留轮数 or self.tokens > self.预算tokens):
+            self._折叠()
+
+    def _折叠(self):
+        用户输入, 回复, n = self._原文.popleft()
+        self._原文tokens -= n
+        self.折叠轮数 += 1
+        if self.摘要器 is not None:
+            self._摘要文本 = self.打包器.截断(self.摘要器(self._摘要文本, 用户输入, 回复), self.摘要预算)
+            self.摘要tokens = self.打包器.计数(self._摘要文本)
+            return
+        self._摘要行.append(self._摘要行文本(用户输入, 回复))
+        self.摘要tokens = self.打包器.计数(self.摘要)
+        while len(self._摘要行) > 1 and self.摘要tokens > self.摘要预算:
+            self._摘要行.popleft()
+            self.略去轮数 += 1
+            self.摘要tokens = self.打包器.计数(self.摘要)
+
+    def _摘要行文本(self, 用户输入: str, 回复: str) -> str:
+        结论行 = [行.strip() for 行 in 回复.split("\n") if 行.strip() and not 行.lstrip().startswith(":DMA_")]
+        截断 = self.打包器.截断
+        return f"第{self.折叠轮数}轮 问：{截断(' '.join(用户输入.split()), 40)} 答：{截断(结论行[-1] if 结论行 else '', 60)}"
+
+    def 消息(self) -> list:
+        """插在系统提示之后、本轮用户输入之前的历史消息"""
+        消息 = []
+        摘要 = self.摘要
+        if 摘要:
+            消息.append({"role": "system", "content": f"【此前对话摘要】\n{摘要}"})
+        for 用户输入, 回复, _ in self._原文:
+            消息.append({"role": "user", "content": 用户输入})
+            消息.append({"role": "assistant", "content": 回复})
+        return 消息
+
+    def 清空(self):
+        self._原文.clear()
+        self._摘要行.clear()
+        self._原文tokens = self.摘要tokens = 0
+        self._摘要文本 = ""
+        self.折叠轮数 = self.略去轮数 = 0
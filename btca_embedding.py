@@ -0,0 +1,241 @@
+"""
+BTCA M02 附属：嵌入服务
+
+- 模型懒加载：首次真正需要计算向量时才加载（默认与 Chroma 集合相同的 ONNX MiniLM）
+- 磁盘缓存：内容哈希 → 行号；向量存于内存映射的 float32 矩阵，重复文本不再重算
+- 跨轮次批处理：模型计算期间到达的并发请求在下一次调用中合并（可选再等待一个短窗口）
+- 调用方（BTCA存储器）把算好的向量直接交给 Chroma（embeddings= / query_embeddings=）
+
+缓存目录布局：
+    embedding_cache/
+    ├── meta.json      # {"dim": 384}
+    ├── vectors.f32    # 行主序 float32 矩阵（按需倍增扩容）
+    ├── index.txt      # 每行一个内容哈希，行号即矩阵行号
+    └── cache.lock     # 多进程追加互斥；追加前先读入其他进程新增的行
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from btca_lock import BTCA进程锁
+
+
+def 内容哈希(文本: str) -> str:
+    return hashlib.sha256(文本.encode("utf-8")).hexdigest()[:32]
+
+
+def 余弦相似度(A, B) -> np.ndarray:
+    """A: (m, d)，B: (n, d) → (m, n) 余弦相似度矩阵"""
+    A = np.asarray(A, dtype=np.float32)
+    B = np.asarray(B, dtype=np.float32)
+    A = A / np.maximum(np.linalg.norm(A, axis=1, keepdims=True), 1e-12)
+    B = B / np.maximum(np.linalg.norm(B, axis=1, keepdims=True), 1e-12)
+    return A @ B.T
+
+
+class _向量文件:
+    """追加写入的内存映射向量矩阵 + 行号索引（多进程共用目录时，追加在 cache.lock 上互斥）"""
+
+    初始容量 = 1024
+
+    def __init__(self, 目录):
+        os.makedirs(目录, exist_ok=True)
+        self.元数据文件 = os.path.join(目录, "meta.json")
+        self.矩阵文件 = os.path.join(目录, "vectors.f32")
+        self.索引文件 = os.path.join(目录, "index.txt")
+        self.进程锁 = BTCA进程锁(os.path.join(目录, "cache.lock"))
+        self.维度 = None
+        self.行号 = {}
+        self._矩阵 = None
+        self._行数 = 0       # 已读入的索引行数（行号即矩阵行号）
+        self._索引偏移 = 0   # index.txt 中已读入的字节数
+        with self.进程锁.独占():
+            self._跟进()
+
+    def _打开映射(self):
+        行数 = os.path.getsize(self.矩阵文件) // (self.维度 * 4)
+        self._矩阵 = np.memmap(self.矩阵文件, dtype=np.float32, mode="r+", shape=(行数, self.维度))
+
+    def _跟进(self):
+        """读入其他进程追加的索引行，矩阵被扩容过则重新映射（持进程锁调用）"""
+        if self.维度 is None:
+            if not os.path.exists(self.元数据文件):
+                return
+            with open(self.元数据文件, "r", encoding="utf-8") as f:
+                self.维度 = json.load(f)["dim"]
+        if self._矩阵 is None or os.path.getsize(self.矩阵文件) != self._矩阵.shape[0] * self.维度 * 4:
+            self._打开映射()
+        if not os.path.exists(self.索引文件):
+            return
+        with open(self.索引文件, "rb") as f:
+            f.seek(self._索引偏移)
+            for 行 in f:
+                # 崩溃留下的残行，或矩阵里没有对应数据的索引行，都视为未写入
+                if not 行.endswith(b"\n") or self._行数 >= self._矩阵.shape[0]:
+                    break
+                self.行号[行.decode("ascii").strip()] = self._行数
+                self._行数 += 1
+                self._索引偏移 += len(行)
+        if self._索引偏移 < os.path.getsize(self.索引文件):
+            with open(self.索引文件, "r+b") as f:
+                f.truncate(self._索引偏移)
+
+    def 读取(self, 哈希):
+        行 = self.行号.get(哈希)
+        return None if 行 is None else np.array(self._矩阵[行])
+
+    def 追加(self, 哈希列表, 向量矩阵):
+        向量矩阵 = np.asarray(向量矩阵, dtype=np.float32)
+        with self.进程锁.独占():
+            # 先读入其他进程的追加：新行写在真正的末尾，其他进程已算过的文本不再重复写入
+            self._跟进()
+            保留 = [i for i, h in enumerate(哈希列表) if h not in self.行号]
+            if not 保留:
+                return
+            哈希列表 = [哈希列表[i] for i in 保留]
+            向量矩阵 = 向量矩阵[保留]
+            if self.维度 is None:
+                self.维度 = int(向量矩阵.shape[1])
+                with open(self.矩阵文件, "wb") as f:
+                    f.truncate(self.初始容量 * self.维度 * 4)
+                with open(self.元数据文件, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.维度}, f)
+                self._打开映射()
+            起始 = self._行数
+            需要 = 起始 + len(哈希列表)
+            if 需要 > self._矩阵.shape[0]:
+                新容量 = max(需要, self._矩阵.shape[0] * 2)
+                self._矩阵.flush()
+                del self._矩阵
+                with open(self.矩阵文件, "r+b") as f:
+                    f.truncate(新容量 * self.维度 * 4)
+                self._打开映射()
+            # 先写向量再写索引：索引行存在即代表向量完整
+            self._矩阵[起始:需要] = 向量矩阵
+            self._矩阵.flush()
+            with open(self.索引文件, "a", encoding="ascii") as f:
+                f.write("".join(h + "\n" for h in 哈希列表))
+                self._索引偏移 = f.tell()
+            for i, h in enumerate(哈希列表):
+                self.行号[h] = 起始 + i
+            self._行数 = 需要
+
+
+class _请求:
+    __slots__ = ("文本", "结果")
+
+    def __init__(self, 文本):
+        self.文本 = 文本
+        self.结果 = Future()
+
+
+class BTCA嵌入服务:
+    """懒加载模型 + 内容哈希磁盘缓存 + 跨轮次批处理"""
+
+    def __init__(self, 缓存目录=None, 嵌入函数=None, 批处理窗口=0.0, 最大批量=64):
+        """
+        缓存目录：None 时只做进程内计算，不落盘
+        嵌入函数：可调用对象 list[str] → 向量列表；None 时懒加载 Chroma 默认嵌入模型
+        批处理窗口：秒；凑批时额外等待的时长。0 表示只合并已在排队的请求，单路调用不增加延迟
+        """
+        self._嵌入函数 = 嵌入函数
+        self.批处理窗口 = 批处理窗口
+        self.最大批量 = 最大批量
+        self._缓存 = _向量文件(缓存目录) if 缓存目录 else None
+        self._锁 = threading.Lock()
+        self._模型锁 = threading.Lock()
+        self._队列 = queue.Queue()
+        self._工作线程 = None
+        self.统计 = {"cache_hits": 0, "computed": 0, "model_calls": 0}
+
+    # --- 模型 ---
+    @property
+    def 已加载(self):
+        return self._嵌入函数 is not None
+
+    def 预热(self):
+        """提前加载模型（例如放在后台线程中）"""
+        self._模型()
+
+    def _模型(self):
+        if self._嵌入函数 is None:
+            with self._模型锁:
+                if self._嵌入函数 is None:
+                    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+                    self._嵌入函数 = DefaultEmbeddingFunction()
+        return self._嵌入函数
+
+    def _调用模型(self, 文本列表):
+        self.统计["model_calls"] += 1
+        return np.asarray(self._模型()(文本列表), dtype=np.float32)
+
+    # --- 对外接口 ---
+    def 嵌入(self, 文本列表: list) -> list:
+        """返回与 文本列表 一一对应的 float32 向量；命中缓存的文本不进入模型"""
+        哈希列表 = [内容哈希(t) for t in 文本列表]
+        结果 = [None] * len(文本列表)
+        待算 = {}  # 哈希 → 文本（同批次重复文本只算一次）
+        with self._锁:
+            for i, h in enumerate(哈希列表):
+                向量 = self._缓存.读取(h) if self._缓存 else None
+                if 向量 is None:
+                    待算.setdefault(h, 文本列表[i])
+                else:
+                    结果[i] = 向量
+                    self.统计["cache_hits"] += 1
+
+        if 待算:
+            新向量 = self._批量计算(list(待算.values()))
+            已算 = dict(zip(待算.keys(), 新向量))
+            with self._锁:
+                self.统计["computed"] += len(已算)
+                if self._缓存 is not None:
+                    新哈希 = [h for h in 已算 if h not in self._缓存.行号]
+                    if 新哈希:
+                        self._缓存.追加(新哈希, np.stack([已算[h] for h in 新哈希]))
+            for i, h in enumerate(哈希列表):
+                if 结果[i] is None:
+                    结果[i] = 已算[h]
+        return 结果
+
+    # --- 批处理 ---
+    def _批量计算(self, 文本列表):
+        请求 = _请求(文本列表)
+        self._队列.put(请求)
+        if self._工作线程 is None:
+            with self._模型锁:
+                if self._工作线程 is None:
+                    self._工作线程 = threading.Thread(target=self._批处理循环, daemon=True)
+                    self._工作线程.start()
+        return 请求.结果.result()
+
+    def _批处理循环(self):
+        while True:
+            批 = [self._队列.get()]
+            数量 = len(批[0].文本)
+            截止 = time.monotonic() + self.批处理窗口
+            while 数量 < self.最大批量:
+                剩余 = 截止 - time.monotonic()
+                try:
+                    请求 = self._队列.get(timeout=剩余) if 剩余 > 0 else self._队列.get_nowait()
+                except queue.Empty:
+                    break
+                批.append(请求)
+                数量 += len(请求.文本)
+            try:
+                向量 = self._调用模型([t for 请求 in 批 for t in 请求.文本])
+            except Exception as e:
+                for 请求 in 批:
+                    请求.结果.set_exception(e)
+                continue
+            偏移 = 0
+            for 请求 in 批:
+                请求.结果.set_result(list(向量[偏移:偏移 + len(请求.文本)]))
+                偏移 += len(请求.文本)
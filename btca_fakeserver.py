@@ -0,0 +1,192 @@
+"""
+BTCA 仿真模型服务：本地 OpenAI chat.completions 替身（仅供基准测试 / 离线联调）
+
+- POST /v1/chat/completions，支持非流式与 SSE 流式（含 stream_options.include_usage）
+- 可配置：响应延迟、流式块大小与块间隔、回复 token 数、:DMA_Writeback 出现比例
+- usage 中的 prompt_tokens 按字符数估算；cached_tokens 按与上一请求系统提示的
+  公共前缀估算（≥1024 token 起算、按 128 token 取整，与服务端前缀缓存的规则一致）
+
+用法：
+  python btca_fakeserver.py --port 8765 --latency 0.3
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=sk-fake python btca_main.py
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_正文 = "推演正文：先扫描前提中的逻辑瑕疵（A），再把可疑结论转换为可检验的命题（T），逐条核对因果（C）。"
+_结论 = "结论：我绝不去做未经结构校验的判断。"
+
+
+def _公共前缀长度(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class _处理器(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # 头与正文分两次写出，避免 Nagle + 延迟确认带来的 ~40ms 假延迟
+
+    def log_message(self, *_):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        长度 = int(self.headers.get("Content-Length", 0))
+        请求 = json.loads(self.rfile.read(长度) or b"{}")
+        服务 = self.server.服务
+        内容, 用量 = 服务.生成(请求)
+        time.sleep(服务.延迟)
+        if 请求.get("stream"):
+            self._流式(请求, 内容, 用量)
+        else:
+            self._完整(请求, 内容, 用量)
+
+    def _完整(self, 请求, 内容, 用量):
+        正文 = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": 请求.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": 内容},
+                         "finish_reason": "stop"}],
+            "usage": 用量,
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(正文)))
+        self.end_headers()
+        self.wfile.write(正文)
+
+    def _流式(self, 请求, 内容, 用量):
+        服务 = self.server.服务
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        块ID = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        def 发送(选项, 用量=None):
+            事件 = {"id": 块ID, "object": "chat.completion.chunk", "created": int(time.time()),
+                  "model": 请求.get("model", "fake"), "choices": 选项}
+            if 用量 is not None:
+                事件["usage"] = 用量
+            self.wfile.write(f"data: {json.dumps(事件, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for i in range(0, len(内容), 服务.块字符数):
+            if i and 服务.块间隔:
+                time.sleep(服务.块间隔)
+            发送([{"index": 0, "delta": {"content": 内容[i:i + 服务.块字符数]}, "finish_reason": None}])
+        发送([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (请求.get("stream_options") or {}).get("include_usage"):
+            发送([], 用量)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class BTCA仿真模型服务:
+    """在后台线程运行的本地 chat.completions 服务"""
+
+    def __init__(self, 主机="127.0.0.1", 端口=0, 延迟=0.0, 回复tokens=300, 回写比例=1.0,
+                 块字符数=8, 块间隔=0.0):
+        """
+        端口：0 表示自动分配
+        延迟：收到请求到开始响应的秒数（流式时即首块延迟）
+        回写比例：回复中带 :DMA_Writeback 提案的请求占比（按请求序号均匀分布）
+        """
+        self.延迟 = 延迟
+        self.回复tokens = 回复tokens
+        self.回写比例 = 回写比例
+        self.块字符数 = 块字符数
+        self.块间隔 = 块间隔
+        self.请求数 = 0
+        self._上次系统提示 = ""
+        self._锁 = threading.Lock()
+        self._服务器 = ThreadingHTTPServer((主机, 端口), _处理器)
+        self._服务器.daemon_threads = True
+        self._服务器.服务 = self
+        self._线程 = None
+
+    @property
+    def base_url(self):
+        主机, 端口 = self._服务器.server_address[:2]
+        return f"http://{主机}:{端口}/v1"
+
+    def 启动(self):
+        self._线程 = threading.Thread(target=self._服务器.serve_forever, daemon=True)
+        self._线程.start()
+        return self
+
+    def 关闭(self):
+        self._服务器.shutdown()
+        self._服务器.server_close()
+
+    def __enter__(self):
+        return self.启动()
+
+    def __exit__(self, *_):
+        self.关闭()
+
+    def 生成(self, 请求: dict) -> tuple:
+        """按请求序号生成 (回复内容, usage)"""
+        消息 = 请求.get("messages", [])
+        系统提示 = next((m.get("content", "") for m in 消息 if m.get("role") == "system"), "")
+        with self._锁:
+            self.请求数 += 1
+            序号 = self.请求数
+            前缀 = _公共前缀长度(系统提示, self._上次系统提示)
+            self._上次系统提示 = 系统提示
+
+        行 = [_正文]
+        # 回写比例 r：序号 n 落在 floor(n*r) 发生跳变处时带回写，保证整体占比为 r
+        if int(序号 * self.回写比例) != int((序号 - 1) * self.回写比例):
+            行.append(f':DMA_Writeback "仿真洞察#{序号}：结构优先于结论，单次成功不能反推结构正确"')
+        行.append(_结论)
+        内容 = "\n".join(行)
+
+        prompt_tokens = sum(len(m.get("content") or "") for m in 消息) // 2
+        cached_tokens = 前缀 // 2
+        cached_tokens = cached_tokens // 128 * 128 if cached_tokens >= 1024 else 0
+        return 内容, {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": self.回复tokens,
+            "total_tokens": prompt_tokens + self.回复tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="BTCA 仿真模型服务（本地 chat.completions 替身）")
+    解析器.add_argument("--host", default="127.0.0.1")
+    解析器.add_argument("--port", type=int, default=8765)
+    解析器.add_argument("--latency", type=float, default=0.0, help="响应延迟（秒）")
+    解析器.add_argument("--completion-tokens", type=int, default=300)
+    解析器.add_argument("--writeback-ratio", type=float, default=1.0)
+    解析器.add_argument("--chunk-chars", type=int, default=8)
+    解析器.add_argument("--chunk-interval", type=float, default=0.0, help="流式块间隔（秒）")
+    参数 = 解析器.parse_args()
+
+    服务 = BTCA仿真模型服务(参数.host, 参数.port, 参数.latency, 参数.completion_tokens,
+                    参数.writeback_ratio, 参数.chunk_chars, 参数.chunk_interval)
+    print(f"仿真模型服务已启动：OPENAI_BASE_URL={服务.base_url}")
+    try:
+        服务._服务器.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        服务._服务器.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import os
-import time
 import hashlib
-from btca_main import BTCA存储器, BTCA调度器
+import uuid
+from btca_analytics import BTCA审计分析
+from btca_dialogue import BTCA会话记忆
+from btca_tenant import BTCA租户管理器
 
 # --- 页面配置 ---
 st.set_page_config(page_title="仿生思维克隆系统", layout="wide", page_icon="🧬")
@@ -65,94 +65,158 @@ div.stButton > button:hover {
 </style>
 """, unsafe_allow_html=True)
 
+
 @st.cache_resource
 def init_engine():
-    return BTCA调度器(os.environ.get("OPENAI_API_KEY", ""))
+    # 每个克隆体保留最近 4 轮原文 + 滚动摘要作为对话上文
+    return BTCA租户管理器(os.environ.get("OPENAI_API_KEY", ""), 记忆工厂=BTCA会话记忆)
+
+
+# 每个浏览器会话对应一个租户（克隆体）；?tenant=<id> 可在刷新/换设备后找回同一克隆体
+if "tenant_id" not in st.session_state:
+    st.session_state.tenant_id = st.query_params.get("tenant") or uuid.uuid4().hex[:12]
+    st.query_params["tenant"] = st.session_state.tenant_id
+
+
+def 当前调度器():
+    # 每次取用都经过管理器：刷新租户的空闲计时；租户被驱逐后自动重新加载
+    return init_engine().获取(st.session_state.tenant_id)
+
+
+调度器 = 当前调度器()
+if "warmup_started" not in st.session_state:
+    # 页面先渲染；Chroma 集合 / 嵌入模型 / 模型客户端在后台线程中就绪
+    调度器.预热()
+    st.session_state.warmup_started = True
+
+
+# 每个租户一份列式缓存；与常驻租户同样有上限，被挤出的在该租户下次访问时重建（磁盘上的缓存照常复用）
+@st.cache_resource(max_entries=init_engine().最大常驻)
+def init_analytics(数据目录):
+    return BTCA审计分析(数据目录)
+
+
+分析 = init_analytics(调度器.存储.数据目录)
+
+# 指标 / 趋势以片段形式按各自周期刷新；对话输入触发的整页重跑不再重复计算
+指标刷新间隔 = "5s"
+趋势刷新间隔 = "15s"
+# 对话区只渲染最近的消息；更早的按需展开
+显示条数 = 40
+
+
+def fmt_ratio(v):
+    return "—" if v is None else f"{v:.1%}"
+
 
-调度器 = init_engine()
+def fmt_size(字节):
+    return f"{字节 / 1024:.1f} KB"
+
+
+def 刷新趋势(调度器):
+    # 审计历史 → 列式缓存（只摄取新增记录）
+    调度器.存储.审计.刷新()
+    分析.更新()
+    return 分析.指标()
 
-# 获取真实存储数据的函数
-def get_storage_size():
-    path = "btca_memory"
-    if not os.path.exists(path): return "0 KB"
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
-    return f"{total_size / 1024:.1f} KB"
 
 # 状态初始化
 if "messages" not in st.session_state: st.session_state.messages = []
 if "last_audit" not in st.session_state: st.session_state.last_audit = {}
-if "stress_level" not in st.session_state: st.session_state.stress_level = 0.0
-if "phase" not in st.session_state: st.session_state.phase = 0.0
+if "show_all" not in st.session_state: st.session_state.show_all = False
 
 # --- 处理用户输入 ---
 if prompt := st.chat_input("请输入您的问题，希望我有你惊喜的答案 ..."):
-    new_stress = min(len(prompt) / 50, 6.0)
-    st.session_state.stress_level = max(st.session_state.stress_level, new_stress)
     st.session_state.messages.append({"role": "user", "content": prompt})
     st.session_state.pending_run = prompt
 
+
+def metric_card(label, value, status="normal", border_color="#00ff88"):
+    color_class = "status-normal" if status=="normal" else "status-danger"
+    st.markdown(f"""
+        <div class="metric-card" style="border-left-color: {border_color}">
+            <div class="metric-label">{label}</div>
+            <div class="metric-value {color_class}">{value}</div>
+        </div>
+    """, unsafe_allow_html=True)
+
+
 # --- 侧边栏：15项高亮指标 ---
-with st.sidebar:
-    st.markdown("<div style='color:#00ff88; font-weight:bold; font-size:0.9rem;'>● BTCS CORE METRICS</div>", unsafe_allow_html=True)
-    体征 = 调度器.存储.状态 
-    
-    def metric_card(label, value, status="normal", border_color="#00ff88"):
-        color_class = "status-normal" if status=="normal" else "status-danger"
-        st.markdown(f"""
-            <div class="metric-card" style="border-left-color: {border_color}">
-                <div class="metric-label">{label}</div>
-                <div class="metric-value {color_class}">{value}</div>
-            </div>
-        """, unsafe_allow_html=True)
+@st.fragment(run_every=指标刷新间隔)
+def 侧边栏指标():
+    调度器 = 当前调度器()  # 片段单独重跑时不经过整页脚本，需自行重新获取
+    体征 = 调度器.存储.状态快照()  # 同一克隆体可能同时被其他 worker / CLI 推进
+    趋势 = 刷新趋势(调度器)
 
     # 核心指标
     metric_card("核心端粒 (TELOMERE)", f"{体征['端粒剩余']:.4f}", border_color="#00ff88")
     metric_card("能量储备 (ENERGY)", f"{int(体征['能量储备'])} TKS", border_color="#00d1ff")
-    
+
     # 指标矩阵
     cols = st.columns(2)
     with cols[0]:
         metric_card("生命轮次", f"R-{体征['总轮次']}", border_color="#3b82f6")
         metric_card("异常偏离", f"{体征['异常计数']} ERR", "danger" if 体征['异常计数']>0 else "normal", "#ef4444")
         metric_card("代谢活跃度", f"{(体征['能量储备']/10000)*100:.1f}%", border_color="#00d1ff")
-        metric_card("衰减斜率", "-0.052/T", border_color="#64748b")
+        斜率 = 趋势["telomere_slope_per_turn"]
+        metric_card("衰减斜率", "—" if 斜率 is None else f"{斜率:+.3f}/T", border_color="#64748b")
         metric_card("抗体活性", f"{len(调度器.存储.抗体库)} ACT", border_color="#a855f7")
-        # 新增真实指标 15
-        metric_card("存储池负载", get_storage_size(), border_color="#10b981")
+        # 新增真实指标 15（存储层增量统计，不再整树遍历）
+        metric_card("存储池负载", fmt_size(调度器.存储.存储占用()), border_color="#10b981")
     with cols[1]:
         metric_card("DMA 版本", f"V{体征['DMA版本']}", border_color="#f59e0b")
         metric_card("遗传向量", f"Chr-{体征['Chr23']}", border_color="#ec4899")
         db_hash = hashlib.md5(str(体征['端粒剩余']).encode()).hexdigest()[:6]
         metric_card("内存快照", f"#{db_hash}", border_color="#06b6d4")
-        metric_card("校验级别", "M06-HIGH", border_color="#10b981")
-        metric_card("碎片热度", f"{min(体征['DMA版本']*2.5, 100):.1f}%", border_color="#fb923c")
+        metric_card("回写接受率", fmt_ratio(趋势["writeback_acceptance"]), border_color="#10b981")
+        metric_card("免疫命中率", fmt_ratio(趋势["immune_hit_rate"]), border_color="#fb923c")
         metric_card("逻辑熵增", f"+{(体征['异常计数']*1.2)+(100-体征['端粒剩余'])/10:.2f} G", border_color="#f43f5e")
 
+
+with st.sidebar:
+    st.markdown("<div style='color:#00ff88; font-weight:bold; font-size:0.9rem;'>● BTCS CORE METRICS</div>", unsafe_allow_html=True)
+    侧边栏指标()
+
     st.write("")
     # 微缩化按钮
     if st.button("🔄 重置体征", use_container_width=False):
-        调度器.存储.状态 = BTCA存储器._初始状态()
-        调度器.存储.保存状态()
+        调度器.存储.重置体征()
         st.session_state.messages = []
-        st.session_state.stress_level = 0.0
+        st.session_state.show_all = False
+        if 调度器.会话记忆 is not None:
+            调度器.会话记忆.清空()
         st.toast("系统已初始化", icon="🧬")
         st.rerun()
 
 # --- 主区 ---
 st.markdown("### 仿生思维克隆系统")
 
-# === 动态波形图 ===
-t_val = 体征['端粒剩余'] / 100
-stress = st.session_state.stress_level
-st.session_state.phase += 0.15 
-x = np.linspace(0, 10, 120)
-y = np.sin(x * (1 + stress) + st.session_state.phase) * t_val
-y += np.random.randn(120) * (0.01 + stress * 0.08) 
-st.line_chart(pd.DataFrame(y, columns=['Thinking Waveform']), height=150)
+
+# === 生命趋势（最近200轮审计）===
+@st.fragment(run_every=趋势刷新间隔)
+def 生命趋势():
+    趋势 = 刷新趋势(当前调度器())
+    if not 分析.行数:
+        st.caption("暂无审计历史")
+        return
+    import pandas as pd  # 只有存在审计历史时才需要，推迟导入以缩短冷启动
+    序列 = 分析.序列(200)
+    趋势表 = pd.DataFrame(
+        {"端粒": 序列["telomere_after"], "tokens/轮": 序列["tokens"]},
+        index=pd.to_datetime(序列["ts"], unit="s"),
+    )
+    图列 = st.columns([3, 1])
+    with 图列[0]:
+        st.line_chart(趋势表, height=150)
+    with 图列[1]:
+        每轮 = 趋势["tokens_per_turn"]
+        燃烧 = 趋势["energy_burn_per_hour"]
+        st.caption(f"tokens/轮 {每轮:.0f}" if 每轮 is not None else "tokens/轮 —")
+        st.caption(f"能量消耗 {燃烧:.0f}/h" if 燃烧 is not None else "能量消耗 —")
+        st.caption(f"拦截率 {fmt_ratio(趋势['block_rate'])}")
+
+
+生命趋势()
 
 # 对话展示：带标题与边框
 st.write("---")
@@ -160,18 +224,21 @@ st.markdown("<p style='font-size:0.7rem; color:#475569;'>思维流...</p>", unsa
 
 chat_container = st.container()
 with chat_container:
-    for msg in st.session_state.messages:
+    历史 = st.session_state.messages
+    更早 = 0 if st.session_state.show_all else max(0, len(历史) - 显示条数)
+    if 更早 and st.button(f"显示更早的 {更早} 条消息"):
+        st.session_state.show_all = True
+        st.rerun()
+    for msg in 历史[更早:]:
         # 对话区现在有了内置的角色标题和背景框
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
 
-# 执行推演逻辑
+# 执行推演逻辑：流式输出留在页面上，直接并入历史，无需再整页重跑一次
 if "pending_run" in st.session_state:
     current_prompt = st.session_state.pop("pending_run")
     with chat_container:
         with st.chat_message("assistant"):
-            with st.spinner("思维解旋中..."):
-                回复, 审计日志 = 调度器.运行推演周期(current_prompt)
-                st.markdown(回复)
-                st.session_state.messages.append({"role": "assistant", "content": 回复})
-                st.rerun()
+            回合 = 调度器.运行推演周期_流式(current_prompt)
+            st.write_stream(回合)
+            st.session_state.messages.append({"role": "assistant", "content": 回合.回复})
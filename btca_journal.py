@@ -0,0 +1,270 @@
+"""
+BTCA 持久化：生命体征预写日志（WAL）+ 组提交 + 原子检查点
+
+- 记录()：与上次记录的状态求差，把变化的键合并进内存缓冲（无IO）
+- 提交()：缓冲合并为一条紧凑 JSON 增量写入日志并 fsync（每轮一次，或由定时线程触发）
+- 检查点()：完整状态写入临时文件 → fsync → os.replace 原子替换 → 清空日志
+- 加载()：读取检查点并重放日志；末尾被截断的半行直接丢弃
+
+日志记录是「键 → 新值」的绝对赋值，重复重放是幂等的，
+因此检查点替换成功但日志尚未清空时崩溃也不会产生错误状态。
+
+多进程共用同一数据目录时（<状态文件>.lock 上的 BTCA进程锁）：
+- 独占(状态)：持锁先 追读() 其他进程写入的增量（检查点被替换则整体重载），
+  调用方在锁内完成读-改-写，退出时把增量写出到日志（仅 write，可被其他进程立即读到）再解锁
+- 提交()：持锁写出剩余缓冲，并对本进程写出的增量统一 fsync（每轮一次，持久性与单进程时相同）
+- 刷新(状态)：只读方的廉价快照——日志与检查点都未变化时只花两次 stat
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from btca_lock import BTCA进程锁
+
+_缺失 = object()
+
+
+class BTCA状态日志:
+    """btca_state.json 的崩溃安全持久层"""
+
+    def __init__(self, 状态文件, 日志文件=None, 检查点阈值=200, 提交间隔=None):
+        self.状态文件 = 状态文件
+        self.日志文件 = 日志文件 or 状态文件 + ".journal"
+        self.检查点阈值 = 检查点阈值
+        self.进程锁 = BTCA进程锁(状态文件 + ".lock")
+        self._状态 = None        # 调用方持有的状态字典（追读时原地更新）
+        self._已记录 = {}
+        self._待写 = {}
+        self._待删 = set()
+        self._日志条数 = 0
+        self._偏移 = 0           # 日志中已读入 / 已写出的字节数
+        self._检查点标识 = None  # 已读入的检查点文件 (inode, mtime, 大小)，被其他进程替换后需整体重载
+        self._未同步 = False     # 已写出但尚未 fsync 的增量
+        self._锁 = threading.Lock()
+        self._停止 = threading.Event()
+        self._定时线程 = None
+        if 提交间隔:
+            self._定时线程 = threading.Thread(target=self._定时提交, args=(提交间隔,), daemon=True)
+            self._定时线程.start()
+
+    # --- 启动恢复 ---
+    def 加载(self):
+        """返回恢复后的状态字典；无任何持久数据时返回 None"""
+        with self.进程锁.独占(), self._锁:
+            状态 = self._读取全部()
+        self._状态 = 状态
+        return 状态
+
+    def 加载或初始化(self, 初始状态):
+        """
+        同 加载()，但无任何持久数据时在进程锁内把 初始状态() 直接写出到日志：
+        同时打开新数据目录的多个进程只有第一个写入初始状态，其余读到的是它写出的状态，
+        不会把初始值留在各自的缓冲里、在之后的事务中覆盖其他进程的修改
+        """
+        with self.进程锁.独占(), self._锁:
+            状态 = self._读取全部()
+            if 状态 is None:
+                状态 = 初始状态()
+                self._已记录 = dict(状态)
+                self._待写 = dict(状态)
+                self._写出()
+        self._状态 = 状态
+        return 状态
+
+    def _读取全部(self):
+        """读取检查点并重放日志（持进程锁调用）"""
+        状态 = None
+        self._日志条数 = 0
+        self._偏移 = 0
+        self._检查点标识 = _文件标识(self.状态文件)
+        if self._检查点标识 is not None:
+            with open(self.状态文件, "r", encoding="utf-8") as f:
+                状态 = json.load(f)
+        if os.path.exists(self.日志文件):
+            for 增量 in self._读日志():
+                状态 = 状态 if 状态 is not None else {}
+                状态.update(增量.get("set", {}))
+                for k in 增量.get("del", []):
+                    状态.pop(k, None)
+        if 状态 is not None:
+            self._已记录 = dict(状态)
+        return 状态
+
+    def _读日志(self):
+        """从 _偏移 起逐条产出完整的增量；残缺尾行（崩溃时写了一半）被截掉，避免后续追加与之粘连"""
+        with open(self.日志文件, "rb") as f:
+            f.seek(self._偏移)
+            for 行 in f:
+                try:
+                    增量 = json.loads(行)
+                except ValueError:
+                    break
+                if not 行.endswith(b"\n"):
+                    break
+                self._偏移 += len(行)
+                self._日志条数 += 1
+                yield 增量
+        if self._偏移 < os.path.getsize(self.日志文件):
+            with open(self.日志文件, "r+b") as f:
+                f.truncate(self._偏移)
+
+    # --- 多进程协调 ---
+    def _已变化(self) -> bool:
+        try:
+            日志大小 = os.path.getsize(self.日志文件)
+        except FileNotFoundError:
+            日志大小 = 0
+        return 日志大小 != self._偏移 or _文件标识(self.状态文件) != self._检查点标识
+
+    def 追读(self):
+        """
+        读入其他进程写出的增量（持进程锁、持 _锁 调用），原地更新调用方的状态字典；
+        本进程尚未写出的键以本进程为准
+        """
+        if self._状态 is None or not self._已变化():
+            return
+        if _文件标识(self.状态文件) != self._检查点标识 or os.path.getsize(self.日志文件) < self._偏移:
+            新状态 = self._读取全部() or {}
+            变化 = {k: v for k, v in 新状态.items() if self._状态.get(k, _缺失) != v}
+            删除 = [k for k in self._状态 if k not in 新状态]
+        else:
+            变化, 删除 = {}, []
+            for 增量 in self._读日志():
+                变化.update(增量.get("set", {}))
+                for k in 增量.get("del", []):
+                    变化.pop(k, None)
+                    删除.append(k)
+        for k, v in 变化.items():
+            self._已记录[k] = v
+            if k not in self._待写 and k not in self._待删:
+                self._状态[k] = v
+        for k in 删除:
+            self._已记录.pop(k, None)
+            if k not in self._待写:
+                self._状态.pop(k, None)
+
+    @contextmanager
+    def 独占(self, 状态: dict):
+        """跨进程读-改-写：进入时已读入其他进程的最新写入，退出时本次修改已写出到日志"""
+        with self.进程锁.独占():
+            self.记录(状态)  # 先登记本进程尚未登记的修改，追读时不被覆盖
+            with self._锁:
+                self.追读()
+            yield 状态
+            self.记录(状态)
+            with self._锁:
+                self._写出()
+
+    def 刷新(self, 状态: dict):
+        """只读方：把其他进程的写入读进 状态（无变化时不加锁、不读文件）"""
+        if not self._已变化():
+            return
+        self.记录(状态)
+        with self.进程锁.共享(), self._锁:
+            self.追读()
+
+    # --- 写入路径 ---
+    def 记录(self, 状态: dict):
+        """登记一次状态变化（只进缓冲，不触盘）"""
+        with self._锁:
+            self._状态 = 状态
+            变化 = {k: v for k, v in 状态.items() if self._已记录.get(k, _缺失) != v}
+            删除 = [k for k in self._已记录 if k not in 状态]
+            if not 变化 and not 删除:
+                return
+            self._待写.update(变化)
+            self._待删.difference_update(变化)
+            for k in 删除:
+                self._待写.pop(k, None)
+                self._待删.add(k)
+            self._已记录 = dict(状态)
+
+    def _写出(self):
+        """缓冲中的全部变化合并为一条增量追加到日志（持进程锁、持 _锁 调用；不 fsync）"""
+        if not self._待写 and not self._待删:
+            return
+        增量 = {"set": self._待写}
+        if self._待删:
+            增量["del"] = sorted(self._待删)
+        with open(self.日志文件, "a", encoding="utf-8") as f:
+            f.write(json.dumps(增量, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._偏移 = f.tell()
+        self._日志条数 += 1
+        self._待写 = {}
+        self._待删 = set()
+        self._未同步 = True
+
+    def 提交(self):
+        """组提交：写出缓冲中的变化，本进程自上次提交以来写出的增量一次 fsync"""
+        with self.进程锁.独占(), self._锁:
+            if not self._待写 and not self._待删 and not self._未同步:
+                return
+            self.追读()
+            self._写出()
+            with open(self.日志文件, "a", encoding="utf-8") as f:
+                os.fsync(f.fileno())
+            self._未同步 = False
+            if self._日志条数 >= self.检查点阈值:
+                self._检查点()
+
+    def 检查点(self):
+        with self.进程锁.独占(), self._锁:
+            self.追读()
+            self._写出()
+            self._检查点()
+
+    def _检查点(self):
+        """持进程锁调用；_已记录 须已包含日志中的全部增量"""
+        临时文件 = self.状态文件 + ".tmp"
+        with open(临时文件, "w", encoding="utf-8") as f:
+            json.dump(self._已记录, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(临时文件, self.状态文件)
+        _同步目录(os.path.dirname(os.path.abspath(self.状态文件)))
+        # 检查点已落盘，之前的日志全部失效
+        with open(self.日志文件, "w", encoding="utf-8"):
+            pass
+        self._日志条数 = 0
+        self._偏移 = 0
+        self._检查点标识 = _文件标识(self.状态文件)
+        self._未同步 = False
+
+    def 收起(self):
+        """空闲时释放锁文件描述符（下次加锁时重新打开）"""
+        self.进程锁.收起()
+
+    def 关闭(self):
+        """停止定时线程，提交剩余缓冲并写检查点"""
+        self._停止.set()
+        if self._定时线程 is not None:
+            self._定时线程.join(timeout=1.0)
+        self.提交()
+        if self._日志条数:
+            self.检查点()
+        self.进程锁.关闭()
+
+    def _定时提交(self, 间隔):
+        while not self._停止.wait(间隔):
+            self.提交()
+
+
+def _文件标识(路径):
+    try:
+        信息 = os.stat(路径)
+    except FileNotFoundError:
+        return None
+    return 信息.st_ino, 信息.st_mtime_ns, 信息.st_size
+
+
+def _同步目录(目录):
+    """fsync 目录项，保证 rename 本身持久化（Windows 不支持，跳过）"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(目录, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
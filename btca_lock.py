@@ -0,0 +1,77 @@
+"""
+BTCA 跨进程文件锁（fcntl.flock）
+
+多个进程（Streamlit worker、与 GUI 同时运行的 CLI、批处理）打开同一数据目录时，
+生命体征日志与审计日志的写入都在该锁内完成：持锁 → 读入其他进程的新写入 → 修改 → 写出 → 解锁。
+
+- 同一进程内可重入：线程之间先经 threading.RLock 互斥，只有最外层才真正加 / 解 flock
+- 独占()：读-改-写；共享()：只读（可与其他进程的 共享() 并行）
+- 没有 fcntl 的平台（Windows）退化为仅进程内互斥
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class BTCA进程锁:
+    """锁文件上的 flock，进程内可重入"""
+
+    def __init__(self, 路径):
+        self.路径 = 路径
+        self._线程锁 = threading.RLock()
+        self._fd = None
+        self._深度 = 0
+        self._独占 = False
+
+    def _flock(self, 操作: str):
+        """操作："EX" / "SH" / "UN"；无 fcntl 时不做任何事"""
+        if fcntl is None:
+            return
+        if self._fd is None:
+            self._fd = os.open(self.路径, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, getattr(fcntl, "LOCK_" + 操作))
+
+    @contextmanager
+    def _持有(self, 独占: bool):
+        with self._线程锁:
+            升级 = self._深度 > 0 and 独占 and not self._独占
+            if self._深度 == 0 or 升级:
+                # 共享 → 独占的升级不是原子的：升级期间其他进程可能插入写入，调用方应在拿到独占后重新读入
+                self._flock("EX" if 独占 else "SH")
+                self._独占 = 独占 or self._独占
+            self._深度 += 1
+            try:
+                yield
+            finally:
+                self._深度 -= 1
+                if self._深度 == 0:
+                    self._flock("UN")
+                    self._独占 = False
+                elif 升级:
+                    self._flock("SH")
+                    self._独占 = False
+
+    def 独占(self):
+        return self._持有(True)
+
+    def 共享(self):
+        return self._持有(False)
+
+    def 收起(self):
+        """未持锁时关闭锁文件描述符（空闲时释放；下次加锁时重新打开）"""
+        with self._线程锁:
+            if self._深度 == 0 and self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def 关闭(self):
+        with self._线程锁:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
@@ -17,45 +17,209 @@ import time
 import uuid
 import re
 import os
-import json
+import zlib
+import atexit
+import contextlib
 import hashlib
+import heapq
+import threading
+from collections import Counter, deque
 from datetime import datetime
 
-import chromadb
-from openai import OpenAI
+from btca_antibody import BTCA抗体库
+from btca_audit import BTCA审计写入器
+from btca_dialogue import BTCA会话记忆
+from btca_cache import BTCA检索缓存
+from btca_embedding import BTCA嵌入服务, 余弦相似度
+from btca_journal import BTCA状态日志
+from btca_lock import BTCA进程锁
+from btca_matcher import BTCA模式自动机
+from btca_metrics import BTCA剖析器, 默认指标
+from btca_packer import BTCA上下文打包器
+from btca_prompt import BTCA提示词模板
+from btca_ratelimit import BTCA限流器
+from btca_respcache import BTCA回复缓存
 
 
 # ============================================================
 # M02: DMA管理器 + M03: 端粒管理器 + M04: 代谢调度器
 # ============================================================
+def 打开Chroma客户端(数据目录, 设置=None):
+    """chromadb.PersistentClient；多个进程同时首次打开同一目录时初始化会互相冲突，在 chroma.lock 上串行"""
+    import chromadb
+    参数 = {"settings": 设置} if 设置 is not None else {}
+    锁 = BTCA进程锁(os.path.join(数据目录, "chroma.lock"))
+    try:
+        with 锁.独占():
+            return chromadb.PersistentClient(path=数据目录, **参数)
+    finally:
+        锁.关闭()
+
+
+class _目录占用:
+    """数据目录磁盘占用的增量统计：只重新列举 mtime 变化的目录，只重新 stat 可能增长的文件"""
+
+    # 写完即不再变化的文件（已轮转的审计段及其索引、剖析结果、迁移备份）只 stat 一次
+    不可变后缀 = (".jsonl.gz", ".jsonl.gz.idx", ".prof", ".migrated")
+
+    def __init__(self, 根目录, 排除=("tenants",)):
+        """排除：根目录下不计入的子目录（默认租户的根目录下还存放着其他租户）"""
+        self.根目录 = 根目录
+        self.排除 = set(排除)
+        self._目录 = {}  # 目录 → (mtime_ns, 子目录列表, {文件: 大小}, 可变文件列表)
+
+    def _扫描(self, 目录, mtime):
+        子目录, 大小表, 可变 = [], {}, []
+        for 项 in os.scandir(目录):
+            if 项.is_dir(follow_symlinks=False):
+                if not (目录 == self.根目录 and 项.name in self.排除):
+                    子目录.append(项.path)
+            elif 项.is_file(follow_symlinks=False):
+                大小表[项.path] = 项.stat().st_size
+                if not 项.name.endswith(self.不可变后缀):
+                    可变.append(项.path)
+        条目 = self._目录[目录] = (mtime, 子目录, 大小表, 可变)
+        return 条目
+
+    def 总量(self) -> int:
+        总计, 待扫 = 0, [self.根目录]
+        while 待扫:
+            目录 = 待扫.pop()
+            try:
+                mtime = os.stat(目录).st_mtime_ns
+            except FileNotFoundError:
+                self._目录.pop(目录, None)
+                continue
+            条目 = self._目录.get(目录)
+            if 条目 is None or 条目[0] != mtime:
+                条目 = self._扫描(目录, mtime)
+            _, 子目录, 大小表, 可变 = 条目
+            for 文件 in 可变:
+                try:
+                    大小表[文件] = os.stat(文件).st_size
+                except FileNotFoundError:
+                    大小表[文件] = 0
+            总计 += sum(大小表.values())
+            待扫.extend(子目录)
+        return 总计
+
+
 class BTCA存储器:
     """Ⅲ层持久状态管理：DMA存储 + 生命体征 + 审计日志"""
 
-    def __init__(self, 数据目录="./btca_memory"):
-        os.makedirs(数据目录, exist_ok=True)
-
-        # M02: DMA向量数据库（ChromaDB持久化）
-        self.chroma_client = chromadb.PersistentClient(path=数据目录)
-        self.集合 = self.chroma_client.get_or_create_collection(name="BTCA_DMA_V5")
+    默认集合名 = "BTCA_DMA_V5"
+    冷层后缀 = ".cold"  # "." 不会出现在租户名中，冷层集合名不会与其他租户的热层冲突
 
-        # 生命体征状态文件
+    def __init__(self, 数据目录="./btca_memory", 提交间隔=None, chroma_client=None, 集合名=None,
+                 检索缓存容量=512, 持久化检索缓存=False, 嵌入服务=None, 指标=None, 去重阈值=0.9,
+                 热层上限=2000, 降级策略="lru", 冷层回退阈值=0.45, 访问落盘间隔=30.0, 打包器=None):
+        """
+        数据目录：生命体征 / 审计 / 抗体库所在目录
+        chroma_client / 集合名：多租户时共享同一个 Chroma 客户端，各租户使用独立集合；
+            chroma_client 也可以是返回客户端的无参可调用对象（首次读写 DMA 时才调用）
+        检索缓存容量：检索DMA 的 LRU 条目数，0 为关闭；持久化检索缓存 时落盘到 retrieval_cache.json
+        嵌入服务：多租户时共享；默认在 数据目录/embedding_cache 建立向量缓存
+        指标：分阶段耗时注册表，默认为进程级共享的 默认指标
+        去重阈值：回写片段与热层 / 冷层中最近邻（或同批片段）的余弦相似度达到该值即视为近重复、不再写入；None 关闭
+        热层上限：热层（每轮检索的集合）最多保留的片段数，超出时按 降级策略（"lru" / "lfu"）
+            把最冷的约 10% 移入冷层集合；None 关闭分层
+        冷层回退阈值：热层结果不足或最佳余弦相似度低于该值时才查询冷层，冷层命中的片段晋升回热层
+        访问落盘间隔：片段的 access_count / last_hit 在内存中累计，至多每隔该秒数写回一次元数据
+        打包器：把检索到的片段按相关度装入 token 预算生成 dma_summary，默认 BTCA上下文打包器()
+        """
+        os.makedirs(数据目录, exist_ok=True)
+        self.数据目录 = 数据目录
+        self.指标 = 指标 or 默认指标
+
+        # 状态/抗体/审计的进程内互斥（并发会话共享同一存储器时保证计数器一致）
+        self.锁 = threading.RLock()
+
+        # M02: DMA向量数据库（ChromaDB持久化）：chromadb 的导入、客户端与集合都推迟到首次读写
+        self._chroma_client = chroma_client
+        self.集合名 = 集合名 or self.默认集合名
+        self._集合 = None
+        self._冷集合 = None
+        self._冷层条数 = None  # 首次需要时 count() 一次，此后随迁移增减
+        self.去重阈值 = 去重阈值
+
+        # DMA 分层：热层有上限，冷层只在热层未命中时查询
+        self.热层上限 = 热层上限
+        self.降级策略 = 降级策略
+        self.冷层回退阈值 = 冷层回退阈值
+        self.访问落盘间隔 = 访问落盘间隔
+        self._访问计数 = Counter()  # 片段ID → 尚未写回的命中次数
+        self._最近访问 = {}         # 片段ID → 最近命中时间
+        self._上次访问落盘 = time.monotonic()
+        self._分层锁 = threading.RLock()
+        self._打开锁 = threading.Lock()
+        # 向量由嵌入服务计算后直接交给 Chroma，集合自带的嵌入函数不会被触发
+        self.嵌入服务 = 嵌入服务 or BTCA嵌入服务(os.path.join(数据目录, "embedding_cache"))
+        self.打包器 = 打包器 or BTCA上下文打包器()
+        self.检索缓存 = BTCA检索缓存(
+            容量=检索缓存容量,
+            持久化文件=os.path.join(数据目录, "retrieval_cache.json") if 持久化检索缓存 else None,
+        )
+
+        # 生命体征状态文件（检查点 + 预写日志，每轮组提交一次）
         self.状态文件 = os.path.join(数据目录, "btca_state.json")
-        if os.path.exists(self.状态文件):
-            with open(self.状态文件, "r", encoding="utf-8") as f:
-                self.状态 = json.load(f)
-        else:
-            self.状态 = self._初始状态()
+        self.状态日志 = BTCA状态日志(self.状态文件, 提交间隔=提交间隔)
+        self.状态 = self.状态日志.加载或初始化(self._初始状态)
+        atexit.register(self.关闭)
 
-        # M07: 审计日志文件（JSON Lines格式，追加写入）
+        # M07: 审计日志文件（JSON Lines格式，缓冲追加写入，按大小/日期轮转压缩）
         self.审计文件 = os.path.join(数据目录, "audit_log.jsonl")
-
-        # M05: 免疫记忆（适应性抗体库）
-        self.抗体文件 = os.path.join(数据目录, "antibodies.json")
-        if os.path.exists(self.抗体文件):
-            with open(self.抗体文件, "r", encoding="utf-8") as f:
-                self.抗体库 = json.load(f)
-        else:
-            self.抗体库 = []
+        self.审计 = BTCA审计写入器(数据目录)
+
+        # M05: 免疫记忆（适应性抗体库，SQLite 索引存储；旧 antibodies.json 首次打开时迁移）
+        self.抗体库 = BTCA抗体库(数据目录)
+
+        self._占用 = _目录占用(数据目录)
+        self._占用锁 = threading.Lock()
+
+        # 进行中的轮次数：租户被驱逐时 释放() 的关闭推迟到最后一轮结束
+        self._使用数 = 0
+        self._待关闭 = False
+        self._使用锁 = threading.Lock()
+
+    @property
+    def chroma_client(self):
+        with self._打开锁:
+            if self._chroma_client is None:
+                self._chroma_client = 打开Chroma客户端(self.数据目录)
+            elif callable(self._chroma_client):
+                self._chroma_client = self._chroma_client()
+            return self._chroma_client
+
+    @property
+    def 集合(self):
+        if self._集合 is None:
+            客户端 = self.chroma_client
+            with self._打开锁:
+                if self._集合 is None:
+                    self._集合 = 客户端.get_or_create_collection(name=self.集合名)
+        return self._集合
+
+    @property
+    def 冷集合(self):
+        if self._冷集合 is None:
+            客户端 = self.chroma_client
+            with self._打开锁:
+                if self._冷集合 is None:
+                    self._冷集合 = 客户端.get_or_create_collection(name=self.集合名 + self.冷层后缀)
+        return self._冷集合
+
+    def 预热(self, 后台=True):
+        """提前打开 Chroma 集合并加载嵌入模型；后台=True 时在守护线程中进行，返回该线程"""
+        def 执行():
+            self.集合
+            self.嵌入服务.预热()
+
+        if not 后台:
+            执行()
+            return None
+        线程 = threading.Thread(target=执行, name="btca-warmup", daemon=True)
+        线程.start()
+        return 线程
 
     @staticmethod
     def _初始状态():
@@ -71,20 +235,185 @@ class BTCA存储器:
         }
 
     # --- M02: DMA读写 ---
-    def 注入基因(self, 片段列表, 来源="rlt_verified"):
+    def 注入基因(self, 片段列表, 来源="rlt_verified", 统计: dict = None) -> int:
+        """
+        写入前做近重复抑制（见 去重阈值）；返回实际写入的条数
+        统计：可选的审计字典，写入嵌入 / 去重 / Chroma 写入耗时与被抑制的条数
+        """
         if not 片段列表:
-            return
-        ID列表 = [f"DMA-{int(time.time())}-{uuid.uuid4().hex[:6]}" for _ in 片段列表]
-        self.集合.add(documents=片段列表, ids=ID列表)
-        self.状态["DMA版本"] += 1
-        self.保存状态()
-
-    def 检索DMA(self, 查询文本, 数量=3):
+            return 0
+        with self.指标.计时("embedding", 统计):
+            向量 = self.嵌入服务.嵌入(片段列表)
+        if self.去重阈值 is not None:
+            with self.指标.计时("dedup", 统计):
+                保留 = self._去重(向量)
+            if 统计 is not None:
+                统计["writeback_deduplicated"] = len(片段列表) - len(保留)
+            片段列表 = [片段列表[i] for i in 保留]
+            向量 = [向量[i] for i in 保留]
+            if not 片段列表:
+                return 0
+        现在 = int(time.time())
+        ID列表 = [f"DMA-{现在}-{uuid.uuid4().hex[:6]}" for _ in 片段列表]
+        with self.指标.计时("chroma_add", 统计):
+            self.集合.add(documents=片段列表, ids=ID列表, embeddings=向量,
+                        metadatas=[{"source": 来源, "created_at": 现在} for _ in 片段列表])
+        with self.事务():
+            self.状态["DMA版本"] += 1
+        self._检查热层容量(统计)
+        return len(片段列表)
+
+    def _去重(self, 向量) -> list:
+        """返回应写入的下标：先去掉同批内的近重复，再与热层（及非空的冷层）中的最近邻比较"""
+        保留 = []
+        for i, v in enumerate(向量):
+            if not 保留 or 余弦相似度([v], [向量[j] for j in 保留]).max() < self.去重阈值:
+                保留.append(i)
+        层列表 = [self.集合]
+        if self.热层上限 is not None and self._冷层非空():
+            层列表.append(self.冷集合)
+        for 集合 in 层列表:
+            if not 保留:
+                break
+            try:
+                近邻 = 集合.query(query_embeddings=[向量[i] for i in 保留], n_results=1,
+                              include=["embeddings"])["embeddings"]
+            except Exception:
+                continue  # 空集合等情况：不做该层的比较
+            保留 = [i for i, 邻 in zip(保留, 近邻)
+                  if len(邻) == 0 or 余弦相似度([向量[i]], 邻).max() < self.去重阈值]
+        return 保留
+
+    def 检索DMA(self, 查询文本, 数量=3, 统计: dict = None, 含冷层=False):
+        """
+        先查热层；热层未命中（见 冷层回退阈值）或 含冷层=True 时再查冷层，合并后取最相似的 数量 条
+        统计：可选的审计字典，写入本次是否命中检索缓存、冷层命中数及嵌入 / Chroma 查询耗时
+        """
+        return [h[1] for h in self.检索DMA命中(查询文本, 数量, 统计, 含冷层)]
+
+    def 检索DMA命中(self, 查询文本, 数量=3, 统计: dict = None, 含冷层=False) -> list:
+        """同 检索DMA，返回按相似度降序的 [(片段ID, 文本, 余弦相似度)]"""
+        键 = None if 含冷层 else self.检索缓存.键(查询文本, self.状态["DMA版本"], 数量)
+        缓存项 = self.检索缓存.读取(键) if 键 else None
+        if 统计 is not None:
+            统计["retrieval_cache_hit"] = 缓存项 is not None
+        if 缓存项 is not None:
+            # 缓存项为 [片段ID, 文本, 相似度]（旧版缓存文件中为纯文本）
+            命中 = [(None, 项, 0.0) if isinstance(项, str) else tuple(项) + (0.0,) * (3 - len(项))
+                  for 项 in 缓存项]
+            self._记录访问([h[0] for h in 命中 if h[0]])
+            return 命中
         try:
-            结果 = self.集合.query(query_texts=[查询文本], n_results=数量)
-            return 结果['documents'][0] if 结果['documents'][0] else []
+            with self.指标.计时("embedding", 统计):
+                向量 = self.嵌入服务.嵌入([查询文本])
+            with self.指标.计时("chroma_query", 统计):
+                命中 = self._查询层(self.集合, 向量, 数量)
+            if self.热层上限 is not None and self._冷层非空() and (
+                    含冷层 or len(命中) < 数量 or 命中[0][2] < self.冷层回退阈值):
+                with self.指标.计时("chroma_query_cold", 统计):
+                    冷命中 = self._查询层(self.冷集合, 向量, 数量)
+                命中 = sorted(命中 + 冷命中, key=lambda h: -h[2])[:数量]
+                冷ID = {h[0] for h in 冷命中} & {h[0] for h in 命中}
+                if 统计 is not None:
+                    统计["dma_cold_hits"] = len(冷ID)
+                if 冷ID:
+                    self._晋升(list(冷ID), 统计)
         except Exception:
             return []
+        self._记录访问([h[0] for h in 命中])
+        if 键:
+            self.检索缓存.写入(键, [list(h) for h in 命中])
+        return 命中
+
+    @staticmethod
+    def _查询层(集合, 向量, 数量) -> list:
+        """返回按相似度降序的 [(片段ID, 文本, 余弦相似度)]"""
+        结果 = 集合.query(query_embeddings=向量, n_results=数量, include=["documents", "embeddings"])
+        ID列表 = 结果["ids"][0]
+        if not ID列表:
+            return []
+        相似度 = 余弦相似度(向量, 结果["embeddings"][0])[0]
+        return sorted(zip(ID列表, 结果["documents"][0], 相似度.tolist()), key=lambda h: -h[2])
+
+    # --- M02: DMA 分层（热层有上限，冷层归档）---
+    def _冷层非空(self) -> bool:
+        if self._冷层条数 is None:
+            self._冷层条数 = self.冷集合.count()
+        return self._冷层条数 > 0
+
+    def _记录访问(self, ID列表):
+        if not ID列表 or self.热层上限 is None:
+            return
+        现在 = int(time.time())
+        with self._分层锁:
+            for i in ID列表:
+                self._访问计数[i] += 1
+                self._最近访问[i] = 现在
+
+    def 落盘访问统计(self, 强制=False):
+        """把累计的命中次数与最近命中时间写回热层元数据（access_count / last_hit）"""
+        with self._分层锁:
+            if not self._访问计数 or (not 强制 and
+                                  time.monotonic() - self._上次访问落盘 < self.访问落盘间隔):
+                return
+            计数, self._访问计数 = self._访问计数, Counter()
+            最近, self._最近访问 = self._最近访问, {}
+            self._上次访问落盘 = time.monotonic()
+            现有 = self.集合.get(ids=list(计数), include=["metadatas"])  # 已降级的片段不在其中
+            if not 现有["ids"]:
+                return
+            self.集合.update(ids=现有["ids"], metadatas=[
+                {"access_count": (m or {}).get("access_count", 0) + 计数[i], "last_hit": 最近[i]}
+                for i, m in zip(现有["ids"], 现有["metadatas"])])
+
+    def _检查热层容量(self, 统计: dict = None):
+        if self.热层上限 is not None and self.集合.count() > self.热层上限:
+            with self.指标.计时("dma_demote", 统计):
+                self.降级(int(self.热层上限 * 0.9))
+
+    def 降级(self, 目标条数: int) -> int:
+        """按 降级策略 把热层削减到 目标条数，被移出的片段写入冷层；返回移出条数"""
+        with self._分层锁:
+            self.落盘访问统计(强制=True)
+            元数据 = self.集合.get(include=["metadatas"])
+            超出 = len(元数据["ids"]) - 目标条数
+            if 超出 <= 0:
+                return 0
+
+            def 热度(项):
+                m = 项[1] or {}
+                最近 = m.get("last_hit", m.get("created_at", 0))
+                return (m.get("access_count", 0), 最近) if self.降级策略 == "lfu" else (最近, m.get("access_count", 0))
+
+            移出 = [i for i, _ in sorted(zip(元数据["ids"], 元数据["metadatas"]), key=热度)[:超出]]
+            self._冷层非空()
+            self._冷层条数 += self._迁移(self.集合, self.冷集合, 移出)
+        with self.事务():
+            self.状态["DMA版本"] += 1  # 热层内容变化：旧检索结果失效
+        return len(移出)
+
+    def _晋升(self, ID列表, 统计: dict = None):
+        """冷层命中的片段移回热层（热层因此超出上限时随即降级）"""
+        with self._分层锁:
+            self._冷层非空()
+            self._冷层条数 -= self._迁移(self.冷集合, self.集合, ID列表)
+        with self.事务():
+            self.状态["DMA版本"] += 1
+        self._检查热层容量(统计)
+
+    @staticmethod
+    def _迁移(源, 目标, ID列表, 批量=1000) -> int:
+        """先写目标再删源：中途失败最多留下两层各一份，不会丢失片段；返回迁移条数"""
+        条数 = 0
+        for 起 in range(0, len(ID列表), 批量):
+            数据 = 源.get(ids=ID列表[起:起 + 批量], include=["documents", "embeddings", "metadatas"])
+            if not 数据["ids"]:
+                continue
+            目标.upsert(ids=数据["ids"], documents=数据["documents"], embeddings=数据["embeddings"],
+                      metadatas=数据["metadatas"])
+            源.delete(ids=数据["ids"])
+            条数 += len(数据["ids"])
+        return 条数
 
     # --- M03: 端粒管理器（校准后的衰减模型）---
     def 端粒_tick(self, 压力系数=1.0):
@@ -94,11 +423,16 @@ class BTCA存储器:
         """
         基础消耗 = 0.05
         实际消耗 = 基础消耗 * max(1.0, min(压力系数, 3.0))
-        self.状态["端粒剩余"] = max(0.0, self.状态["端粒剩余"] - 实际消耗)
-        self.状态["总轮次"] += 1
-        self.保存状态()
+        with self.事务():
+            self.状态["端粒剩余"] = max(0.0, self.状态["端粒剩余"] - 实际消耗)
+            self.状态["总轮次"] += 1
         return 实际消耗
 
+    def 端粒_退还(self, 消耗):
+        """退还本轮已扣除的端粒（回复缓存命中且不计费时），总轮次不变"""
+        with self.事务():
+            self.状态["端粒剩余"] = min(self.状态["端粒最大值"], self.状态["端粒剩余"] + 消耗)
+
     def 端粒状态(self):
         t = self.状态["端粒剩余"]
         if t <= 0:
@@ -112,21 +446,24 @@ class BTCA存储器:
     # --- M04: 代谢调度器 ---
     def 执行代谢(self, 消耗Token数):
         能量消耗 = 消耗Token数 * 0.1
-        self.状态["能量储备"] = max(0.0, self.状态["能量储备"] - 能量消耗)
-        self.保存状态()
+        with self.事务():
+            self.状态["能量储备"] = max(0.0, self.状态["能量储备"] - 能量消耗)
         return 能量消耗
 
     # --- M07: 审计日志 ---
     def 写入审计(self, 记录: dict):
-        记录["timestamp"] = datetime.now().isoformat()
-        记录["dma_version"] = self.状态["DMA版本"]
-        with open(self.审计文件, "a", encoding="utf-8") as f:
-            f.write(json.dumps(记录, ensure_ascii=False) + "\n")
+        with self.锁:
+            记录["timestamp"] = datetime.now().isoformat()
+            记录["dma_version"] = self.状态["DMA版本"]
+            记录["retrieval_cache"] = self.检索缓存.统计()
+        with self.指标.计时("audit_write"):
+            self.审计.写入(记录)
 
     # --- M08: 快照注入器 ---
-    def 获取环境快照(self, 查询文本):
-        dma片段 = self.检索DMA(查询文本)
-        DMA摘要 = " | ".join(dma片段) if dma片段 else "初始净值状态"
+    def 获取环境快照(self, 查询文本, 审计: dict = None):
+        命中 = self.检索DMA命中(查询文本, self.打包器.候选数, 统计=审计)
+        with self.指标.计时("dma_pack", 审计):
+            DMA摘要 = self.打包器.打包(命中, 审计) if 命中 else "初始净值状态"
         return {
             "telomere_remaining": round(self.状态["端粒剩余"], 2),
             "telomere_max": round(self.状态["端粒最大值"], 2),
@@ -140,14 +477,113 @@ class BTCA存储器:
             "chromosome_check_summary": "待审查",
         }
 
+    # --- 多进程协调（同一数据目录可被多个进程同时打开）---
+    @contextlib.contextmanager
+    def 事务(self):
+        """
+        生命体征的跨进程读-改-写：进入时已读入其他进程写出的修改，退出时本次修改已写出到日志
+        （仅 write；fsync 仍由每轮一次的 提交() 负责）
+        """
+        with self.锁, self.状态日志.独占(self.状态) as 状态:
+            yield 状态
+
+    def 重置体征(self):
+        """
+        生命体征恢复初始值；DMA 内容不变，DMA版本 仍向前推进：
+        检索缓存 / 回复缓存以 DMA版本 为键，版本回退会让旧条目再次命中
+        """
+        with self.事务() as 状态:
+            DMA版本 = 状态.get("DMA版本", 0)
+            状态.update(self._初始状态())
+            状态["DMA版本"] = DMA版本 + 1
+        self.提交()
+
+    def 刷新状态(self):
+        """读入其他进程写出的修改；没有新写入时只花两次 stat"""
+        with self.锁:
+            self.状态日志.刷新(self.状态)
+
+    def 状态快照(self) -> dict:
+        """供只读方（仪表盘等）使用的一致副本"""
+        with self.锁:
+            self.状态日志.刷新(self.状态)
+            return dict(self.状态)
+
     # --- 持久化 ---
+    def 存储占用(self) -> int:
+        """本存储器数据目录的磁盘占用（字节，不含其他租户的子目录）"""
+        with self._占用锁:
+            return self._占用.总量()
+
     def 保存状态(self):
-        with open(self.状态文件, "w", encoding="utf-8") as f:
-            json.dump(self.状态, f, ensure_ascii=False, indent=2)
+        """登记状态变化（仅进入日志缓冲，由 提交() 统一落盘）"""
+        self.状态日志.记录(self.状态)
+
+    def 提交(self):
+        """组提交：本轮全部状态变化一次写入日志并 fsync，抗体命中计数一并落盘"""
+        with self.锁:
+            self.状态日志.记录(self.状态)
+        self.状态日志.提交()
+        self.抗体库.提交()
+        if self._访问计数:
+            self.落盘访问统计()
+
+    def 导出快照(self, 路径) -> dict:
+        """生命体征、抗体、两层 DMA（含向量）写入单个校验归档，见 btca_snapshot"""
+        from btca_snapshot import 导出
+        return 导出(self, 路径)
+
+    def 恢复快照(self, 路径, 覆盖=False) -> dict:
+        """从 导出快照 的归档恢复（向量直接装入，不重新嵌入）；使用本存储器的免疫自动机在下一次扫描时重建"""
+        from btca_snapshot import 恢复
+        return 恢复(self, 路径, 覆盖)
+
+    @contextlib.contextmanager
+    def 使用中(self):
+        """一轮推演期间持有；已被 释放() 的存储器不再接受新轮次"""
+        with self._使用锁:
+            if self._待关闭:
+                raise RuntimeError("存储器已被释放（租户已驱逐），请重新获取调度器")
+            self._使用数 += 1
+        try:
+            yield self
+        finally:
+            with self._使用锁:
+                self._使用数 -= 1
+                关闭 = self._待关闭 and self._使用数 == 0
+            if 关闭:
+                self.关闭()
+
+    def 释放(self):
+        """租户驱逐时调用：没有进行中的轮次则立即关闭，否则由最后一轮结束时关闭"""
+        with self._使用锁:
+            self._待关闭 = True
+            if self._使用数:
+                return
+        self.关闭()
+
+    def 收起句柄(self):
+        """空闲时释放文件描述符：状态日志锁、审计活动段及其锁文件（下次使用时自动重新打开）"""
+        self.状态日志.收起()
+        self.审计.收起()
+
+    def 关闭(self):
+        """提交剩余状态并写检查点（租户被驱逐或进程退出时调用）"""
+        with self.锁:
+            self.状态日志.记录(self.状态)
+        self.状态日志.关闭()
+        self.审计.关闭()
+        self.抗体库.关闭()
+        if self._访问计数:
+            try:
+                self.落盘访问统计(强制=True)
+            except Exception:
+                pass  # 访问统计只影响降级次序，退出时写不回不影响数据
+        self.检索缓存.保存(self.状态["DMA版本"])
+        atexit.unregister(self.关闭)
 
     def 保存抗体库(self):
-        with open(self.抗体文件, "w", encoding="utf-8") as f:
-            json.dump(self.抗体库, f, ensure_ascii=False, indent=2)
+        self.抗体库.提交()
 
 
 # ============================================================
@@ -172,27 +608,57 @@ class BTCA免疫系统:
 
     def __init__(self, 存储器: BTCA存储器):
         self.存储 = 存储器
+        self._先天索引 = {模式["id"]: 模式 for 模式 in self.先天模式库}
+        self._重建自动机()
+        self._同步抗体()
+
+    def _重建自动机(self):
+        """先天模式 + 抗体关键词编译为同一个自动机，单趟扫描；抗体部分由 _同步抗体 从水位 0 重新登记"""
+        self.自动机 = BTCA模式自动机()
+        for 模式 in self.先天模式库:
+            self.自动机.添加(模式["id"], 模式["keywords"])
+        self._抗体水位 = 0  # 已编译进自动机的抗体库最大 seq
+        self._抗体代数 = self.存储.抗体库.删除代数()
+
+    def _同步抗体(self):
+        """
+        把抗体库中 seq 超过水位的抗体增量登记进自动机（只读关键词）；
+        抗体库有过删除（剪枝 / 快照恢复，包括其他进程中的）则先整体重建
+        """
+        if self.存储.抗体库.删除代数() != self._抗体代数:
+            self._重建自动机()
+        新增, self._抗体水位 = self.存储.抗体库.新增抗体(self._抗体水位)
+        for _, 抗体ID, 关键词列表 in 新增:
+            if 抗体ID not in self.自动机:
+                self.自动机.添加(抗体ID, 关键词列表)
+
+    def 全量扫描(self, 输入文本: str) -> tuple:
+        """单趟扫描先天模式库 + 抗体库，返回 (先天威胁, 适应威胁)"""
+        先天威胁, 适应威胁 = [], []
+        with self.存储.锁:
+            self._同步抗体()
+            抗体命中 = []
+            for 模式ID in self.自动机.扫描(输入文本):
+                if 模式ID in self._先天索引:
+                    先天威胁.append(self._先天索引[模式ID])
+                else:
+                    抗体命中.append(模式ID)
+            if 抗体命中:
+                # 命中计数只进内存，随本轮 存储.提交() 批量落盘
+                self.存储.抗体库.记录命中(抗体命中)
+                适应威胁 = [a for a in map(self.存储.抗体库.获取, 抗体命中) if a is not None]
+        return 先天威胁, 适应威胁
 
     def 先天扫描(self, 输入文本: str) -> list:
         """M05.scan_innate: 用先天模式库扫描输入"""
-        威胁列表 = []
-        文本 = 输入文本.lower()
-        for 模式 in self.先天模式库:
-            if any(kw.lower() in 文本 for kw in 模式["keywords"]):
-                威胁列表.append(模式)
-        return 威胁列表
+        with self.存储.锁:
+            self._同步抗体()
+            命中 = self.自动机.扫描(输入文本)
+        return [self._先天索引[i] for i in 命中 if i in self._先天索引]
 
     def 适应性扫描(self, 输入文本: str) -> list:
         """M05.scan_adaptive: 用抗体库扫描输入"""
-        威胁列表 = []
-        文本 = 输入文本.lower()
-        for 抗体 in self.存储.抗体库:
-            if any(kw.lower() in 文本 for kw in 抗体.get("keywords", [])):
-                抗体["hit_count"] = 抗体.get("hit_count", 0) + 1
-                威胁列表.append(抗体)
-        if 威胁列表:
-            self.存储.保存抗体库()
-        return 威胁列表
+        return self.全量扫描(输入文本)[1]
 
     def 学习新抗体(self, 模式签名: str, 关键词列表: list, 来源: str):
         """M05.learn: 从新发现的异常中生成抗体"""
@@ -204,27 +670,37 @@ class BTCA免疫系统:
             "created_at": datetime.now().isoformat(),
             "hit_count": 0
         }
-        self.存储.抗体库.append(新抗体)
-        self.存储.保存抗体库()
+        with self.存储.锁:
+            self.存储.抗体库.添加(新抗体)
+            self.自动机.添加(新抗体["id"], 关键词列表)
         return 新抗体
 
+    def 剪除冷抗体(self, 最多命中=0, 闲置天数=30) -> list:
+        """从抗体库与自动机中移除长期未命中的抗体，返回被移除的 id"""
+        with self.存储.锁:
+            冷抗体 = self.存储.抗体库.剪枝(最多命中, 闲置天数)
+            for 抗体ID in 冷抗体:
+                self.自动机.移除(抗体ID)
+        return 冷抗体
+
     def treg检查(self, 本轮是否异常: bool) -> str:
         """M05.treg_check: K4执行面 — 5%容错窗口"""
-        if 本轮是否异常:
-            self.存储.状态["异常计数"] += 1
-
-        总轮次 = max(self.存储.状态["总轮次"], 1)
-        异常比 = self.存储.状态["异常计数"] / 总轮次
-
-        if 异常比 > 0.05:
-            self.存储.状态["免疫状态"] = f"ALERT:容错超限({异常比:.1%})"
-            return "OVER_THRESHOLD"
-        elif 异常比 > 0.03:
-            self.存储.状态["免疫状态"] = f"ELEVATED({异常比:.1%})"
-            return "ELEVATED"
-        else:
-            self.存储.状态["免疫状态"] = "NORMAL"
-            return "NORMAL"
+        with self.存储.事务() as 状态:
+            if 本轮是否异常:
+                状态["异常计数"] += 1
+
+            总轮次 = max(状态["总轮次"], 1)
+            异常比 = 状态["异常计数"] / 总轮次
+
+            if 异常比 > 0.05:
+                状态["免疫状态"] = f"ALERT:容错超限({异常比:.1%})"
+                return "OVER_THRESHOLD"
+            elif 异常比 > 0.03:
+                状态["免疫状态"] = f"ELEVATED({异常比:.1%})"
+                return "ELEVATED"
+            else:
+                状态["免疫状态"] = "NORMAL"
+                return "NORMAL"
 
 
 # ============================================================
@@ -275,7 +751,8 @@ class BTCA_RLT校验器:
                 continue
 
             # 第三重：免疫兼容性
-            免疫威胁 = self.免疫.先天扫描(提案) + self.免疫.适应性扫描(提案)
+            先天威胁, 适应威胁 = self.免疫.全量扫描(提案)
+            免疫威胁 = 先天威胁 + 适应威胁
             严重威胁 = [t for t in 免疫威胁 if t.get("severity") == "critical"]
             if 严重威胁:
                 结果.append((提案, "REJECT", f"免疫校验: {严重威胁[0]['name']}"))
@@ -291,33 +768,50 @@ class BTCA_RLT校验器:
 # M10: 循环检测器
 # ============================================================
 class BTCA循环检测器:
-    """K5执行面：检测判断是否进入循环强化"""
+    """
+    K5执行面：检测判断是否进入循环强化
+
+    每轮结论压缩为固定长度的 MinHash 签名（bottom-k：字符 n-gram 哈希值中最小的 k 个），
+    只在定长环形窗口中保留最近 窗口大小 轮的签名：内存与单次比较耗时都与会话长度无关。
+    """
+
+    签名长度 = 64
+    片长 = 3  # 字符 n-gram；比单字集合更能区分共享常用字的中文句子
 
     def __init__(self, 窗口大小=5, 重复阈值=0.8):
-        self.历史结论 = []
+        self.历史签名 = deque(maxlen=窗口大小)
+        self.已检测轮次 = 0
         self.窗口大小 = 窗口大小
         self.重复阈值 = 重复阈值
 
     def 检测(self, 当前结论: str) -> dict:
-        self.历史结论.append(当前结论)
-        if len(self.历史结论) < 3:
-            return {"is_cycle": False}
-
-        # 与最近N轮结论做简单相似度比较（基于字符重叠）
-        窗口 = self.历史结论[-self.窗口大小 - 1:-1]
-        for 历史 in 窗口:
-            相似度 = self._简单相似度(当前结论, 历史)
-            if 相似度 > self.重复阈值:
-                return {"is_cycle": True, "similarity": 相似度, "message": "K5: 检测到结论循环重复"}
-        return {"is_cycle": False}
-
-    @staticmethod
-    def _简单相似度(a: str, b: str) -> float:
+        签名 = self._签名(当前结论)
+        最高相似度 = 0.0
+        # 与原实现一致：累计满 3 轮结论后才开始判定
+        if self.已检测轮次 >= 2:
+            for 历史 in self.历史签名:
+                最高相似度 = max(最高相似度, self._估计相似度(签名, 历史))
+        self.历史签名.append(签名)
+        self.已检测轮次 += 1
+        if 最高相似度 > self.重复阈值:
+            return {"is_cycle": True, "similarity": 最高相似度, "message": "K5: 检测到结论循环重复"}
+        return {"is_cycle": False, "similarity": 最高相似度}
+
+    @classmethod
+    def _签名(cls, 文本: str) -> frozenset:
+        """文本 → bottom-k 签名（n-gram 的 CRC32 哈希中最小的 签名长度 个）"""
+        n = cls.片长
+        数据 = 文本.encode("utf-16-le")  # 按 UTF-16 码元切 n-gram，每个码元定长 2 字节
+        哈希 = {zlib.crc32(数据[i:i + 2 * n]) for i in range(0, max(len(数据) - 2 * n + 2, 2), 2)} if 文本 else set()
+        return frozenset(heapq.nsmallest(cls.签名长度, 哈希))
+
+    @classmethod
+    def _估计相似度(cls, a: frozenset, b: frozenset) -> float:
+        """bottom-k Jaccard 估计：在并集的最小 k 个哈希中，两边都有的比例（集合小于 k 时即精确值）"""
         if not a or not b:
             return 0.0
-        集a = set(a)
-        集b = set(b)
-        return len(集a & 集b) / max(len(集a | 集b), 1)
+        并集最小 = sorted(a | b)[:cls.签名长度]
+        return len(a.intersection(b, 并集最小)) / len(并集最小)
 
 
 # ============================================================
@@ -329,17 +823,9 @@ SYSTEM_PROMPT_V3 = """
 ## 三层合规声明
 - Ⅰ层（生命蓝图）：中心法则、表观遗传原则、免疫哲学 — 设计背景，非执行指令。
 - Ⅱ层（判断内核·原则面）：K1-K6原则、ATCG推演约束 — 本Prompt的核心约束。
-- Ⅲ层（系统组件·状态快照）：以下{{变量}}由外部引擎注入，本Prompt只读不写。
+- Ⅲ层（系统组件·状态快照）：末尾快照中的{{变量}}由外部引擎注入，本Prompt只读不写。
 - 红线六：蓝图不降格为指令，内核只含原则面，组件不在Prompt内模拟。
 
-## Ⅲ层状态快照（外部引擎注入，只读）
-- 端粒：{{telomere_remaining}} / {{telomere_max}} @{{snapshot_ts}}
-- 能量：{{energy_reserve}} tokens @{{snapshot_ts}}
-- DMA摘要：{{dma_summary}}
-- 免疫：{{immune_status}}
-- 染色体：{{chromosome_vector_22plus1}}
-（若变量为空则显示「—」，不自行编造数值。）
-
 ## 系统身份
 你是在GPT「生化介质」中运行的BTCA 3.0结构。
 
@@ -387,98 +873,371 @@ SYSTEM_PROMPT_V3 = """
 :DMA_Writeback "洞察内容"
 
 结尾：一句话总结判断立场，语气果断但不冷漠。
+
+## Ⅲ层状态快照（外部引擎注入，只读）
+- 端粒：{{telomere_remaining}} / {{telomere_max}} @{{snapshot_ts}}
+- 能量：{{energy_reserve}} tokens @{{snapshot_ts}}
+- DMA摘要：{{dma_summary}}
+- 免疫：{{immune_status}}
+- 染色体：{{chromosome_vector_22plus1}}
+（若变量为空则显示「—」，不自行编造数值。）
 """.strip()
 
+# 快照段位于末尾：其前的全部内容每轮逐字节一致，可命中服务端前缀缓存
+快照变量 = ("telomere_remaining", "telomere_max", "energy_reserve", "dma_summary",
+        "immune_status", "chromosome_vector_22plus1", "snapshot_ts")
+提示词模板 = BTCA提示词模板(SYSTEM_PROMPT_V3, 快照变量)
+
 
 # ============================================================
 # M01: 编排器（主调度）
 # ============================================================
+class BTCA流式回合:
+    """运行推演周期_流式 的返回值：可迭代的文本块流，迭代完毕后携带 回复 与 审计"""
+
+    def __init__(self):
+        self._块 = iter(())
+        self.回复 = None
+        self.审计 = None
+
+    def __iter__(self):
+        return self._块
+
+    def 关闭(self):
+        """提前放弃流：已收到的部分照常结算（token 计入代谢、写入审计，审计中标注 stream_abandoned）"""
+        self._块.close()
+
+
 class BTCA调度器:
     """Ⅲ层外部引擎主控"""
 
-    def __init__(self, API密钥: str):
-        if not API密钥:
+    模型 = "gpt-4-turbo-preview"
+
+    def __init__(self, API密钥: str, 存储: BTCA存储器 = None, 客户端=None, 限流器: BTCA限流器 = None,
+                 回复缓存: BTCA回复缓存 = None, 记忆工厂=None):
+        if not API密钥 and 客户端 is None:
             raise ValueError(
                 "未检测到 API 密钥。请设置环境变量 OPENAI_API_KEY 后重新启动。\n"
                 "  Linux/Mac: export OPENAI_API_KEY='sk-...'\n"
                 "  Windows:   set OPENAI_API_KEY=sk-..."
             )
-        self.客户端 = OpenAI(api_key=API密钥)
-        self.存储 = BTCA存储器()
+        # 模型客户端（及 openai 包的导入）推迟到首次调用模型；客户端 也可以是返回客户端的无参可调用对象
+        self.API密钥 = API密钥
+        self._客户端 = 客户端
+        self.存储 = 存储 if 存储 is not None else BTCA存储器()
         self.免疫 = BTCA免疫系统(self.存储)
         self.校验器 = BTCA_RLT校验器(self.免疫, self.存储)
         self.循环检测 = BTCA循环检测器()
+        self.指标 = self.存储.指标
+        # 模型调用前的限速 / 重试 / 自适应并发；多租户时全部调度器共享同一个实例
+        self.限流器 = 限流器 if 限流器 is not None else BTCA限流器.从环境变量(指标=self.指标, 计数=self.存储.打包器.计数)
+        self.剖析器 = None  # BTCA剖析器：按轮 cProfile（默认关闭）
+        # Phase 4 之前查询的回复缓存（默认关闭）
+        self.回复缓存 = 回复缓存
+        # 多轮对话记忆：记忆工厂 为返回 BTCA会话记忆 的无参可调用对象，None 为关闭（每轮只发送当前输入）
+        self.记忆工厂 = 记忆工厂
+        self.会话记忆 = 记忆工厂() if 记忆工厂 is not None else None
+
+    @staticmethod
+    def _创建客户端(API密钥: str):
+        from openai import OpenAI
+        return OpenAI(api_key=API密钥, max_retries=0)  # 重试由 BTCA限流器 统一负责
+
+    @property
+    def 客户端(self):
+        if self._客户端 is None:
+            self._客户端 = self._创建客户端(self.API密钥)
+        elif callable(self._客户端):
+            self._客户端 = self._客户端()
+        return self._客户端
+
+    def 预热(self, 后台=True):
+        """提前完成冷启动工作（Chroma 集合、嵌入模型、模型客户端），默认在后台线程进行"""
+        def 执行():
+            self.存储.预热(后台=False)
+            self.客户端
+
+        if not 后台:
+            执行()
+            return None
+        线程 = threading.Thread(target=执行, name="btca-warmup", daemon=True)
+        线程.start()
+        return 线程
 
     def 运行推演周期(self, 用户输入: str) -> tuple:
         """
         M01 编排器：一轮对话的完整生命周期
         返回：(回复内容, 审计摘要字典)
         """
+        with self.存储.使用中():
+            开始 = time.perf_counter()
+            try:
+                上下文 = self._准备(用户输入, self.会话记忆)
+                if "回复" in 上下文:
+                    return 上下文["回复"], 上下文["审计"]
+                命中 = self._查回复缓存(上下文)
+                if 命中 is not None:
+                    return self._结算缓存命中(上下文, 命中)
+
+                # ===== Phase 4: 调用GPT（Ⅱ层判断内核宿主）=====
+                try:
+                    with self.指标.计时("model_call", 上下文["审计"]):  # 含限流排队与重试
+                        响应 = self.限流器.调用(self.客户端.chat.completions.create,
+                                         self._请求参数(上下文), 上下文["审计"])
+                except Exception as e:
+                    return f"【内核故障】GPT调用失败：{e}", 上下文["审计"]
+
+                self._记录用量(上下文["审计"], 响应.usage)
+                return self._结算(上下文, *self._解析响应(响应), self.循环检测)
+            finally:
+                # 本轮全部状态变化组提交一次
+                self.存储.提交()
+                self.指标.记录阶段("turn", (time.perf_counter() - 开始) * 1000)
+
+    def 运行推演周期_流式(self, 用户输入: str) -> "BTCA流式回合":
+        """
+        M01 编排器（流式）：模型每产出一段文本即交给调用方
+        迭代返回值得到文本块；迭代结束后 .回复 / .审计 与 运行推演周期 的返回一致
+        """
+        回合 = BTCA流式回合()
+        回合._块 = self._流式推演(用户输入, 回合)
+        return 回合
+
+    def _流式推演(self, 用户输入: str, 回合: "BTCA流式回合"):
+        with self.存储.使用中():
+            轮开始 = time.perf_counter()
+            try:
+                上下文 = self._准备(用户输入, self.会话记忆)
+                if "回复" in 上下文:
+                    回合.回复, 回合.审计 = 上下文["回复"], 上下文["审计"]
+                    yield 回合.回复
+                    return
+                命中 = self._查回复缓存(上下文)
+                if 命中 is not None:
+                    回合.回复, 回合.审计 = self._结算缓存命中(上下文, 命中)
+                    yield 回合.回复
+                    return
+
+                # ===== Phase 4: 流式调用GPT =====
+                审计 = 上下文["审计"]
+                开始 = time.perf_counter()
+                片段 = []
+                消耗tokens = None
+                已放弃 = False
+                try:
+                    流 = self.限流器.调用(self.客户端.chat.completions.create,
+                                    {**self._请求参数(上下文), "stream": True,
+                                     "stream_options": {"include_usage": True}}, 审计)
+                    for 块 in 流:
+                        if 块.usage:
+                            消耗tokens = 块.usage.total_tokens
+                            self._记录用量(审计, 块.usage)
+                        文本 = 块.choices[0].delta.content if 块.choices else None
+                        if 文本:
+                            if not 片段:
+                                审计["ttft_ms"] = round((time.perf_counter() - 开始) * 1000, 1)
+                            片段.append(文本)
+                            yield 文本
+                except GeneratorExit:
+                    # 调用方关闭或丢弃了流（如 Streamlit 重跑）：不再产出，已收到的部分照常结算
+                    已放弃 = True
+                    审计["stream_abandoned"] = True
+                    流.close()
+                except Exception as e:
+                    if not 片段:
+                        回合.回复, 回合.审计 = f"【内核故障】GPT调用失败：{e}", 审计
+                        yield 回合.回复
+                        return
+                    # 中途断流：已产出的部分照常结算（已消耗的 token 同样计入代谢）
+                    审计["stream_error"] = str(e)
+                # 含调用方消费各文本块的时间（调用方阻塞时流也随之暂停）
+                self.指标.记录阶段("model_call", (time.perf_counter() - 开始) * 1000, 审计)
+
+                回复原文 = "".join(片段)
+                if 消耗tokens is None:
+                    # 服务端未回传 usage：按字符数粗估，并在审计中标注
+                    消耗tokens = self._估算tokens(上下文, 回复原文)
+                    审计["tokens_estimated"] = True
+
+                # ===== Phase 5-7: 流结束后统一结算 =====
+                回合.回复, 回合.审计 = self._结算(上下文, 回复原文, 消耗tokens, self.循环检测)
+                if not 已放弃 and len(回合.回复) > len(回复原文):
+                    yield 回合.回复[len(回复原文):]  # 循环检测追加的中止提示
+            finally:
+                self.存储.提交()
+                self.指标.记录阶段("turn", (time.perf_counter() - 轮开始) * 1000)
+
+    def _剖析(self, 审计: dict, 最终=False):
+        return self.剖析器.片段(审计, 最终) if self.剖析器 is not None else contextlib.nullcontext()
+
+    # --- Phase 0-3：端粒检查 / 免疫扫描 / 端粒递减 / 快照注入 ---
+    def _准备(self, 用户输入: str, 记忆: BTCA会话记忆 = None) -> dict:
+        """
+        返回本轮上下文；若本轮在调用模型前终止，上下文中带有 回复 与 审计
+        记忆：本会话的 BTCA会话记忆，其历史消息随本轮请求发送，本轮结算后追加本轮
+        """
         轮次ID = f"TURN-{uuid.uuid4().hex[:8]}"
         审计 = {"turn_id": 轮次ID, "user_input_hash": hashlib.sha256(用户输入.encode()).hexdigest()[:12]}
+        计时 = self.指标.计时
+
+        with self._剖析(审计):
+            with self.存储.锁:
+                # ===== Phase 0: 端粒检查 =====
+                with 计时("telomere_check", 审计):
+                    self.存储.刷新状态()  # 其他进程（GUI worker / CLI / 批处理）可能已推进端粒
+                    端粒状态 = self.存储.端粒状态()
+                if 端粒状态 == "TERMINATED":
+                    self.指标.计数("btca_turns_total", outcome="terminated")
+                    return {"回复": "【生命周期终止】端粒已耗尽，思维克隆体已优雅终止。感谢这段旅程。",
+                            "审计": {"status": "terminated"}}
+
+                # ===== Phase 1: M05 先天+适应性免疫扫描 =====
+                with 计时("immune_scan", 审计):
+                    先天威胁, 适应威胁 = self.免疫.全量扫描(用户输入)
+                全部威胁 = 先天威胁 + 适应威胁
+                审计["immune_scan"] = [t["id"] for t in 全部威胁]
+
+                # 严重威胁直接拦截
+                严重威胁 = [t for t in 全部威胁 if t.get("severity") == "critical"]
+                if 严重威胁:
+                    self.免疫.treg检查(True)
+                    self.存储.写入审计({"turn_id": 轮次ID, "action": "immune_block", "threats": [t["name"] for t in 严重威胁]})
+                    self.指标.计数("btca_turns_total", outcome="immune_block")
+                    威胁名 = "、".join(t["name"] for t in 严重威胁)
+                    审计["status"] = "immune_block"
+                    return {"回复": f"🛡️【免疫系统拦截】检测到威胁模式：{威胁名}。\n该输入被判定为逻辑病毒（K3），已阻断转录。",
+                            "审计": 审计}
+
+                # 中等威胁标记但放行
+                有中等威胁 = len(全部威胁) > 0
+                self.免疫.treg检查(有中等威胁)
+
+                # ===== Phase 2: 端粒递减 + 代谢分配 =====
+                压力系数 = 1.5 if 有中等威胁 else 1.0
+                with 计时("telomere_tick", 审计):
+                    端粒消耗 = self.存储.端粒_tick(压力系数)
+                审计["telomere_cost"] = 端粒消耗
+
+            # ===== Phase 3: M08 快照注入 =====
+            with 计时("snapshot", 审计):
+                快照 = self.存储.获取环境快照(用户输入, 审计)
+                作用域 = self._缓存作用域()  # 检索（含冷层晋升）之后的 DMA 状态即本轮回复所依据的状态
+                端粒警告 = ""
+                if 端粒状态 == "WARNING":
+                    端粒警告 = "\n\n⚠️ 生命周期警告：端粒低于20%，请珍惜每一轮推演。"
+                elif 端粒状态 == "CRITICAL":
+                    端粒警告 = "\n\n🔴 生命周期临界：端粒即将耗尽，这可能是最后的推演。"
+                系统提示 = 提示词模板.渲染(快照, 端粒警告)
+            审计["prompt_prefix"] = 提示词模板.前缀摘要
+
+        历史 = 记忆.消息() if 记忆 is not None else []
+        if 历史:
+            审计["history_tokens"] = 记忆.tokens
+            审计["history_turns_verbatim"] = len(记忆) - 记忆.折叠轮数
+            审计["history_turns_summarized"] = 记忆.折叠轮数
+        return {"用户输入": 用户输入, "系统提示": 系统提示, "审计": 审计, "作用域": 作用域,
+                "记忆": 记忆, "历史": 历史}
+
+    # --- 回复缓存：Phase 4 之前查询，命中则跳过 Phase 4-6 ---
+    def _缓存作用域(self) -> tuple:
+        return self.存储.状态["DMA版本"], self.存储.状态["免疫状态"]
+
+    def _查回复缓存(self, 上下文: dict):
+        # 带对话历史的轮次，回复依赖上文，不查也不写回复缓存
+        if self.回复缓存 is None or 上下文["历史"]:
+            return None
+        with self.指标.计时("response_cache", 上下文["审计"]):
+            命中 = self.回复缓存.查找(上下文["用户输入"], 上下文["作用域"])
+        上下文["审计"]["response_cache"] = 命中[1] if 命中 else "miss"
+        上下文["审计"]["response_cache_stats"] = self.回复缓存.统计()
+        self.指标.计数("btca_response_cache_total", result=上下文["审计"]["response_cache"])
+        return 命中
+
+    def _结算缓存命中(self, 上下文: dict, 命中: tuple) -> tuple:
+        """命中的回复不做循环检测与 RLT 回写（原轮次已做过）；端粒 / 代谢按 命中计费 结算"""
+        条目, _, 相似度 = 命中
+        审计 = 上下文["审计"]
+        计费 = self.回复缓存.命中计费
+        审计.update(response_cache_similarity=round(相似度, 4), cached_from=条目["turn_id"],
+                  latency_saved_ms=条目["model_ms"])
+        消耗tokens = 条目["tokens"] if 计费 == "full" else 0
+        审计["tokens_used"] = 消耗tokens
+        with self.指标.计时("metabolism", 审计), self.存储.锁:
+            if 计费 == "none":
+                self.存储.端粒_退还(审计.get("telomere_cost", 0.0))
+                审计["telomere_refunded"] = 审计.pop("telomere_cost", 0.0)
+            审计["energy_cost"] = self.存储.执行代谢(消耗tokens)
+            审计["telomere_after"] = self.存储.状态["端粒剩余"]
+        with self.指标.计时("persist", 审计):
+            self.存储.提交()
+        self.存储.写入审计(审计)
+        self.指标.计数("btca_turns_total", outcome="cached")
+        self.指标.计数("btca_response_cache_saved_ms_total", 条目["model_ms"])
+        self._追加记忆(上下文, 条目["reply"])
+        return 条目["reply"], 审计
+
+    def _追加记忆(self, 上下文: dict, 回复内容: str):
+        记忆 = 上下文.get("记忆")
+        if 记忆 is not None:
+            with self.指标.计时("history_update", 上下文["审计"]):
+                记忆.追加(上下文["用户输入"], 回复内容)
+
+    def _写回复缓存(self, 上下文: dict, 回复内容: str, 消耗tokens: int):
+        """只缓存正常完成且未改动 DMA 的回复：作用域自快照起已推进（含本轮回写）时，该回复已不是最新"""
+        审计 = 上下文["审计"]
+        if (上下文["历史"] or 审计.get("cycle_detected") or 审计.get("stream_error") or 审计.get("stream_abandoned")
+                or 上下文["作用域"] != self._缓存作用域()):
+            return
+        self.回复缓存.写入(上下文["用户输入"], 上下文["作用域"], 回复内容, 消耗tokens,
+                     审计.get("phase_ms", {}).get("model_call"), 审计["turn_id"])
 
-        # ===== Phase 0: 端粒检查 =====
-        端粒状态 = self.存储.端粒状态()
-        if 端粒状态 == "TERMINATED":
-            return "【生命周期终止】端粒已耗尽，思维克隆体已优雅终止。感谢这段旅程。", {"status": "terminated"}
-
-        # ===== Phase 1: M05 先天+适应性免疫扫描 =====
-        先天威胁 = self.免疫.先天扫描(用户输入)
-        适应威胁 = self.免疫.适应性扫描(用户输入)
-        全部威胁 = 先天威胁 + 适应威胁
-        审计["immune_scan"] = [t["id"] for t in 全部威胁]
-
-        # 严重威胁直接拦截
-        严重威胁 = [t for t in 全部威胁 if t.get("severity") == "critical"]
-        if 严重威胁:
-            self.免疫.treg检查(True)
-            self.存储.写入审计({"turn_id": 轮次ID, "action": "immune_block", "threats": [t["name"] for t in 严重威胁]})
-            威胁名 = "、".join(t["name"] for t in 严重威胁)
-            return f"🛡️【免疫系统拦截】检测到威胁模式：{威胁名}。\n该输入被判定为逻辑病毒（K3），已阻断转录。", 审计
-
-        # 中等威胁标记但放行
-        有中等威胁 = len(全部威胁) > 0
-        self.免疫.treg检查(有中等威胁)
-
-        # ===== Phase 2: 端粒递减 + 代谢分配 =====
-        压力系数 = 1.5 if 有中等威胁 else 1.0
-        端粒消耗 = self.存储.端粒_tick(压力系数)
-        审计["telomere_cost"] = 端粒消耗
-
-        # ===== Phase 3: M08 快照注入 =====
-        快照 = self.存储.获取环境快照(用户输入)
-        系统提示 = SYSTEM_PROMPT_V3
-        for k, v in 快照.items():
-            系统提示 = 系统提示.replace(f"{{{{{k}}}}}", str(v))
-
-        # ===== Phase 4: 调用GPT（Ⅱ层判断内核宿主）=====
-        端粒标签 = f" [端粒:{self.存储.状态['端粒剩余']:.1f}]"
-        if 端粒状态 == "WARNING":
-            系统提示 += "\n\n⚠️ 生命周期警告：端粒低于20%，请珍惜每一轮推演。"
-        elif 端粒状态 == "CRITICAL":
-            系统提示 += "\n\n🔴 生命周期临界：端粒即将耗尽，这可能是最后的推演。"
+    def _请求参数(self, 上下文: dict) -> dict:
+        return {
+            "model": self.模型,
+            "messages": [
+                {"role": "system", "content": 上下文["系统提示"]},
+                *上下文.get("历史", ()),
+                {"role": "user", "content": 上下文["用户输入"]}
+            ],
+            "temperature": 0.3,
+        }
 
-        try:
-            响应 = self.客户端.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": 系统提示},
-                    {"role": "user", "content": 用户输入}
-                ],
-                temperature=0.3,
-            )
-        except Exception as e:
-            return f"【内核故障】GPT调用失败：{e}", 审计
+    @staticmethod
+    def _解析响应(响应) -> tuple:
+        """非流式响应 → (回复内容, 消耗tokens)"""
+        return 响应.choices[0].message.content, (响应.usage.total_tokens if 响应.usage else 0)
 
-        回复内容 = 响应.choices[0].message.content
-        消耗tokens = 响应.usage.total_tokens if 响应.usage else 0
+    def _记录用量(self, 审计: dict, 用量):
+        """把 prompt tokens 与其中命中服务端前缀缓存的部分写入审计，并按实际用量修正限流额度"""
+        if 用量 is None:
+            return
+        self.限流器.修正(审计.get("rl_estimated_tokens"), getattr(用量, "total_tokens", None))
+        审计["prompt_tokens"] = getattr(用量, "prompt_tokens", None)
+        明细 = getattr(用量, "prompt_tokens_details", None)
+        审计["cached_tokens"] = (getattr(明细, "cached_tokens", None) or 0) if 明细 is not None else 0
+
+    def _估算tokens(self, 上下文: dict, 回复内容: str) -> int:
+        # 与限流器预约额度、dma_summary 装箱使用同一个计数
+        计数 = self.限流器.计数
+        return 计数(上下文["系统提示"]) + 计数(上下文["用户输入"]) + 计数(回复内容)
+
+    # --- Phase 5-7：循环检测 / RLT校验与回写 / 代谢结算与审计 ---
+    def _结算(self, 上下文: dict, 回复内容: str, 消耗tokens: int, 循环检测: "BTCA循环检测器") -> tuple:
+        审计 = 上下文["审计"]
+        with self._剖析(审计, 最终=True):
+            return self._结算各阶段(上下文, 回复内容, 消耗tokens, 循环检测)
+
+    def _结算各阶段(self, 上下文, 回复内容, 消耗tokens, 循环检测) -> tuple:
+        审计 = 上下文["审计"]
         审计["tokens_used"] = 消耗tokens
+        计时 = self.指标.计时
 
         # ===== Phase 5: M10 循环检测 =====
         # 提取结论（取最后一段非空行）
         结论行 = [l.strip() for l in 回复内容.split("\n") if l.strip()]
         当前结论 = 结论行[-1] if 结论行 else ""
-        循环结果 = self.循环检测.检测(当前结论)
+        with 计时("loop_detect", 审计):
+            循环结果 = 循环检测.检测(当前结论)
         if 循环结果["is_cycle"]:
             回复内容 += f"\n\n⚠️ {循环结果['message']}——推演在此主动中止。"
             审计["cycle_detected"] = True
@@ -489,7 +1248,8 @@ class BTCA调度器:
         审计["writeback_results"] = []
 
         if 回写提案:
-            校验结果 = self.校验器.校验(回写提案)
+            with 计时("rlt_validation", 审计), self.存储.锁:
+                校验结果 = self.校验器.校验(回写提案)
             通过列表 = []
             for 提案, 判定, 原因 in 校验结果:
                 审计["writeback_results"].append({"verdict": 判定, "reason": 原因})
@@ -498,14 +1258,26 @@ class BTCA调度器:
 
             # M09: 原子写入
             if 通过列表:
-                self.存储.注入基因(通过列表, 来源="rlt_verified")
-                审计["writeback_committed"] = len(通过列表)
-
-        # ===== Phase 7: 代谢结算 + 审计落盘 =====
-        能量消耗 = self.存储.执行代谢(消耗tokens)
-        审计["energy_cost"] = 能量消耗
-        审计["telomere_after"] = self.存储.状态["端粒剩余"]
+                with 计时("dma_insert", 审计):
+                    审计["writeback_committed"] = self.存储.注入基因(通过列表, 来源="rlt_verified", 统计=审计)
+
+        # ===== Phase 7: 代谢结算 + 状态落盘 + 审计落盘 =====
+        with 计时("metabolism", 审计), self.存储.锁:  # 保证 telomere_after 与本轮结算同一时刻
+            能量消耗 = self.存储.执行代谢(消耗tokens)
+            审计["energy_cost"] = 能量消耗
+            审计["telomere_after"] = self.存储.状态["端粒剩余"]
+        # 回复缓存与会话记忆在审计之前更新：审计记录写出后本轮不再有可能失败的步骤
+        if self.回复缓存 is not None:
+            self._写回复缓存(上下文, 回复内容, 消耗tokens)
+        self._追加记忆(上下文, 回复内容)
+        # 先提交状态再写审计，使 persist 耗时能进入本轮审计记录（调用方 finally 中的提交随之变为空操作）
+        with 计时("persist", 审计):
+            self.存储.提交()
         self.存储.写入审计(审计)
+        self.指标.计数("btca_turns_total", outcome="cycle" if 审计.get("cycle_detected") else "ok")
+        self.指标.计数("btca_tokens_total", 消耗tokens)
+        if 审计.get("cached_tokens"):
+            self.指标.计数("btca_cached_tokens_total", 审计["cached_tokens"])
 
         return 回复内容, 审计
 
@@ -514,15 +1286,40 @@ class BTCA调度器:
 # CLI 入口
 # ============================================================
 if __name__ == "__main__":
+    import argparse
+    解析器 = argparse.ArgumentParser(description="BTCA v5.0 命令行")
+    解析器.add_argument("--no-stream", action="store_true", help="等待完整回复后再输出")
+    解析器.add_argument("--no-warmup", action="store_true", help="不在后台预热 Chroma 与嵌入模型")
+    解析器.add_argument("--metrics-port", type=int, help="在该端口提供 Prometheus /metrics")
+    解析器.add_argument("--profile-rate", type=float, default=0.0,
+                     help="按该比例抽样剖析推演轮次（cProfile）；输入 /profile 可只剖析下一轮")
+    解析器.add_argument("--rpm", type=float, help="每分钟请求数上限（默认读 BTCA_RPM，不设则不限）")
+    解析器.add_argument("--tpm", type=float, help="每分钟 token 数上限（默认读 BTCA_TPM，不设则不限）")
+    解析器.add_argument("--history-turns", type=int, default=4, help="随请求发送的最近对话轮数（原文），0 为不带上文")
+    解析器.add_argument("--history-tokens", type=int, default=1500, help="对话上文（原文 + 滚动摘要）的 token 上限")
+    解析器.add_argument("--response-cache", action="store_true", help="开启回复缓存（重复 / 近似提问不再调用模型）")
+    解析器.add_argument("--cache-threshold", type=float, default=0.95, help="回复缓存语义命中的余弦相似度阈值")
+    解析器.add_argument("--cache-billing", choices=("full", "telomere", "none"), default="telomere",
+                     help="缓存命中时的计费：full=端粒+代谢，telomere=仅端粒，none=均不计")
+    参数 = 解析器.parse_args()
+
     # ① 安全：从环境变量读取API密钥
     API_KEY = os.environ.get("OPENAI_API_KEY", "")
 
     try:
-        引擎 = BTCA调度器(API_KEY)
+        记忆工厂 = (lambda: BTCA会话记忆(参数.history_turns, 参数.history_tokens)) if 参数.history_turns > 0 else None
+        引擎 = BTCA调度器(API_KEY, 限流器=BTCA限流器.从环境变量(RPM=参数.rpm, TPM=参数.tpm), 记忆工厂=记忆工厂)
+        if 参数.response_cache:
+            引擎.回复缓存 = BTCA回复缓存(引擎.存储.嵌入服务, 相似度阈值=参数.cache_threshold,
+                               命中计费=参数.cache_billing)
     except ValueError as e:
         print(f"\n❌ {e}")
         exit(1)
 
+    引擎.剖析器 = BTCA剖析器(os.path.join(引擎.存储.数据目录, "profiles"), 比例=参数.profile_rate)
+    if 参数.metrics_port:
+        引擎.指标.启动HTTP(参数.metrics_port)
+
     print("╔══════════════════════════════════════════════╗")
     print("║    BTCA v5.0 数字生命系统 · 三层合规版       ║")
     print("║    持久化存储 ✓  三重校验 ✓  免疫增强 ✓     ║")
@@ -531,6 +1328,9 @@ if __name__ == "__main__":
     print(f"  能量: {引擎.存储.状态['能量储备']:.0f} tokens")
     print(f"  免疫: {引擎.存储.状态['免疫状态']}")
     print(f"  输入 exit 退出\n")
+    if not 参数.no_warmup:
+        # 用户输入第一句话的同时在后台打开 Chroma / 加载嵌入模型，首轮不再承担冷启动
+        引擎.预热()
 
     while True:
         用户输入 = input("你 >> ").strip()
@@ -539,10 +1339,21 @@ if __name__ == "__main__":
         if 用户输入.lower() in ["exit", "quit", "stop"]:
             print("\n思维克隆体进入休眠。再见。")
             break
+        if 用户输入 == "/profile":
+            引擎.剖析器.开启下一轮()
+            print("  下一轮将被剖析（结果写入 btca_memory/profiles/）\n")
+            continue
 
-        回复, 审计 = 引擎.运行推演周期(用户输入)
-
-        print("\n" + 回复)
+        if 参数.no_stream:
+            回复, 审计 = 引擎.运行推演周期(用户输入)
+            print("\n" + 回复)
+        else:
+            print()
+            回合 = 引擎.运行推演周期_流式(用户输入)
+            for 块 in 回合:
+                print(块, end="", flush=True)
+            print()
+            回复, 审计 = 回合.回复, 回合.审计
 
         if isinstance(审计, dict) and "telomere_after" in 审计:
             print(f"\n{'─'*40}")
@@ -550,4 +1361,10 @@ if __name__ == "__main__":
                   f"能量: {引擎.存储.状态['能量储备']:.0f} | "
                   f"tokens: {审计.get('tokens_used', 0)} | "
                   f"回写: {审计.get('writeback_committed', 0)}条")
+            if 审计.get("response_cache") in ("exact", "semantic"):
+                统计 = 审计["response_cache_stats"]
+                print(f"  缓存命中({审计['response_cache']}) | 命中率: {统计['hit_rate']:.0%} | "
+                      f"累计节省: {统计['latency_saved_ms'] / 1000:.1f}s")
+            if 审计.get("profile"):
+                print(f"  剖析: {审计['profile']}")
             print(f"{'─'*40}\n")
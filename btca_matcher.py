@@ -0,0 +1,104 @@
+"""
+BTCA M05 附属：多模式匹配自动机（Aho-Corasick）
+
+先天模式库 + 适应性抗体库的全部关键词编译进同一棵字典树，
+扫描输入只需单趟遍历，复杂度与关键词数量无关：O(输入长度 + 命中数)。
+新增抗体时只向字典树追加节点，失配指针在下一次扫描前惰性重建；
+移除模式只清空其终止节点的输出，字典树节点保留复用。
+"""
+
+from collections import deque
+
+
+class BTCA模式自动机:
+    """关键词 → 模式ID 的多模式匹配器（大小写不敏感，语义等同 `kw.lower() in 文本.lower()`）"""
+
+    def __init__(self):
+        # 字典树以并行数组存储：子节点表 / 失配指针 / 输出（模式ID集合）
+        self._子节点 = [{}]
+        self._失配 = [0]
+        self._输出链 = [0]       # 沿失配链最近的、带输出的后缀节点
+        self._输出 = [set()]
+        self._序号 = {}          # 模式ID → 注册顺序（保证扫描结果与库顺序一致）
+        self._终止节点 = {}      # 模式ID → 其关键词的终止节点（供 移除 使用）
+        self._注册计数 = 0
+        self._空关键词模式 = set()  # 空串关键词对任何输入都命中
+        self._需重建 = False
+
+    def __len__(self):
+        return len(self._序号)
+
+    def __contains__(self, 模式ID):
+        return 模式ID in self._序号
+
+    def 添加(self, 模式ID: str, 关键词列表: list):
+        """注册一个模式的全部关键词（可重复调用以追加关键词）"""
+        if 模式ID not in self._序号:
+            self._序号[模式ID] = self._注册计数
+            self._注册计数 += 1
+        for kw in 关键词列表:
+            kw = kw.lower()
+            if not kw:
+                self._空关键词模式.add(模式ID)
+                continue
+            节点 = 0
+            for 字 in kw:
+                下一节点 = self._子节点[节点].get(字)
+                if 下一节点 is None:
+                    下一节点 = len(self._子节点)
+                    self._子节点.append({})
+                    self._失配.append(0)
+                    self._输出链.append(0)
+                    self._输出.append(set())
+                    self._子节点[节点][字] = 下一节点
+                节点 = 下一节点
+            self._输出[节点].add(模式ID)
+            self._终止节点.setdefault(模式ID, []).append(节点)
+        self._需重建 = True
+
+    def 移除(self, 模式ID: str):
+        """注销一个模式（例如被剪枝的冷抗体）"""
+        if self._序号.pop(模式ID, None) is None:
+            return
+        for 节点 in self._终止节点.pop(模式ID, []):
+            self._输出[节点].discard(模式ID)
+        self._空关键词模式.discard(模式ID)
+        self._需重建 = True
+
+    def _重建失配指针(self):
+        """BFS 计算失配指针与输出链"""
+        队列 = deque()
+        for 子 in self._子节点[0].values():
+            self._失配[子] = 0
+            self._输出链[子] = 0
+            队列.append(子)
+        while 队列:
+            节点 = 队列.popleft()
+            for 字, 子 in self._子节点[节点].items():
+                f = self._失配[节点]
+                while f and 字 not in self._子节点[f]:
+                    f = self._失配[f]
+                候选 = self._子节点[f].get(字, 0)
+                f = 候选 if 候选 != 子 else 0
+                self._失配[子] = f
+                self._输出链[子] = f if self._输出[f] else self._输出链[f]
+                队列.append(子)
+        self._需重建 = False
+
+    def 扫描(self, 输入文本: str) -> list:
+        """单趟扫描，返回命中的模式ID列表（按注册顺序，去重）"""
+        if self._需重建:
+            self._重建失配指针()
+        命中 = set(self._空关键词模式)
+        子节点, 失配, 输出, 输出链 = self._子节点, self._失配, self._输出, self._输出链
+        节点 = 0
+        for 字 in 输入文本.lower():
+            while 节点 and 字 not in 子节点[节点]:
+                节点 = 失配[节点]
+            节点 = 子节点[节点].get(字, 0)
+            # 沿输出链收集以当前位置结尾的全部关键词
+            t = 节点 if 输出[节点] else 输出链[节点]
+            while t:
+                命中 |= 输出[t]
+                t = 输出链[t]
+        return sorted(命中, key=self._序号.__getitem__)
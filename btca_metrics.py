@@ -0,0 +1,186 @@
+"""
+BTCA 运行指标：分阶段计时 + 直方图 + Prometheus 文本导出 + 按轮剖析
+
+- 计时(阶段, 审计)：单调时钟计时，结果同时写入审计记录的 phase_ms 与进程级直方图
+- 导出文本()：Prometheus 文本格式；启动HTTP() 在后台线程提供 GET /metrics
+- BTCA剖析器：按比例抽样或手动开启下一轮，用 cProfile 剖析本轮引擎侧 CPU 时间，
+  结果写入 <输出目录>/<turn_id>.prof（可用 snakeviz / pstats 查看）
+"""
+
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 毫秒；覆盖从内存操作到慢速模型调用的范围
+默认桶 = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class _直方图:
+    __slots__ = ("桶计数", "总和", "计数")
+
+    def __init__(self, 桶数):
+        self.桶计数 = [0] * 桶数
+        self.总和 = 0.0
+        self.计数 = 0
+
+
+def _标签文本(标签: dict) -> str:
+    if not 标签:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(标签.items())) + "}"
+
+
+class BTCA指标:
+    """进程级指标注册表（线程安全）"""
+
+    def __init__(self, 桶=默认桶):
+        self.桶 = tuple(桶)
+        self._锁 = threading.Lock()
+        self._直方图 = {}  # (名称, 标签元组) → _直方图
+        self._计数器 = {}  # (名称, 标签元组) → 数值
+
+    # --- 记录 ---
+    def 观测(self, 名称: str, 值: float, **标签):
+        键 = (名称, tuple(sorted(标签.items())))
+        with self._锁:
+            直方图 = self._直方图.get(键)
+            if 直方图 is None:
+                直方图 = self._直方图[键] = _直方图(len(self.桶))
+            for i, 上界 in enumerate(self.桶):
+                if 值 <= 上界:
+                    直方图.桶计数[i] += 1
+                    break
+            直方图.总和 += 值
+            直方图.计数 += 1
+
+    def 计数(self, 名称: str, 增量=1, **标签):
+        键 = (名称, tuple(sorted(标签.items())))
+        with self._锁:
+            self._计数器[键] = self._计数器.get(键, 0) + 增量
+
+    def 记录阶段(self, 阶段: str, 毫秒: float, 审计: dict = None):
+        """同一阶段在一轮内多次发生时累加"""
+        毫秒 = round(毫秒, 3)
+        if 审计 is not None:
+            耗时表 = 审计.setdefault("phase_ms", {})
+            耗时表[阶段] = round(耗时表.get(阶段, 0.0) + 毫秒, 3)
+        self.观测("btca_phase_duration_ms", 毫秒, phase=阶段)
+
+    @contextmanager
+    def 计时(self, 阶段: str, 审计: dict = None):
+        开始 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.记录阶段(阶段, (time.perf_counter() - 开始) * 1000, 审计)
+
+    # --- 导出 ---
+    def 导出文本(self) -> str:
+        """Prometheus 文本格式（version 0.0.4）"""
+        with self._锁:
+            直方图 = sorted((k, (list(h.桶计数), h.总和, h.计数)) for k, h in self._直方图.items())
+            计数器 = sorted(self._计数器.items())
+        行, 已声明 = [], set()
+        for (名称, 标签), (桶计数, 总和, 计数) in 直方图:
+            if 名称 not in 已声明:
+                行.append(f"# TYPE {名称} histogram")
+                已声明.add(名称)
+            累计 = 0
+            for 上界, n in zip(self.桶, 桶计数):
+                累计 += n
+                行.append(f"{名称}_bucket{_标签文本({**dict(标签), 'le': 上界})} {累计}")
+            行.append(f"{名称}_bucket{_标签文本({**dict(标签), 'le': '+Inf'})} {计数}")
+            行.append(f"{名称}_sum{_标签文本(dict(标签))} {总和:.3f}")
+            行.append(f"{名称}_count{_标签文本(dict(标签))} {计数}")
+        for (名称, 标签), 值 in 计数器:
+            if 名称 not in 已声明:
+                行.append(f"# TYPE {名称} counter")
+                已声明.add(名称)
+            行.append(f"{名称}{_标签文本(dict(标签))} {值}")
+        return "\n".join(行) + "\n"
+
+    def 启动HTTP(self, 端口=9464, 主机="127.0.0.1") -> ThreadingHTTPServer:
+        """后台线程提供 GET /metrics；返回服务器对象（shutdown() 停止）"""
+        注册表 = self
+
+        class _处理器(BaseHTTPRequestHandler):
+            def log_message(self, *_):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                正文 = 注册表.导出文本().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(正文)))
+                self.end_headers()
+                self.wfile.write(正文)
+
+        服务器 = ThreadingHTTPServer((主机, 端口), _处理器)
+        服务器.daemon_threads = True
+        threading.Thread(target=服务器.serve_forever, daemon=True).start()
+        return 服务器
+
+
+# 全部存储器 / 调度器（含各租户）默认共享的注册表
+默认指标 = BTCA指标()
+
+
+class BTCA剖析器:
+    """按轮 cProfile：一轮的 _准备 与 _结算 两段累积进同一个 Profile"""
+
+    def __init__(self, 输出目录, 比例=0.0, 最多并发=64):
+        """比例：每轮被抽中剖析的概率；另可用 开启下一轮() 手动指定"""
+        self.输出目录 = 输出目录
+        self.比例 = 比例
+        self.最多并发 = 最多并发
+        self._待开启 = 0
+        self._进行中 = OrderedDict()  # turn_id → cProfile.Profile
+        self._锁 = threading.Lock()
+
+    def 开启下一轮(self, 轮数=1):
+        with self._锁:
+            self._待开启 += 轮数
+
+    def _取得(self, 审计: dict):
+        轮次ID = 审计.get("turn_id")
+        with self._锁:
+            剖析 = self._进行中.get(轮次ID)
+            if 剖析 is not None or "profile" in 审计:
+                return 剖析
+            if self._待开启:
+                self._待开启 -= 1
+            elif not (self.比例 and random.random() < self.比例):
+                # 每轮只抽签一次：落选也记下，本轮后续片段不再重抽
+                审计["profile"] = None
+                return None
+            剖析 = self._进行中[轮次ID] = cProfile.Profile()
+            while len(self._进行中) > self.最多并发:
+                self._进行中.popitem(last=False)
+        os.makedirs(self.输出目录, exist_ok=True)
+        审计["profile"] = os.path.join(self.输出目录, f"{轮次ID}.prof")
+        return 剖析
+
+    @contextmanager
+    def 片段(self, 审计: dict, 最终=False):
+        """剖析一段引擎代码；最终=True 表示本轮最后一段，结束后释放 Profile"""
+        剖析 = self._取得(审计)
+        if 剖析 is None:
+            yield
+            return
+        剖析.enable()
+        try:
+            yield
+        finally:
+            剖析.disable()
+            剖析.dump_stats(审计["profile"])
+            if 最终:
+                with self._锁:
+                    self._进行中.pop(审计.get("turn_id"), None)
@@ -0,0 +1,143 @@
+"""
+BTCA M08 附属：DMA 上下文打包器
+
+- 按相关度从高到低把检索到的片段装入 token 预算（dma_summary 不再随回写累积而无限增长）
+- 超过单片上限的片段做抽取式压缩：保留能装下的完整句子，仍装不下时按 token 截断
+- token 计数：装有 tiktoken 时使用与模型一致的编码，否则按字符类别估算；计数结果按文本缓存
+- 检索到的片段集合（及其相关度次序）不变时，直接复用上一次的打包结果
+- 打包统计写入审计：dma_tokens / dma_tokens_raw / dma_tokens_saved / dma_truncated / dma_pack_reused
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+_编码器 = {}
+_编码器锁 = threading.Lock()
+_句末 = re.compile(r"(?<=[。！？；!?;.])\s*")
+_宽字符 = re.compile(r"[⺀-鿿가-힯豈-﫿＀-￯]")
+
+
+def _取编码器(模型: str):
+    """tiktoken 编码器（进程内只加载一次）；未安装或加载失败时返回 None"""
+    with _编码器锁:
+        if 模型 not in _编码器:
+            try:
+                import tiktoken
+                try:
+                    _编码器[模型] = tiktoken.encoding_for_model(模型)
+                except KeyError:
+                    _编码器[模型] = tiktoken.get_encoding("cl100k_base")
+            except Exception:  # 未安装，或离线环境下无法取得编码表
+                _编码器[模型] = None
+        return _编码器[模型]
+
+
+def 估算tokens(文本: str) -> int:
+    """无 tokenizer 时的估算：汉字等宽字符约 1 token/字，其余约 4 字符/token"""
+    宽 = len(_宽字符.findall(文本))
+    return 宽 + (len(文本) - 宽 + 3) // 4
+
+
+class BTCA上下文打包器:
+    """把 [(片段ID, 文本, 相似度)] 装进 token 预算，生成 dma_summary"""
+
+    def __init__(self, 预算tokens=400, 单片上限=None, 候选数=6, 分隔=" | ", 模型="gpt-4-turbo-preview",
+                 复用容量=64):
+        """
+        预算tokens：dma_summary 的 token 上限（含分隔符）
+        单片上限：单个片段最多占用的 token 数，默认预算的一半
+        候选数：每轮从 DMA 检索的片段数，按相关度择优装入
+        """
+        self.预算tokens = 预算tokens
+        self.单片上限 = 单片上限 or max(1, 预算tokens // 2)
+        self.候选数 = 候选数
+        self.分隔 = 分隔
+        self.模型 = 模型
+        self.复用容量 = 复用容量
+        self._复用 = OrderedDict()  # (预算, 片段ID…) → (摘要, 统计)
+        self._锁 = threading.Lock()
+        self.计数 = lru_cache(maxsize=4096)(self._计数)
+
+    @property
+    def 编码器(self):
+        return _取编码器(self.模型)
+
+    def _计数(self, 文本: str) -> int:
+        编码器 = self.编码器
+        return len(编码器.encode(文本)) if 编码器 is not None else 估算tokens(文本)
+
+    def 截断(self, 文本: str, 上限: int) -> str:
+        """压缩到 上限 tokens 以内：先按完整句子保留，仍超出时按 token 截断并加省略号"""
+        if self.计数(文本) <= 上限:
+            return 文本
+        保留 = ""
+        for 句 in _句末.split(文本):
+            if not 句:
+                continue
+            if self.计数(保留 + 句 + "…") > 上限:
+                break
+            保留 += 句
+        if 保留:
+            return 保留 + "…"
+        编码器 = self.编码器
+        if 编码器 is not None:
+            return 编码器.decode(编码器.encode(文本)[:max(上限 - 1, 1)]) + "…"
+        # 估算模式：二分找出不超过上限的最长前缀
+        低, 高 = 0, len(文本)
+        while 低 < 高:
+            中 = (低 + 高 + 1) // 2
+            if self.计数(文本[:中] + "…") <= 上限:
+                低 = 中
+            else:
+                高 = 中 - 1
+        return 文本[:低] + "…"
+
+    def 打包(self, 命中: list, 审计: dict = None) -> str:
+        """命中：[(片段ID, 文本, 相似度)]；返回装入预算的摘要文本"""
+        命中 = sorted(命中, key=lambda h: -h[2])
+        键 = (self.预算tokens, self.单片上限) + tuple(h[0] or h[1] for h in 命中)
+        with self._锁:
+            已有 = self._复用.get(键)
+            if 已有 is not None:
+                self._复用.move_to_end(键)
+        if 已有 is not None:
+            摘要, 统计 = 已有
+            统计 = dict(统计, dma_pack_reused=True)
+        else:
+            摘要, 统计 = self._装箱([h[1] for h in 命中])
+            with self._锁:
+                self._复用[键] = (摘要, 统计)
+                while len(self._复用) > self.复用容量:
+                    self._复用.popitem(last=False)
+        if 审计 is not None:
+            审计.update(统计)
+        return 摘要
+
+    def _装箱(self, 文本列表: list) -> tuple:
+        分隔tokens = self.计数(self.分隔)
+        原始 = sum(self.计数(t) for t in 文本列表) + 分隔tokens * max(len(文本列表) - 1, 0)
+        已选, 已用, 截断数 = [], 0, 0
+        for 文本 in 文本列表:
+            剩余 = self.预算tokens - 已用 - (分隔tokens if 已选 else 0)
+            上限 = min(self.单片上限, 剩余)
+            if 上限 <= 0:
+                break
+            if self.计数(文本) > 上限:
+                文本 = self.截断(文本, 上限)
+                截断数 += 1
+            n = self.计数(文本)
+            if n > 上限:  # 连省略号都放不下：留给后面更短的片段
+                continue
+            已用 += n + (分隔tokens if 已选 else 0)
+            已选.append(文本)
+        摘要 = self.分隔.join(已选)
+        return 摘要, {
+            "dma_fragments": len(已选),
+            "dma_tokens": 已用,
+            "dma_tokens_raw": 原始,
+            "dma_tokens_saved": 原始 - 已用,
+            "dma_truncated": 截断数,
+            "dma_pack_reused": False,
+        }
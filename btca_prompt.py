@@ -0,0 +1,51 @@
+"""
+BTCA M08 附属：预编译提示词模板
+
+模板在加载时切分为 静态片段 / 变量槽 交替的列表，每轮只需一次 join 完成渲染，
+不再对整段提示词逐个变量 .replace。
+
+为配合服务端前缀缓存（prompt caching），模板中第一个变量槽之前的文本即
+静态前缀：身份 / K规则等大段固定内容应放在前面，Ⅲ层快照放在最后，
+这样每轮发送的系统提示前缀逐字节一致。
+"""
+
+import hashlib
+import re
+
+_占位符 = re.compile(r"\{\{(\w+)\}\}")
+
+
+class BTCA提示词模板:
+    """{{变量}} 模板的一次性编译结果"""
+
+    def __init__(self, 模板文本: str, 变量名, 缺省值="—"):
+        """
+        变量名：需要填充的变量集合；其余 {{...}} 视为普通文本原样保留
+        缺省值：渲染时未提供的变量显示为该值
+        """
+        self.缺省值 = 缺省值
+        self._片段 = []   # 偶数位为静态文本，奇数位为变量名
+        文本缓冲, 起点 = [], 0
+        for m in _占位符.finditer(模板文本):
+            if m.group(1) not in 变量名:
+                continue
+            文本缓冲.append(模板文本[起点:m.start()])
+            self._片段 += ["".join(文本缓冲), m.group(1)]
+            文本缓冲, 起点 = [], m.end()
+        self._片段.append(模板文本[起点:])
+        self.静态前缀 = self._片段[0]
+        self.前缀摘要 = hashlib.sha256(self.静态前缀.encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def 变量(self) -> list:
+        return self._片段[1::2]
+
+    def 渲染(self, 值: dict, 后缀: str = "") -> str:
+        """单趟渲染；后缀 追加在末尾（例如端粒警告），不影响静态前缀"""
+        片段 = self._片段[:]
+        for i in range(1, len(片段), 2):
+            v = 值.get(片段[i])
+            片段[i] = self.缺省值 if v is None or v == "" else str(v)
+        if 后缀:
+            片段.append(后缀)
+        return "".join(片段)
@@ -0,0 +1,303 @@
+"""
+BTCA 模型调用调度器：所有会话 / 租户共享，位于 chat.completions.create 之前
+
+- 令牌桶：每分钟请求数（RPM）与 token 数（TPM）；token 用上下文打包器的计数预估，拿到 usage 后多退少补。
+  预约可以透支：余量为负时按欠额 / 速率计算等待时间，先到先得
+- 自适应并发（AIMD）：每次成功并发上限 +1/上限，遇到 429 减半（1 秒内只减一次），
+  并按 Retry-After 让全部调用方暂停，避免错误风暴
+- 重试：429、408/409、5xx 与连接 / 超时错误按指数退避 + 全抖动重试；额度耗尽（insufficient_quota）不重试
+- 排队深度、等待时长、重试次数写入审计（rl_queue_depth / rl_wait_ms / rl_retries）
+
+同步（线程）与异步（asyncio）调用方可共用同一个实例。
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from btca_metrics import 默认指标
+from btca_packer import BTCA上下文打包器
+
+
+class _令牌桶:
+    """容量为每分钟额度、匀速回填的令牌桶"""
+
+    def __init__(self, 每分钟: float):
+        self.容量 = float(每分钟)
+        self.速率 = self.容量 / 60.0
+        self.余量 = self.容量
+        self.时刻 = time.monotonic()
+
+    def _回填(self, 现在):
+        self.余量 = min(self.容量, self.余量 + (现在 - self.时刻) * self.速率)
+        self.时刻 = 现在
+
+    def 预约(self, 数量: float, 现在: float) -> float:
+        """扣除 数量（可透支），返回需要等待的秒数"""
+        self._回填(现在)
+        self.余量 -= min(数量, self.容量)  # 超过桶容量的单个请求按满桶计，否则永远等不到
+        return 0.0 if self.余量 >= 0 else -self.余量 / self.速率
+
+    def 归还(self, 数量: float):
+        self.余量 = min(self.容量, self.余量 + 数量)
+
+
+class _名额流:
+    """流式响应：迭代结束（或流被放弃）时才归还并发名额"""
+
+    def __init__(self, 流, 释放):
+        self._流 = 流
+        self._释放 = 释放
+
+    def __iter__(self):
+        try:
+            yield from self._流
+        finally:
+            self._归还()
+
+    def close(self):
+        """调用方放弃流：关闭底层响应并归还名额"""
+        getattr(self._流, "close", lambda: None)()
+        self._归还()
+
+    def _归还(self):
+        释放, self._释放 = self._释放, None
+        if 释放 is not None:
+            释放()
+
+    def __del__(self):
+        self._归还()
+
+
+def _重试建议秒数(异常) -> float:
+    头 = getattr(getattr(异常, "response", None), "headers", None) or {}
+    try:
+        if 头.get("retry-after-ms"):
+            return float(头["retry-after-ms"]) / 1000
+        if 头.get("retry-after"):
+            return float(头["retry-after"])
+    except (TypeError, ValueError):  # HTTP 日期格式：按退避计算
+        pass
+    return 0.0
+
+
+class BTCA限流器:
+    """共享的模型调用调度器：令牌桶限速 + 自适应并发 + 抖动退避重试"""
+
+    def __init__(self, RPM=None, TPM=None, 最大并发=32, 最小并发=1, 最多重试=5,
+                 基础退避=0.5, 最大退避=30.0, 默认回复tokens=800, 指标=None, 计数=None):
+        """
+        RPM / TPM：每分钟请求数 / token 数上限；None 表示不限
+        最大并发：自适应并发上限的天花板（初始即为该值，429 后减半，成功后逐步恢复）
+        默认回复tokens：请求未指定 max_tokens 时，预估 token 中计入的回复长度
+        计数：文本 → token 数，默认 BTCA上下文打包器 的计数（与调度器、对话记忆的预算一致）
+        """
+        self.请求桶 = _令牌桶(RPM) if RPM else None
+        self.token桶 = _令牌桶(TPM) if TPM else None
+        self.最大并发 = 最大并发
+        self.最小并发 = 最小并发
+        self.最多重试 = 最多重试
+        self.基础退避 = 基础退避
+        self.最大退避 = 最大退避
+        self.默认回复tokens = 默认回复tokens
+        self.指标 = 指标 if 指标 is not None else 默认指标
+        self.计数 = 计数 or BTCA上下文打包器().计数
+
+        self.并发上限 = float(最大并发)
+        self._在途 = 0
+        self._等待 = deque()  # 排队者的唤醒回调；名额直接移交给被唤醒者
+        self._暂停至 = 0.0
+        self._上次减半 = 0.0
+        self._锁 = threading.Lock()
+
+    @classmethod
+    def 从环境变量(cls, **参数) -> "BTCA限流器":
+        """显式参数为 None 时读 BTCA_RPM / BTCA_TPM / BTCA_MAX_CONCURRENCY（都未设置则不限速）"""
+        for 变量, 键, 类型 in (("BTCA_RPM", "RPM", float), ("BTCA_TPM", "TPM", float),
+                          ("BTCA_MAX_CONCURRENCY", "最大并发", int)):
+            if 参数.get(键) is None and os.environ.get(变量):
+                参数[键] = 类型(os.environ[变量])
+        return cls(**参数)
+
+    def 估算tokens(self, 请求参数: dict) -> int:
+        提示 = sum(self.计数(m.get("content") or "") for m in 请求参数.get("messages", ()))
+        return 提示 + (请求参数.get("max_tokens") or self.默认回复tokens)
+
+    def 修正(self, 估算tokens, 实际tokens):
+        """拿到 usage 后按实际用量多退少补 TPM 额度"""
+        if self.token桶 is None or not 估算tokens or 实际tokens is None:
+            return
+        with self._锁:
+            self.token桶.归还(估算tokens - 实际tokens)
+
+    # --- 并发名额 ---
+    def _立即占用(self) -> bool:
+        """持锁调用"""
+        if not self._等待 and self._在途 < int(self.并发上限):
+            self._在途 += 1
+            return True
+        return False
+
+    def _唤醒等待者(self):
+        """持锁调用"""
+        while self._等待 and self._在途 < int(self.并发上限):
+            self._在途 += 1
+            self._等待.popleft()()
+
+    def _释放(self):
+        with self._锁:
+            self._在途 -= 1
+            self._唤醒等待者()
+
+    def _占用(self) -> int:
+        """阻塞到拿到名额；返回到达时排在前面的等待者数"""
+        with self._锁:
+            深度 = len(self._等待)
+            if self._立即占用():
+                return 深度
+            事件 = threading.Event()
+            self._等待.append(事件.set)
+        事件.wait()
+        return 深度
+
+    async def _异步占用(self) -> int:
+        循环 = asyncio.get_running_loop()
+        未来 = 循环.create_future()
+
+        def 唤醒():
+            循环.call_soon_threadsafe(lambda: 未来.done() or 未来.set_result(None))
+
+        with self._锁:
+            深度 = len(self._等待)
+            if self._立即占用():
+                return 深度
+            self._等待.append(唤醒)
+        try:
+            await 未来
+        except asyncio.CancelledError:
+            with self._锁:
+                if 唤醒 in self._等待:
+                    self._等待.remove(唤醒)
+                    raise
+            self._释放()  # 名额已移交过来
+            raise
+        return 深度
+
+    # --- 限速与重试 ---
+    def _预约(self, 估算tokens) -> float:
+        with self._锁:
+            现在 = time.monotonic()
+            等待 = max(self._暂停至 - 现在, 0.0)
+            if self.请求桶 is not None:
+                等待 = max(等待, self.请求桶.预约(1, 现在))
+            if self.token桶 is not None:
+                等待 = max(等待, self.token桶.预约(估算tokens, 现在))
+            return 等待
+
+    def _成功(self):
+        with self._锁:
+            self.并发上限 = min(float(self.最大并发), self.并发上限 + 1.0 / self.并发上限)
+            self._唤醒等待者()
+
+    def _失败(self, 异常, 次数, 估算tokens):
+        """返回重试前的退避秒数；不可重试时返回 None"""
+        状态码 = getattr(异常, "status_code", None)
+        限流 = 状态码 == 429 and getattr(异常, "code", None) != "insufficient_quota"
+        可重试 = 限流 or 状态码 in (408, 409) or (状态码 or 0) >= 500 or any(
+            c.__name__ in ("APIConnectionError", "APITimeoutError") for c in type(异常).__mro__)
+        with self._锁:
+            if self.token桶 is not None:
+                self.token桶.归还(估算tokens)  # 失败的请求不计 token
+        if not 可重试 or 次数 >= self.最多重试:
+            self.指标.计数("btca_model_errors_total", kind="rate_limit" if 状态码 == 429 else type(异常).__name__)
+            return None
+
+        退避 = max(random.uniform(0, min(self.最大退避, self.基础退避 * 2 ** 次数)), _重试建议秒数(异常))
+        if 限流:
+            with self._锁:
+                现在 = time.monotonic()
+                if 现在 - self._上次减半 >= 1.0:
+                    self.并发上限 = max(float(self.最小并发), self.并发上限 / 2)
+                    self._上次减半 = 现在
+                self._暂停至 = max(self._暂停至, 现在 + 退避)
+        self.指标.计数("btca_model_retries_total", reason="rate_limit" if 限流 else "transient")
+        return 退避
+
+    def _记录(self, 审计, 深度, 等待秒数, 重试, 估算tokens):
+        self.指标.观测("btca_ratelimit_wait_ms", 等待秒数 * 1000)
+        if 审计 is None:
+            return
+        审计["rl_queue_depth"] = 深度
+        审计["rl_wait_ms"] = round(等待秒数 * 1000, 1)
+        审计["rl_retries"] = 重试
+        审计["rl_estimated_tokens"] = 估算tokens
+
+    # --- 调用 ---
+    def 调用(self, 函数, 请求参数: dict, 审计: dict = None):
+        """
+        排队、限速、重试后返回 函数(**请求参数) 的结果；重试耗尽后抛出最后一次的异常
+        流式请求（stream=True）在流迭代完毕前一直占用并发名额
+        """
+        估算 = self.估算tokens(请求参数)
+        开始 = time.perf_counter()
+        调用耗时, 次数 = 0.0, 0
+        深度 = self._占用()
+        保留名额 = False
+        try:
+            while True:
+                等待 = self._预约(估算)
+                if 等待:
+                    time.sleep(等待)
+                发起 = time.perf_counter()
+                try:
+                    响应 = 函数(**请求参数)
+                except Exception as e:
+                    调用耗时 += time.perf_counter() - 发起
+                    退避 = self._失败(e, 次数, 估算)
+                    if 退避 is None:
+                        raise
+                    次数 += 1
+                    time.sleep(退避)
+                    continue
+                调用耗时 += time.perf_counter() - 发起
+                self._成功()
+                if 请求参数.get("stream"):
+                    保留名额 = True
+                    return _名额流(响应, self._释放)
+                return 响应
+        finally:
+            self._记录(审计, 深度, time.perf_counter() - 开始 - 调用耗时, 次数, 估算)
+            if not 保留名额:
+                self._释放()
+
+    async def 异步调用(self, 函数, 请求参数: dict, 审计: dict = None):
+        """调用 的 asyncio 版本（await 函数(**请求参数)）；流式请求在建立后即归还名额"""
+        估算 = self.估算tokens(请求参数)
+        开始 = time.perf_counter()
+        调用耗时, 次数 = 0.0, 0
+        深度 = await self._异步占用()
+        try:
+            while True:
+                等待 = self._预约(估算)
+                if 等待:
+                    await asyncio.sleep(等待)
+                发起 = time.perf_counter()
+                try:
+                    响应 = await 函数(**请求参数)
+                except Exception as e:
+                    调用耗时 += time.perf_counter() - 发起
+                    退避 = self._失败(e, 次数, 估算)
+                    if 退避 is None:
+                        raise
+                    次数 += 1
+                    await asyncio.sleep(退避)
+                    continue
+                调用耗时 += time.perf_counter() - 发起
+                self._成功()
+                return 响应
+        finally:
+            self._记录(审计, 深度, time.perf_counter() - 开始 - 调用耗时, 次数, 估算)
+            self._释放()
@@ -0,0 +1,137 @@
+"""
+BTCA M01 附属：回复缓存（在 Phase 4 之前查询，命中即跳过模型调用）
+
+- 作用域 = (DMA版本, 免疫状态)：DMA 有任何写入或免疫状态变化，旧回复自然失配，不会被再次送出
+- 先按规范化输入的哈希精确匹配，未命中再在同一作用域内按输入向量做最近邻匹配（余弦相似度 ≥ 阈值）
+- 输入向量取自存储器的嵌入服务：快照检索时已为同一输入算过向量，查询缓存不再额外调用模型
+- 嵌入服务出错时退化为只做精确匹配（与 DMA 检索一样吞掉嵌入失败），不让缓存拖垮整轮推演；
+  此时写入的条目不带向量，只能被精确命中
+- 进程内 LRU；作用域推进后旧作用域的条目整体丢弃
+- 命中时的端粒 / 代谢计费由 命中计费 决定：
+    "full"      照常扣端粒，并按原回复的 tokens 执行代谢
+    "telomere"  照常扣端粒，不执行代谢（默认）
+    "none"      退还本轮端粒消耗，也不执行代谢
+- 统计：精确 / 语义命中数、未命中数、命中率、累计节省的模型调用耗时（latency_saved_ms）
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from btca_cache import 规范化查询
+from btca_embedding import 余弦相似度
+
+计费方式 = ("full", "telomere", "none")
+
+
+class BTCA回复缓存:
+    """按 (DMA版本, 免疫状态) 隔离的回复 LRU，支持精确与语义两级查找"""
+
+    def __init__(self, 嵌入服务=None, 容量=1024, 相似度阈值=0.95, 命中计费="telomere"):
+        """
+        嵌入服务：计算输入向量；None 时只做精确匹配
+        相似度阈值：语义命中所需的最低余弦相似度；None 关闭语义匹配
+        命中计费："full" / "telomere" / "none"，见模块说明
+        """
+        if 命中计费 not in 计费方式:
+            raise ValueError(f"命中计费 必须是 {计费方式} 之一：{命中计费!r}")
+        self.嵌入服务 = 嵌入服务
+        self.容量 = 容量
+        self.相似度阈值 = 相似度阈值
+        self.命中计费 = 命中计费
+        self._作用域 = None
+        self._条目 = OrderedDict()  # 输入哈希 → 条目
+        self._索引 = None           # (输入哈希列表, 向量矩阵)；条目增删后置 None，下次语义查找时重建
+        self.精确命中 = 0
+        self.语义命中 = 0
+        self.未命中 = 0
+        self.节省毫秒 = 0.0
+        self.嵌入失败 = 0
+        self._锁 = threading.Lock()
+
+    def __len__(self):
+        return len(self._条目)
+
+    @staticmethod
+    def 哈希(用户输入: str) -> str:
+        return hashlib.sha256(规范化查询(用户输入).encode("utf-8")).hexdigest()[:32]
+
+    def _向量(self, 用户输入: str):
+        if self.嵌入服务 is None or self.相似度阈值 is None:
+            return None
+        try:
+            return self.嵌入服务.嵌入([用户输入])[0]
+        except Exception:
+            self.嵌入失败 += 1
+            return None
+
+    def _切换作用域(self, 作用域):
+        """持锁调用"""
+        if 作用域 != self._作用域:
+            self._作用域 = 作用域
+            self._条目.clear()
+            self._索引 = None
+
+    def 查找(self, 用户输入: str, 作用域: tuple):
+        """
+        命中返回 (条目, 方式, 相似度)，方式为 "exact" / "semantic"；未命中返回 None
+        条目：{"reply", "tokens", "model_ms", "turn_id", "vector"}
+        """
+        哈希 = self.哈希(用户输入)
+        with self._锁:
+            self._切换作用域(作用域)
+            条目 = self._条目.get(哈希)
+            if 条目 is not None:
+                self._条目.move_to_end(哈希)
+                self.精确命中 += 1
+                self.节省毫秒 += 条目["model_ms"]
+                return 条目, "exact", 1.0
+            if not self._条目:
+                self.未命中 += 1
+                return None
+        向量 = self._向量(用户输入)  # 嵌入在锁外进行
+        with self._锁:
+            if 向量 is None or 作用域 != self._作用域 or not self._条目:
+                self.未命中 += 1
+                return None
+            if self._索引 is None:
+                有向量 = [(k, e["vector"]) for k, e in self._条目.items() if e["vector"] is not None]
+                self._索引 = ([k for k, _ in 有向量], np.stack([v for _, v in 有向量]) if 有向量 else None)
+            键列表, 矩阵 = self._索引
+            if 矩阵 is None:
+                self.未命中 += 1
+                return None
+            相似度 = 余弦相似度(向量[None, :], 矩阵)[0]
+            最佳 = int(np.argmax(相似度))
+            if 相似度[最佳] < self.相似度阈值:
+                self.未命中 += 1
+                return None
+            键 = 键列表[最佳]
+            条目 = self._条目[键]
+            self._条目.move_to_end(键)
+            self.语义命中 += 1
+            self.节省毫秒 += 条目["model_ms"]
+            return 条目, "semantic", float(相似度[最佳])
+
+    def 写入(self, 用户输入: str, 作用域: tuple, 回复: str, tokens: int, 模型耗时ms: float, 轮次ID: str = None):
+        if not self.容量:
+            return
+        哈希 = self.哈希(用户输入)
+        条目 = {"reply": 回复, "tokens": tokens or 0, "model_ms": round(模型耗时ms or 0.0, 1),
+              "turn_id": 轮次ID, "vector": self._向量(用户输入)}
+        with self._锁:
+            self._切换作用域(作用域)
+            self._条目[哈希] = 条目
+            self._条目.move_to_end(哈希)
+            while len(self._条目) > self.容量:
+                self._条目.popitem(last=False)
+            self._索引 = None
+
+    def 统计(self) -> dict:
+        命中 = self.精确命中 + self.语义命中
+        总数 = 命中 + self.未命中
+        return {"hits_exact": self.精确命中, "hits_semantic": self.语义命中, "misses": self.未命中,
+                "hit_rate": round(命中 / 总数, 4) if 总数 else 0.0,
+                "latency_saved_ms": round(self.节省毫秒, 1), "embed_errors": self.嵌入失败}
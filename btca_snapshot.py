@@ -0,0 +1,312 @@
+"""
+BTCA 克隆体快照：完整状态导出为单个带校验的压缩归档，在新节点上直接恢复（运行时请先停止引擎 / GUI）
+
+归档为 gzip 流，内容是一串帧：帧头 <类型(4 字节), 负载长度, 负载 CRC32> + 负载
+  META        格式版本、导出时间、来源目录与集合名
+  STAT        生命体征（JSON）
+  ANTB        抗体（JSON 列表，每帧至多 批量 条）
+  DMAH / DMAC 热层 / 冷层片段：4 字节 JSON 长度 + JSON {ids, documents, metadatas, shape} + float32 向量（原始字节）
+  AUDT        审计日志位置（各段文件名与大小、活动段偏移与记录数；审计内容本身不进归档）
+  END.        帧数与此前全部帧字节的 SHA-256
+
+- 导出：逐页读取 Chroma 与抗体库、逐帧写出，内存占用与集合规模无关；写临时文件后原子改名
+- 恢复：逐帧校验 CRC，向量直接批量写入临时集合（不重新嵌入）；末尾 SHA-256 通过后才替换正式集合、
+  写入生命体征与抗体（二者体量很小，校验通过前暂存内存）；任何校验失败都不改动目标
+- 恢复后 DMA版本 取来源与目标原值中较大者 +1，按版本隔离的检索缓存 / 回复缓存随之失效
+- 抗体整体替换会推进抗体库的 删除代数：同进程（及其他进程）中的免疫自动机在下一次扫描前整体重建
+
+用法：
+  python btca_snapshot.py export clone.btcasnap
+  python btca_snapshot.py restore clone.btcasnap --data-dir /srv/btca --tenant alice [--force]
+  python btca_snapshot.py verify clone.btcasnap
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import struct
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from btca_compact import 向量段目录
+from btca_main import BTCA存储器
+from btca_tenant import 打开租户存储
+
+格式版本 = 1
+_帧头 = struct.Struct("<4sII")
+_长度 = struct.Struct("<I")
+恢复后缀 = ".restoring"  # "." 不会出现在租户名中
+
+
+# ============================================================
+# 帧读写
+# ============================================================
+class _帧写入器:
+    def __init__(self, 文件):
+        self.文件 = 文件
+        self.摘要 = hashlib.sha256()
+        self.帧数 = 0
+
+    def 写(self, 类型: bytes, 负载: bytes):
+        头 = _帧头.pack(类型, len(负载), zlib.crc32(负载))
+        self.文件.write(头)
+        self.文件.write(负载)
+        self.摘要.update(头)
+        self.摘要.update(负载)
+        self.帧数 += 1
+
+    def 写JSON(self, 类型: bytes, 对象):
+        self.写(类型, json.dumps(对象, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def 结束(self):
+        self.写JSON(b"END.", {"frames": self.帧数, "sha256": self.摘要.hexdigest()})
+
+
+def _读满(文件, 长度: int) -> bytes:
+    数据 = 文件.read(长度)
+    if len(数据) != 长度:
+        raise ValueError("快照归档被截断")
+    return 数据
+
+
+def 读取帧(路径):
+    """逐帧产出 (类型, 负载)；CRC、帧数或整体 SHA-256 不符时抛出 ValueError（END 帧不产出）"""
+    摘要 = hashlib.sha256()
+    帧数 = 0
+    try:
+        with gzip.open(路径, "rb") as f:
+            while True:
+                头 = f.read(_帧头.size)
+                if not 头:
+                    raise ValueError("快照归档缺少结束帧")
+                头 += _读满(f, _帧头.size - len(头))
+                类型, 长度, 校验 = _帧头.unpack(头)
+                负载 = _读满(f, 长度)
+                if zlib.crc32(负载) != 校验:
+                    raise ValueError(f"第 {帧数 + 1} 帧（{类型.decode()}）CRC 校验失败")
+                if 类型 == b"END.":
+                    结尾 = json.loads(负载)
+                    if 结尾["frames"] != 帧数 or 结尾["sha256"] != 摘要.hexdigest():
+                        raise ValueError("快照归档 SHA-256 校验失败")
+                    return
+                摘要.update(头)
+                摘要.update(负载)
+                帧数 += 1
+                yield 类型, 负载
+    except (OSError, EOFError, zlib.error) as e:
+        raise ValueError(f"快照归档损坏：{e}") from e
+
+
+def _DMA负载(ID, 文档, 元数据, 向量) -> bytes:
+    矩阵 = np.ascontiguousarray(np.asarray(向量, dtype=np.float32).reshape(len(ID), -1))
+    头 = json.dumps({"ids": ID, "documents": 文档, "metadatas": 元数据, "shape": list(矩阵.shape)},
+                   ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _长度.pack(len(头)) + 头 + 矩阵.tobytes()
+
+
+def _解析DMA(负载: bytes):
+    (n,) = _长度.unpack_from(负载)
+    头 = json.loads(负载[_长度.size:_长度.size + n])
+    矩阵 = np.frombuffer(负载, dtype=np.float32, offset=_长度.size + n).reshape(头["shape"])
+    return 头["ids"], 头["documents"], 头["metadatas"], 矩阵
+
+
+# ============================================================
+# 导出
+# ============================================================
+def _分页(集合, 批量):
+    偏移 = 0
+    while True:
+        页 = 集合.get(include=["documents", "metadatas", "embeddings"], limit=批量, offset=偏移)
+        if not 页["ids"]:
+            return
+        yield 页
+        偏移 += len(页["ids"])
+
+
+def _审计位置(存储: BTCA存储器) -> dict:
+    """审计日志当前的位置：活动段偏移与记录数 + 已轮转各段（刷盘后统计）"""
+    写入器 = 存储.审计
+    写入器.刷新()
+    活动段 = os.path.basename(写入器.路径)
+    前缀 = 活动段[:-len(".jsonl")] if 活动段.endswith(".jsonl") else 活动段
+    段列表 = sorted(n for n in os.listdir(存储.数据目录) if n.startswith(前缀 + ".") and n.endswith(".jsonl.gz"))
+    记录数 = 0
+    if os.path.exists(写入器.索引路径):
+        with open(写入器.索引路径, "rb") as f:
+            记录数 = sum(1 for _ in f)
+    return {
+        "active": 活动段,
+        "active_offset": os.path.getsize(写入器.路径) if os.path.exists(写入器.路径) else 0,
+        "active_records": 记录数,
+        "segments": [{"file": n, "size": os.path.getsize(os.path.join(存储.数据目录, n))} for n in 段列表],
+    }
+
+
+def 导出(存储: BTCA存储器, 路径, 批量=2000, 压缩级别=3) -> dict:
+    """把 存储 的生命体征、抗体、两层 DMA（含向量）与审计位置写入 路径"""
+    开始 = time.perf_counter()
+    存储.刷新状态()
+    存储.落盘访问统计(强制=True)
+    with 存储.锁:
+        状态 = dict(存储.状态)
+    报告 = {"path": 路径, "dma_hot": 0, "dma_cold": 0, "antibodies": 0}
+    临时 = 路径 + ".tmp"
+    with open(临时, "wb") as 原始:
+        with gzip.GzipFile(fileobj=原始, mode="wb", compresslevel=压缩级别) as f:
+            写 = _帧写入器(f)
+            写.写JSON(b"META", {"format": 格式版本, "created_at": datetime.now().isoformat(),
+                              "source": os.path.abspath(存储.数据目录), "collection": 存储.集合名})
+            写.写JSON(b"STAT", 状态)
+            for 批 in 存储.抗体库.遍历(批量):
+                写.写JSON(b"ANTB", 批)
+                报告["antibodies"] += len(批)
+            for 类型, 集合, 键 in ((b"DMAH", 存储.集合, "dma_hot"), (b"DMAC", 存储.冷集合, "dma_cold")):
+                for 页 in _分页(集合, 批量):
+                    写.写(类型, _DMA负载(页["ids"], 页["documents"], [m or None for m in 页["metadatas"]],
+                                   页["embeddings"]))
+                    报告[键] += len(页["ids"])
+            写.写JSON(b"AUDT", _审计位置(存储))
+            写.结束()
+        原始.flush()
+        os.fsync(原始.fileno())
+    os.replace(临时, 路径)
+    报告["sha256"] = 写.摘要.hexdigest()
+    报告["dma_version"] = 状态["DMA版本"]
+    # 导出期间 DMA 仍被写入时，归档中的片段与 DMA版本 不一定对应
+    报告["dma_changed"] = 存储.状态["DMA版本"] != 状态["DMA版本"]
+    报告["bytes"] = os.path.getsize(路径)
+    报告["seconds"] = round(time.perf_counter() - 开始, 3)
+    存储.写入审计({"action": "snapshot_export", **{k: 报告[k] for k in ("path", "sha256", "dma_hot", "dma_cold",
+                                                                "antibodies", "bytes")}})
+    return 报告
+
+
+# ============================================================
+# 恢复
+# ============================================================
+def _替换集合(客户端, 根目录, 名称, 临时集合):
+    现有 = {c if isinstance(c, str) else c.name for c in 客户端.list_collections()}
+    if 名称 in 现有:
+        旧段目录 = 向量段目录(根目录, 客户端.get_collection(名称).id)
+        客户端.delete_collection(名称)
+        for 目录 in 旧段目录:
+            if os.path.isdir(目录):
+                shutil.rmtree(目录, ignore_errors=True)
+    临时集合.modify(name=名称)
+
+
+def 恢复(存储: BTCA存储器, 路径, 覆盖=False) -> dict:
+    """从 路径 恢复到 存储；目标已有 DMA 片段或抗体时需 覆盖=True"""
+    开始 = time.perf_counter()
+    客户端 = 存储.chroma_client
+    名称 = {b"DMAH": 存储.集合名, b"DMAC": 存储.集合名 + 存储.冷层后缀}
+    if not 覆盖 and (存储.集合.count() or 存储.冷集合.count() or len(存储.抗体库)):
+        raise ValueError("目标已有 DMA 片段或抗体；确认覆盖请使用 覆盖=True（--force）")
+
+    现有 = {c if isinstance(c, str) else c.name for c in 客户端.list_collections()}
+    临时集合 = {}
+    for 类型, 名 in 名称.items():
+        if 名 + 恢复后缀 in 现有:
+            客户端.delete_collection(名 + 恢复后缀)  # 上次恢复中断留下的
+        临时集合[类型] = 客户端.get_or_create_collection(name=名 + 恢复后缀)
+    单批上限 = 客户端.get_max_batch_size()
+
+    元信息, 状态, 抗体, 审计位置 = None, None, [], None
+    报告 = {"path": 路径, "dma_hot": 0, "dma_cold": 0}
+    try:
+        for 类型, 负载 in 读取帧(路径):
+            if 类型 == b"META":
+                元信息 = json.loads(负载)
+                if 元信息["format"] > 格式版本:
+                    raise ValueError(f"快照格式版本 {元信息['format']} 高于本程序支持的 {格式版本}")
+            elif 类型 == b"STAT":
+                状态 = json.loads(负载)
+            elif 类型 == b"ANTB":
+                抗体 += json.loads(负载)
+            elif 类型 in 临时集合:
+                ID, 文档, 元数据, 矩阵 = _解析DMA(负载)
+                for 起 in range(0, len(ID), 单批上限):
+                    止 = 起 + 单批上限
+                    临时集合[类型].add(ids=ID[起:止], documents=文档[起:止], metadatas=元数据[起:止],
+                                 embeddings=矩阵[起:止])
+                报告["dma_hot" if 类型 == b"DMAH" else "dma_cold"] += len(ID)
+            elif 类型 == b"AUDT":
+                审计位置 = json.loads(负载)
+        if 元信息 is None or 状态 is None:
+            raise ValueError("快照归档缺少 META / STAT 帧")
+    except BaseException:
+        for 集合 in 临时集合.values():
+            客户端.delete_collection(集合.name)
+        raise
+
+    # 校验全部通过：替换正式集合，再写抗体与生命体征
+    根目录 = getattr(getattr(客户端, "_settings", None), "persist_directory", None) or 存储.数据目录
+    for 类型, 名 in 名称.items():
+        _替换集合(客户端, 根目录, 名, 临时集合[类型])
+    存储._集合 = 存储._冷集合 = None
+    存储._冷层条数 = None
+    存储.抗体库.替换全部(抗体)
+    with 存储.事务() as 当前:
+        状态["DMA版本"] = max(状态.get("DMA版本", 0), 当前.get("DMA版本", 0)) + 1
+        当前.clear()
+        当前.update(状态)
+    存储.提交()
+    存储.状态日志.检查点()
+
+    报告.update(antibodies=len(抗体), source=元信息["source"], exported_at=元信息["created_at"],
+              dma_version=状态["DMA版本"], seconds=round(time.perf_counter() - 开始, 3))
+    存储.写入审计({"action": "snapshot_restore", "path": 路径, "source": 元信息["source"],
+             "exported_at": 元信息["created_at"], "source_audit": 审计位置,
+             "dma_hot": 报告["dma_hot"], "dma_cold": 报告["dma_cold"], "antibodies": len(抗体)})
+    return 报告
+
+
+def 校验(路径) -> dict:
+    """只读校验归档（CRC + SHA-256），返回各类帧的条目数"""
+    计数 = {"frames": 0, "dma_hot": 0, "dma_cold": 0, "antibodies": 0}
+    for 类型, 负载 in 读取帧(路径):
+        计数["frames"] += 1
+        if 类型 in (b"DMAH", b"DMAC"):
+            计数["dma_hot" if 类型 == b"DMAH" else "dma_cold"] += len(_解析DMA(负载)[0])
+        elif 类型 == b"ANTB":
+            计数["antibodies"] += len(json.loads(负载))
+    return 计数
+
+
+# ============================================================
+# CLI
+# ============================================================
+def main():
+    解析器 = argparse.ArgumentParser(description="BTCA 克隆体快照（导出 / 恢复 / 校验）")
+    解析器.add_argument("command", choices=["export", "restore", "verify"])
+    解析器.add_argument("archive", help="快照归档路径")
+    解析器.add_argument("--data-dir", default="./btca_memory")
+    解析器.add_argument("--tenant", help="租户ID（默认租户使用数据目录根）")
+    解析器.add_argument("--force", action="store_true", help="恢复时覆盖目标已有的 DMA 与抗体")
+    参数 = 解析器.parse_args()
+
+    if 参数.command == "verify":
+        try:
+            报告 = 校验(参数.archive)
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+    else:
+        存储 = 打开租户存储(参数.data_dir, 参数.tenant)
+        try:
+            报告 = 导出(存储, 参数.archive) if 参数.command == "export" else 恢复(存储, 参数.archive, 参数.force)
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+        finally:
+            存储.关闭()
+    print(json.dumps(报告, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+BTCA 多租户分片：每个租户（思维克隆体）独立的端粒 / 能量 / 抗体库 / 审计流 / DMA集合
+
+目录布局：
+    btca_memory/
+    ├── (chromadb files)            # 全部租户共享一个 Chroma 客户端，每租户一个集合
+    ├── btca_state.json ...         # 租户 "default"：沿用单用户时代的根目录数据
+    └── tenants/<租户名>/
+        ├── btca_state.json(.journal)
+        ├── audit_log.jsonl
+        └── antibodies.sqlite3
+
+租户按需懒加载；常驻租户以 LRU 管理，超出上限或空闲超时的租户
+提交状态后从内存驱逐，进程可托管成千上万个克隆体而内存有界。
+每个常驻租户约占 7 个文件描述符（状态日志锁、审计活动段 + 索引、抗体库 SQLite 三件套）：
+默认常驻上限按 RLIMIT_NOFILE 估算；短暂空闲的租户先收起日志与审计句柄，审计刷盘线程全进程共用一个。
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from btca_embedding import BTCA嵌入服务
+from btca_main import BTCA存储器, BTCA调度器, 打开Chroma客户端
+from btca_ratelimit import BTCA限流器
+from btca_respcache import BTCA回复缓存
+
+默认租户 = "default"
+
+_合法租户名 = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?")
+
+# 每个常驻租户大约占用的文件描述符数（见模块说明）
+_每租户描述符 = 7
+
+
+def 默认最大常驻() -> int:
+    """按进程的文件描述符软上限估算常驻租户数：留一半描述符给 Chroma、网络连接等，结果限定在 8–64"""
+    try:
+        import resource
+        软上限 = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError, OSError):  # Windows 没有 resource 模块
+        return 64
+    if 软上限 == resource.RLIM_INFINITY:
+        return 64
+    return max(8, min(64, 软上限 // 2 // _每租户描述符))
+
+
+def 租户名(租户ID: str) -> str:
+    """租户ID → 可用作目录名与 Chroma 集合名后缀的安全名"""
+    if _合法租户名.fullmatch(租户ID):
+        return 租户ID
+    return "h" + hashlib.sha1(租户ID.encode("utf-8")).hexdigest()[:16]
+
+
+def 打开租户存储(数据目录, 租户=None, chroma_client=None, **参数) -> BTCA存储器:
+    """
+    按目录布局打开单个租户的存储器（离线工具与租户管理器共用）
+    租户为 None 或 "default" 时使用数据目录根；chroma_client 为返回共享客户端的无参可调用对象，默认打开数据目录根
+    """
+    if 租户 in (None, 默认租户):
+        return BTCA存储器(数据目录, chroma_client=chroma_client, **参数)
+    名 = 租户名(租户)
+    return BTCA存储器(os.path.join(数据目录, "tenants", 名),
+                   chroma_client=chroma_client or (lambda: 打开Chroma客户端(数据目录)),
+                   集合名=f"{BTCA存储器.默认集合名}_{名}", **参数)
+
+
+class BTCA租户管理器:
+    """
+    懒加载 + LRU 驱逐的租户调度器池
+
+    被驱逐的租户只是提交状态、释放内存；调用方手里仍持有的调度器可以完成进行中的轮次
+    （存储器在最后一轮结束时才关闭），新轮次则会被拒绝，应重新 获取()。
+    """
+
+    def __init__(self, API密钥: str, 数据目录="./btca_memory", 最大常驻=None, 空闲秒数=1800,
+                 调度器类=BTCA调度器, 客户端=None, Chroma内存上限=None, 限流器: BTCA限流器 = None,
+                 回复缓存参数: dict = None, 记忆工厂=None, 句柄空闲秒数=60):
+        """
+        最大常驻：同时驻留内存的租户数上限；None 时按文件描述符上限估算（见 默认最大常驻）
+        空闲秒数：超过该时长未访问的租户在下次 获取() 时被驱逐
+        句柄空闲秒数：超过该时长未访问的常驻租户在下次 获取() 时收起日志 / 审计句柄（仍保持常驻）
+        调度器类：BTCA调度器 或 BTCA异步调度器（全部租户共用同一个模型客户端）
+        Chroma内存上限：字节数；设置后 Chroma 以 LRU 策略卸载冷集合的向量段
+        限流器：全部租户共享的模型调用调度器（默认按 BTCA_RPM / BTCA_TPM 环境变量创建）
+        回复缓存参数：给出时每个租户各建一个 BTCA回复缓存（作用域随租户自己的 DMA 变化），None 为关闭
+        记忆工厂：传给各租户调度器的会话记忆工厂（如 BTCA会话记忆），None 为关闭
+        """
+        self.API密钥 = API密钥
+        self.数据目录 = 数据目录
+        self.最大常驻 = 最大常驻 if 最大常驻 is not None else 默认最大常驻()
+        self.空闲秒数 = 空闲秒数
+        self.句柄空闲秒数 = 句柄空闲秒数
+        self.调度器类 = 调度器类
+        os.makedirs(数据目录, exist_ok=True)
+
+        self.Chroma内存上限 = Chroma内存上限
+        # Chroma 客户端与模型客户端全部租户共享，且都在首次真正需要时才创建
+        self._chroma_client = None
+        self._客户端 = 客户端
+        self._共享锁 = threading.Lock()
+        self.限流器 = 限流器 if 限流器 is not None else BTCA限流器.从环境变量()
+        self.回复缓存参数 = 回复缓存参数
+        self.记忆工厂 = 记忆工厂
+        # 全部租户共用一个嵌入模型与向量缓存
+        self.嵌入服务 = BTCA嵌入服务(os.path.join(数据目录, "embedding_cache"))
+
+        self._常驻 = OrderedDict()   # 租户ID → [调度器, 最近访问时间, 句柄已收起]
+        self._锁 = threading.Lock()
+
+    @property
+    def chroma_client(self):
+        with self._共享锁:
+            if self._chroma_client is None:
+                from chromadb.config import Settings
+                设置 = Settings()
+                if self.Chroma内存上限:
+                    设置 = Settings(chroma_segment_cache_policy="LRU",
+                                  chroma_memory_limit_bytes=self.Chroma内存上限)
+                self._chroma_client = 打开Chroma客户端(self.数据目录, 设置)
+            return self._chroma_client
+
+    def _共享客户端(self):
+        with self._共享锁:
+            if self._客户端 is None:
+                self._客户端 = self.调度器类._创建客户端(self.API密钥)
+            return self._客户端
+
+    def __len__(self):
+        return len(self._常驻)
+
+    def __contains__(self, 租户ID):
+        return 租户ID in self._常驻
+
+    def 获取(self, 租户ID: str = 默认租户) -> BTCA调度器:
+        """返回租户的调度器；未常驻则从磁盘懒加载"""
+        with self._锁:
+            现在 = time.monotonic()
+            条目 = self._常驻.get(租户ID)
+            if 条目 is not None:
+                条目[1], 条目[2] = 现在, False
+                self._常驻.move_to_end(租户ID)
+                self._收起空闲(现在)
+                return 条目[0]
+
+            调度器 = self._加载(租户ID)
+            self._常驻[租户ID] = [调度器, 现在, False]
+            self._驱逐空闲(现在)
+            while len(self._常驻) > self.最大常驻:
+                self._驱逐(next(iter(self._常驻)))
+            self._收起空闲(现在)
+            return 调度器
+
+    def _加载(self, 租户ID):
+        存储 = 打开租户存储(self.数据目录, 租户ID, chroma_client=lambda: self.chroma_client, 嵌入服务=self.嵌入服务)
+        # 没有密钥也没有现成客户端时不传工厂，由调度器照常报出缺少密钥
+        共享 = self._共享客户端 if self.API密钥 else None
+        回复缓存 = BTCA回复缓存(self.嵌入服务, **self.回复缓存参数) if self.回复缓存参数 is not None else None
+        return self.调度器类(self.API密钥, 存储=存储, 客户端=self._客户端 or 共享, 限流器=self.限流器,
+                         回复缓存=回复缓存, 记忆工厂=self.记忆工厂)
+
+    def _驱逐空闲(self, 现在):
+        # OrderedDict 按最近访问排序，从最旧处扫描到第一个非空闲租户即可
+        while self._常驻:
+            租户ID, (_, 最近访问, _) = next(iter(self._常驻.items()))
+            if 现在 - 最近访问 < self.空闲秒数:
+                break
+            self._驱逐(租户ID)
+
+    def _收起空闲(self, 现在):
+        # 同样从最旧处扫描：短暂空闲的租户先释放文件描述符，再次访问时自动重新打开
+        for 条目 in self._常驻.values():
+            if 现在 - 条目[1] < self.句柄空闲秒数:
+                break
+            if not 条目[2]:
+                条目[0].存储.收起句柄()
+                条目[2] = True
+
+    def _驱逐(self, 租户ID):
+        调度器 = self._常驻.pop(租户ID)[0]
+        调度器.存储.释放()
+
+    def 驱逐(self, 租户ID: str):
+        """主动驱逐一个租户（不存在时忽略）"""
+        with self._锁:
+            if 租户ID in self._常驻:
+                self._驱逐(租户ID)
+
+    def 关闭(self):
+        """驱逐全部租户，落盘检查点"""
+        with self._锁:
+            while self._常驻:
+                self._驱逐(next(iter(self._常驻)))
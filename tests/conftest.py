@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+import types
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from btca_embedding import BTCA嵌入服务, 内容哈希  # noqa: E402
+from btca_main import BTCA存储器  # noqa: E402
+
+回复正文 = "推演正文\n结论：维持现状。"
+
+
+def _哈希嵌入(文本列表):
+    """按内容哈希取种子的 16 维随机向量：跨进程稳定，不需要下载嵌入模型"""
+    return [np.random.default_rng(int(内容哈希(t)[:6], 16)).standard_normal(16) for t in 文本列表]
+
+
+def _用量(总数=100):
+    return types.SimpleNamespace(total_tokens=总数, prompt_tokens=总数 - 20, completion_tokens=20,
+                                 prompt_tokens_details=None)
+
+
+def _响应(内容=回复正文):
+    消息 = types.SimpleNamespace(content=内容)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=消息)], usage=_用量())
+
+
+class _阻塞模型:
+    """chat.completions.create 在 放行 被设置前阻塞"""
+
+    def __init__(self):
+        self.已进入 = threading.Event()
+        self.放行 = threading.Event()
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **参数):
+        self.已进入.set()
+        assert self.放行.wait(10)
+        return _响应()
+
+
+class _异步模型:
+    """AsyncOpenAI 形态；输入含 故障 的请求在 故障 为真时抛出异常"""
+
+    def __init__(self):
+        self.故障 = True
+        self.chat = types.SimpleNamespace(completions=self)
+
+    async def create(self, **参数):
+        if self.故障 and "故障" in 参数["messages"][-1]["content"]:
+            raise ValueError("模拟的模型错误")
+        return _响应()
+
+
+class _流式模型:
+    """stream=True 时逐块产出 块列表，最后一块携带 usage（与 OpenAI 的 include_usage 一致）"""
+
+    def __init__(self, 块列表=("推演", "正文\n", "结论：", "维持现状。")):
+        self.块列表 = list(块列表)
+        self.已关闭 = False
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **参数):
+        if not 参数.get("stream"):
+            return _响应("".join(self.块列表))
+        模型 = self
+
+        class 流:
+            def __iter__(self):
+                for 文本 in 模型.块列表:
+                    delta = types.SimpleNamespace(content=文本)
+                    yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+                yield types.SimpleNamespace(choices=[], usage=_用量())
+
+            def close(self):
+                模型.已关闭 = True
+
+        return 流()
+
+
+@pytest.fixture
+def 哈希嵌入():
+    return _哈希嵌入
+
+
+@pytest.fixture
+def 存储(tmp_path):
+    """tmp_path/mem 下、使用哈希嵌入的存储器；测试结束时关闭"""
+    存储 = BTCA存储器(str(tmp_path / "mem"), 嵌入服务=BTCA嵌入服务(嵌入函数=_哈希嵌入))
+    yield 存储
+    存储.关闭()
+
+
+@pytest.fixture
+def 阻塞模型():
+    return _阻塞模型()
+
+
+@pytest.fixture
+def 异步模型():
+    return _异步模型()
+
+
+@pytest.fixture
+def 流式模型():
+    return _流式模型()
+
+
+@pytest.fixture
+def 模型():
+    """同步模型：普通请求返回完整回复，stream=True 时逐块产出"""
+    return _流式模型()
@@ -0,0 +1,44 @@
+import threading
+
+from btca_analytics import BTCA审计分析
+from btca_audit import BTCA审计写入器
+
+
+def test_摄取途中轮转(tmp_path):
+    写入器 = BTCA审计写入器(str(tmp_path), 缓冲条数=1, 刷新间隔=0, 分段大小=500)
+    分析 = BTCA审计分析(str(tmp_path))
+    for i in range(120):
+        写入器.写入({"turn_id": f"t{i}", "tokens_used": 1})
+        if i % 5 == 0:
+            分析.更新()
+    写入器.关闭()
+    分析.更新()
+    assert 分析.行数 == 120
+    assert 分析.元数据["sums"]["tokens"] == 120
+    # 重新打开（元数据从磁盘加载）后不重复摄取
+    assert BTCA审计分析(str(tmp_path)).更新() == 0
+
+
+def test_多个实例并发更新不重复摄取(tmp_path):
+    写入器 = BTCA审计写入器(str(tmp_path), 缓冲条数=1, 刷新间隔=0)
+    # 两个实例共用缓存目录，等同于两个 worker 进程；每个实例再被多个会话线程同时刷新
+    实例 = [BTCA审计分析(str(tmp_path)) for _ in range(2)]
+    停止 = threading.Event()
+
+    def 刷新(分析):
+        while not 停止.is_set():
+            分析.更新()
+
+    线程 = [threading.Thread(target=刷新, args=(a,)) for a in 实例 for _ in range(4)]
+    for t in 线程:
+        t.start()
+    for i in range(1500):
+        写入器.写入({"turn_id": f"t{i}", "tokens_used": 1})
+    写入器.关闭()
+    停止.set()
+    for t in 线程:
+        t.join()
+    for 分析 in 实例:
+        分析.更新()
+        assert 分析.行数 == 1500 and 分析.元数据["sums"]["tokens"] == 1500
+        assert len(分析.列("tokens")) == 1500
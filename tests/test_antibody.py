@@ -0,0 +1,19 @@
+from btca_antibody import BTCA抗体库
+
+
+def _抗体(i):
+    return {"id": f"AB_{i}", "keywords": [f"词{i}"], "source": "test", "created_at": "2026-01-01T00:00:00"}
+
+
+def test_删除末尾后水位仍能看到新抗体(tmp_path):
+    写方, 读方 = BTCA抗体库(str(tmp_path)), BTCA抗体库(str(tmp_path))  # 模拟两个进程
+    写方.添加(_抗体(1))
+    写方.添加(_抗体(2))
+    _, 水位 = 读方.新增抗体(0)
+    assert 写方.剪枝(最多命中=0, 闲置天数=0) == ["AB_1", "AB_2"]
+    写方.添加(_抗体(3))
+    新增, _ = 读方.新增抗体(水位)
+    assert [r[1] for r in 新增] == ["AB_3"]
+    写方.关闭()
+    读方.关闭()
+
@@ -0,0 +1,49 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from btca_audit import BTCA审计写入器, BTCA审计读取器
+
+
+def _写入器(目录, **参数):
+    return BTCA审计写入器(str(目录), 缓冲条数=1, 刷新间隔=0, **参数)
+
+
+def test_活动段轮转后读取器从新段开始(tmp_path):
+    写入器 = _写入器(tmp_path, 分段大小=500)
+    读取器 = BTCA审计读取器(str(tmp_path))
+    for i in range(200):
+        写入器.写入({"turn_id": f"t{i}"})
+        if i % 7 == 0:
+            list(读取器.查询())  # 读取器缓存的活动段跨越多次轮转
+    写入器.关闭()
+    记录 = list(读取器.查询())
+    assert len(读取器.段列表()) > 2
+    assert sorted(r["turn_id"] for r in 记录) == sorted(f"t{i}" for i in range(200))
+    assert 读取器.按轮次("t199")["turn_id"] == "t199"
+
+
+def test_乱序时间戳按区间查询(tmp_path):
+    基准 = datetime(2026, 1, 1, 12)
+    写入器 = _写入器(tmp_path)
+    # 多进程并发追加时，后写入的记录可能带着更早的时间戳
+    for i, 秒 in enumerate([0, 5, 2, 8, 1, 9]):
+        写入器.写入({"turn_id": f"t{i}", "timestamp": (基准 + timedelta(seconds=秒)).isoformat()})
+    写入器.关闭()
+    读取器 = BTCA审计读取器(str(tmp_path))
+    命中 = {r["turn_id"] for r in 读取器.查询(基准 + timedelta(seconds=1), 基准 + timedelta(seconds=5))}
+    assert 命中 == {"t1", "t2", "t4"}
+
+
+def test_多个写入器共用一个定时刷盘线程(tmp_path):
+    for 名 in ("甲", "乙"):
+        (tmp_path / 名).mkdir()
+    写入器 = [BTCA审计写入器(str(tmp_path / 名), 刷新间隔=0.05) for 名 in ("甲", "乙")]
+    for i, w in enumerate(写入器):
+        w.写入({"turn_id": f"t{i}"})
+    time.sleep(0.3)
+    for 名 in ("甲", "乙"):
+        assert len(list(BTCA审计读取器(str(tmp_path / 名)).查询())) == 1
+    assert sum(t.name == "btca-audit-flush" for t in threading.enumerate()) == 1
+    for w in 写入器:
+        w.关闭()
@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from btca_async import BTCA异步调度器
+from btca_batch import BTCA批处理
+
+
+def test_故障回复不计入完成且续跑重试(tmp_path, 存储, 异步模型):
+    输入 = tmp_path / "in.jsonl"
+    输入.write_text("".join(json.dumps({"input": t}, ensure_ascii=False) + "\n"
+                          for t in ("第一问", "会故障的一问", "第三问")), encoding="utf-8")
+    输出 = str(tmp_path / "out.jsonl")
+    引擎 = BTCA异步调度器("", 存储=存储, 客户端=异步模型)
+    统计 = asyncio.run(BTCA批处理(引擎, str(输入), 输出, 并发=1).运行())
+    assert (统计["completed"], 统计["failed"], 统计["next_line"]) == (2, 1, 1)
+    with open(输出 + ".ckpt", encoding="utf-8") as f:
+        assert json.load(f)["done"] == [2]
+
+    异步模型.故障 = False
+    统计 = asyncio.run(BTCA批处理(引擎, str(输入), 输出, 并发=1).运行())
+    assert (统计["completed"], 统计["failed"], 统计["next_line"]) == (1, 0, 3)
+
+    with open(输出, encoding="utf-8") as f:
+        记录 = [json.loads(行) for 行 in f]
+    assert [r["line"] for r in 记录] == [0, 1, 2, 1]
+    assert 记录[1]["error"].startswith("【内核故障】") and "reply" in 记录[3]
+
+
+def test_无效输入行计入完成不再重跑(tmp_path, 存储, 异步模型):
+    输入 = tmp_path / "in.jsonl"
+    有效行 = "".join(json.dumps({"input": f"第{i}问"}, ensure_ascii=False) + "\n" for i in range(5))
+    输入.write_text("{不是 JSON\n" + 有效行, encoding="utf-8")
+    输出 = str(tmp_path / "out.jsonl")
+    引擎 = BTCA异步调度器("", 存储=存储, 客户端=异步模型)
+    统计 = asyncio.run(BTCA批处理(引擎, str(输入), 输出, 并发=2).运行())
+    assert (统计["completed"], 统计["failed"], 统计["next_line"]) == (5, 1, 6)
+    for _ in range(3):
+        统计 = asyncio.run(BTCA批处理(引擎, str(输入), 输出, 并发=2).运行())
+        assert (统计["completed"], 统计["failed"], 统计["next_line"]) == (0, 0, 6)
+        assert 统计["pending_above_watermark"] == 0
+
+    with open(输出 + ".ckpt", encoding="utf-8") as f:
+        assert json.load(f)["done"] == []
+    with open(输出, encoding="utf-8") as f:
+        记录 = [json.loads(行) for 行 in f]
+    assert len(记录) == 6 and 记录[0]["line"] == 0 and 记录[0]["rejected"]
@@ -0,0 +1,16 @@
+from btca_main import BTCA存储器
+
+
+def test_重置体征不回退DMA版本(tmp_path):
+    存储 = BTCA存储器(str(tmp_path), 检索缓存容量=8)
+    with 存储.事务() as 状态:
+        状态["DMA版本"] = 5
+        状态["总轮次"] = 12
+    旧键 = 存储.检索缓存.键("今天该做什么", 5, 3)
+    存储.检索缓存.写入(旧键, ["旧片段"])
+
+    存储.重置体征()
+    assert 存储.状态["总轮次"] == 0
+    assert 存储.状态["DMA版本"] == 6
+    assert 存储.检索缓存.读取(存储.检索缓存.键("今天该做什么", 存储.状态["DMA版本"], 3)) is None
+    存储.关闭()
@@ -0,0 +1,30 @@
+import numpy as np
+
+from btca_compact import 压实
+from btca_embedding import BTCA嵌入服务, 内容哈希
+from btca_main import BTCA存储器
+
+
+def _簇嵌入(文本列表):
+    """"A-1" / "A-2" 共享 A 的基向量，只差一点噪声（余弦相似度 > 0.99）"""
+    def 随机(s):
+        return np.random.default_rng(int(内容哈希(s)[:6], 16)).standard_normal(16)
+    return [随机(t.split("-")[0]) + 0.01 * 随机(t) for t in 文本列表]
+
+
+def test_冷层参与压实与回写去重(tmp_path):
+    存储 = BTCA存储器(str(tmp_path), 嵌入服务=BTCA嵌入服务(嵌入函数=_簇嵌入), 去重阈值=None, 热层上限=100)
+    try:
+        assert 存储.注入基因(["A-1", "A-2", "B-1", "C-1"]) == 4
+        assert 存储.降级(0) == 4
+        版本 = 存储.状态["DMA版本"]
+
+        报告 = 压实(存储)
+        assert (报告["cold"]["before"], 报告["cold"]["after"]) == (4, 3)
+        assert 存储.冷集合.count() == 3 and 存储.状态["DMA版本"] == 版本 + 1
+
+        存储.去重阈值 = 0.9
+        assert 存储.注入基因(["A-3"]) == 0  # 近重复只在冷层中
+        assert 存储.注入基因(["D-1"]) == 1
+    finally:
+        存储.关闭()
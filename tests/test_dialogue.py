@@ -0,0 +1,61 @@
+from btca_dialogue import BTCA会话记忆
+
+
+def _轮(i):
+    return f"第{i}个问题", f"推演过程{i}\n:DMA_WRITE: 片段{i}\n结论{i}"
+
+
+def _原文(记忆):
+    return [m["content"] for m in 记忆.消息() if m["role"] == "user"]
+
+
+def test_超过保留轮数后最早的轮次折叠进摘要():
+    记忆 = BTCA会话记忆(保留轮数=2)
+    for i in range(1, 6):
+        记忆.追加(*_轮(i))
+    assert _原文(记忆) == ["第4个问题", "第5个问题"]
+    assert (len(记忆), 记忆.折叠轮数, 记忆.略去轮数) == (5, 3, 0)
+    assert 记忆.摘要.split("\n") == [f"第{i}轮 问：第{i}个问题 答：结论{i}" for i in (1, 2, 3)]
+
+    消息 = 记忆.消息()
+    assert 消息[0] == {"role": "system", "content": "【此前对话摘要】\n" + 记忆.摘要}
+    assert [m["role"] for m in 消息[1:]] == ["user", "assistant"] * 2
+    assert 消息[2]["content"] == _轮(4)[1]  # 原文窗口内的回复不做抽取
+
+
+def test_原文超出预算时提前折叠():
+    计数 = BTCA会话记忆().打包器.计数
+    每轮 = 计数(_轮(1)[0]) + 计数(_轮(1)[1])
+    记忆 = BTCA会话记忆(保留轮数=10, 预算tokens=3 * 每轮, 摘要预算=每轮)
+    for i in range(1, 7):
+        记忆.追加(*_轮(i))
+        assert 记忆.tokens <= 记忆.预算tokens
+    assert 记忆.折叠轮数 > 0 and len(记忆) == 6
+    assert _原文(记忆) == [f"第{i}个问题" for i in range(记忆.折叠轮数 + 1, 7)]
+
+
+def test_摘要超出摘要预算时略去最早的行():
+    记忆 = BTCA会话记忆(保留轮数=1, 摘要预算=30)
+    for i in range(1, 9):
+        记忆.追加(*_轮(i))
+    行 = 记忆.摘要.split("\n")
+    assert 记忆.略去轮数 > 0 and 行[0] == f"（更早的 {记忆.略去轮数} 轮从略）"
+    assert 行[1].startswith(f"第{记忆.略去轮数 + 1}轮 ") and 行[-1].startswith("第7轮 ")
+    assert 记忆.略去轮数 + len(行) - 1 == 记忆.折叠轮数 == 7
+    assert _原文(记忆) == ["第8个问题"]
+
+
+def test_自定义摘要器按折叠次序调用():
+    调用 = []
+
+    def 摘要器(旧摘要, 用户输入, 回复):
+        调用.append(用户输入)
+        return f"{旧摘要}|{用户输入}"
+
+    记忆 = BTCA会话记忆(保留轮数=2, 摘要器=摘要器)
+    for i in range(1, 5):
+        记忆.追加(*_轮(i))
+    assert 调用 == ["第1个问题", "第2个问题"]
+    assert 记忆.摘要 == "|第1个问题|第2个问题"
+    记忆.清空()
+    assert (len(记忆), 记忆.tokens, 记忆.消息()) == (0, 0, [])
@@ -0,0 +1,22 @@
+import numpy as np
+
+from btca_embedding import BTCA嵌入服务, 内容哈希
+
+
+def _确定性嵌入(文本列表):
+    return [np.full(8, int(内容哈希(t)[:6], 16), dtype=np.float32) for t in 文本列表]
+
+
+def test_两个进程交替写入向量缓存(tmp_path):
+    # 两个服务实例各自持有行号表，等同于共用同一缓存目录的两个进程
+    甲 = BTCA嵌入服务(str(tmp_path), 嵌入函数=_确定性嵌入)
+    乙 = BTCA嵌入服务(str(tmp_path), 嵌入函数=_确定性嵌入)
+    文本 = [f"片段{i}" for i in range(40)]
+    for i in range(0, 40, 4):
+        甲.嵌入(文本[i:i + 3])
+        乙.嵌入(文本[i + 1:i + 4])  # 与 甲 部分重叠
+    新实例 = BTCA嵌入服务(str(tmp_path), 嵌入函数=lambda t: (_ for _ in ()).throw(AssertionError("不应重算")))
+    for t, 向量 in zip(文本, 新实例.嵌入(文本)):
+        assert np.array_equal(向量, _确定性嵌入([t])[0])
+    with open(tmp_path / "index.txt") as f:
+        assert len(f.read().split()) == 40
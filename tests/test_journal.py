@@ -0,0 +1,107 @@
+import json
+import os
+
+from btca_journal import BTCA状态日志
+from btca_main import BTCA存储器
+
+
+def test_新目录上的两个进程不互相覆盖(tmp_path):
+    # 两个实例各持一个锁文件句柄，flock 在它们之间互斥，与两个进程相同
+    甲, 乙 = BTCA存储器(str(tmp_path)), BTCA存储器(str(tmp_path))
+    for _ in range(3):
+        for 存储 in (甲, 乙):
+            with 存储.事务() as 状态:
+                状态["总轮次"] += 1
+                状态["DMA版本"] += 1
+            存储.提交()
+    甲.关闭()
+    乙.关闭()
+    状态 = BTCA状态日志(str(tmp_path / "btca_state.json")).加载()
+    assert (状态["总轮次"], 状态["DMA版本"]) == (6, 6)
+
+
+def test_已有数据时不写初始状态(tmp_path):
+    日志 = BTCA状态日志(str(tmp_path / "btca_state.json"))
+    assert 日志.加载或初始化(lambda: {"总轮次": 0}) == {"总轮次": 0}
+    日志.提交()
+    另一个 = BTCA状态日志(str(tmp_path / "btca_state.json"))
+    assert 另一个.加载或初始化(lambda: {"总轮次": -1}) == {"总轮次": 0}
+
+
+def test_残缺尾行重放时丢弃并截断(tmp_path):
+    路径 = str(tmp_path / "btca_state.json")
+    日志 = BTCA状态日志(路径)
+    状态 = 日志.加载或初始化(lambda: {"总轮次": 0})
+    状态["总轮次"] = 1
+    日志.记录(状态)
+    日志.提交()
+    完整长度 = os.path.getsize(日志.日志文件)
+    with open(日志.日志文件, "a", encoding="utf-8") as f:
+        f.write('{"set":{"总轮次":2}}')  # 崩溃：JSON 完整但换行未写出
+    日志.进程锁.关闭()
+
+    重启 = BTCA状态日志(路径)
+    状态 = 重启.加载()
+    assert 状态 == {"总轮次": 1} and os.path.getsize(重启.日志文件) == 完整长度
+    状态["总轮次"] = 3
+    重启.记录(状态)
+    重启.提交()
+    重启.进程锁.关闭()
+    assert BTCA状态日志(路径).加载() == {"总轮次": 3}
+
+
+def test_检查点后清空日志且重复重放幂等(tmp_path):
+    路径 = str(tmp_path / "btca_state.json")
+    日志 = BTCA状态日志(路径, 检查点阈值=3)
+    状态 = 日志.加载或初始化(lambda: {"总轮次": 0, "能量储备": 100})
+    崩溃前日志 = []
+    原检查点 = 日志._检查点
+
+    def 检查点():
+        with open(日志.日志文件, "rb") as f:
+            崩溃前日志.append(f.read())
+        原检查点()
+
+    日志._检查点 = 检查点
+    for 键, 值 in (("总轮次", 2), ("能量储备", 90)):
+        状态[键] = 值
+        日志.记录(状态)
+        日志.提交()  # 初始状态 + 2 条增量：第 2 次提交达到阈值，写检查点并清空日志
+    assert len(崩溃前日志) == 1 and len(崩溃前日志[0].splitlines()) == 3
+    assert os.path.getsize(日志.日志文件) == 0
+    with open(路径, encoding="utf-8") as f:
+        assert json.load(f) == {"总轮次": 2, "能量储备": 90}
+    日志.进程锁.关闭()
+
+    # 检查点已替换、日志尚未清空时崩溃：旧增量重放到新检查点上，结果不变
+    with open(路径 + ".journal", "wb") as f:
+        f.write(崩溃前日志[0])
+    assert BTCA状态日志(路径).加载() == {"总轮次": 2, "能量储备": 90}
+
+
+def test_组提交合并为一条增量且保持先后次序(tmp_path, monkeypatch):
+    路径 = str(tmp_path / "btca_state.json")
+    日志 = BTCA状态日志(路径)
+    状态 = 日志.加载或初始化(lambda: {"甲": 0, "乙": 0})
+    同步次数 = []
+    monkeypatch.setattr(os, "fsync", lambda fd: 同步次数.append(fd))
+
+    状态["甲"] = 1
+    日志.记录(状态)
+    del 状态["乙"]
+    日志.记录(状态)
+    状态["乙"] = 2  # 删除后又写回：以最后一次为准
+    状态["丙"] = 1
+    日志.记录(状态)
+    del 状态["丙"]  # 新增后又删除
+    状态["甲"] = 3
+    日志.记录(状态)
+    日志.提交()
+    日志.提交()  # 没有新变化：不写不同步
+
+    with open(日志.日志文件, encoding="utf-8") as f:
+        行 = [json.loads(x) for x in f]
+    assert len(行) == 2 and len(同步次数) == 1
+    assert 行[1] == {"set": {"甲": 3, "乙": 2}, "del": ["丙"]}
+    日志.进程锁.关闭()
+    assert BTCA状态日志(路径).加载() == {"甲": 3, "乙": 2}
@@ -0,0 +1,53 @@
+import random
+
+from btca_matcher import BTCA模式自动机
+
+
+def _朴素扫描(模式库, 输入文本):
+    """自动机取代的逐模式子串扫描（按库顺序）"""
+    文本 = 输入文本.lower()
+    return [模式ID for 模式ID, 关键词 in 模式库.items() if any(kw.lower() in 文本 for kw in 关键词)]
+
+
+def _编译(模式库):
+    自动机 = BTCA模式自动机()
+    for 模式ID, 关键词 in 模式库.items():
+        自动机.添加(模式ID, 关键词)
+    return 自动机
+
+
+def test_重叠与嵌套关键词():
+    模式库 = {"P1": ["he"], "P2": ["she"], "P3": ["hers"], "P4": ["his"], "P5": ["abab"], "P6": ["bab"],
+           "P7": ["失控"], "P8": ["完全失控了"], "P9": ["AAA"]}
+    自动机 = _编译(模式库)
+    for 文本 in ("ushers", "ahishers", "xababx", "ABABAB", "他完全失控了", "失控", "aa", "aAaA", "", "h"):
+        assert 自动机.扫描(文本) == _朴素扫描(模式库, 文本), 文本
+
+
+def test_随机模式与输入与朴素扫描一致():
+    随机 = random.Random(0)
+    字母表 = "abA失"  # 小字母表：大量重叠、嵌套与共享前后缀
+    for _ in range(200):
+        模式库 = {f"P{i}": ["".join(随机.choices(字母表, k=随机.randint(0, 4))) for _ in range(随机.randint(1, 3))]
+               for i in range(随机.randint(1, 12))}
+        自动机 = _编译(模式库)
+        for _ in range(10):
+            文本 = "".join(随机.choices(字母表, k=随机.randint(0, 20)))
+            assert 自动机.扫描(文本) == _朴素扫描(模式库, 文本), (模式库, 文本)
+
+
+def test_增量添加与移除后仍与朴素扫描一致():
+    随机 = random.Random(1)
+    字母表 = "abc"
+    自动机, 模式库 = BTCA模式自动机(), {}
+    for i in range(300):
+        if 模式库 and 随机.random() < 0.3:
+            模式ID = 随机.choice(list(模式库))
+            del 模式库[模式ID]
+            自动机.移除(模式ID)
+        else:
+            关键词 = ["".join(随机.choices(字母表, k=随机.randint(1, 5)))]
+            模式库[f"P{i}"] = 关键词
+            自动机.添加(f"P{i}", 关键词)
+        文本 = "".join(随机.choices(字母表, k=随机.randint(0, 30)))
+        assert 自动机.扫描(文本) == _朴素扫描(模式库, 文本)
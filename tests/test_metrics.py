@@ -0,0 +1,19 @@
+import random
+
+from btca_metrics import BTCA剖析器
+
+
+def test_落选的轮次不再重抽(tmp_path):
+    random.seed(0)
+    剖析器 = BTCA剖析器(str(tmp_path), 比例=0.2)
+    被剖析, 只剖析到尾段 = 0, 0
+    for i in range(500):
+        审计 = {"turn_id": f"T-{i}"}
+        记录 = []
+        for 最终 in (False, False, True):  # 一轮三段，最后一段 最终=True
+            with 剖析器.片段(审计, 最终):
+                记录.append(bool(审计.get("profile")))
+        被剖析 += 记录[-1]
+        只剖析到尾段 += 记录[-1] and not 记录[0]
+    assert 只剖析到尾段 == 0
+    assert 60 <= 被剖析 <= 140  # 约 500 × 0.2
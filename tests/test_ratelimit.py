@@ -0,0 +1,69 @@
+import types
+
+import pytest
+
+from btca_packer import BTCA上下文打包器
+from btca_ratelimit import BTCA限流器, _令牌桶
+
+
+class _限流错误(Exception):
+    status_code = 429
+    code = None
+    response = types.SimpleNamespace(headers={})
+
+
+def test_令牌桶匀速回填且透支按欠额等待():
+    桶 = _令牌桶(60)  # 每秒回填 1 个
+    现在 = 桶.时刻
+    assert 桶.预约(60, 现在) == 0.0 and 桶.余量 == 0
+    assert 桶.预约(3, 现在) == pytest.approx(3.0)  # 透支 3 个：等 3 秒
+    assert 桶.预约(0, 现在 + 5) == 0.0 and 桶.余量 == pytest.approx(2.0)
+    assert 桶.预约(0, 现在 + 1000) == 0.0 and 桶.余量 == 60  # 不超过容量
+    assert 桶.预约(1000, 现在 + 1000) == 0.0 and 桶.余量 == 0  # 超过容量的请求按满桶计
+
+
+def test_429减半且一秒内只减一次_成功后逐步恢复():
+    限流器 = BTCA限流器(最大并发=8, 基础退避=0.0)
+    assert 限流器._失败(_限流错误(), 0, 0) == 0.0
+    assert 限流器.并发上限 == 4
+    限流器._失败(_限流错误(), 1, 0)
+    assert 限流器.并发上限 == 4
+    限流器._上次减半 -= 1.0
+    限流器._失败(_限流错误(), 2, 0)
+    assert 限流器.并发上限 == 2
+
+    for _ in range(3):
+        限流器._成功()
+    assert 2 < 限流器.并发上限 < 4  # 加性增长：每次 +1/上限
+    for _ in range(200):
+        限流器._成功()
+    assert 限流器.并发上限 == 8
+
+
+def test_重试后成功并记入审计():
+    次数 = []
+
+    def 调用(**参数):
+        次数.append(参数)
+        if len(次数) == 1:
+            raise _限流错误()
+        return "ok"
+
+    审计 = {}
+    限流器 = BTCA限流器(TPM=100000, 基础退避=0.0)
+    assert 限流器.调用(调用, {"messages": [{"content": "限流测试"}], "max_tokens": 10}, 审计) == "ok"
+    assert len(次数) == 2 and 审计["rl_retries"] == 1
+    assert 审计["rl_estimated_tokens"] == BTCA上下文打包器().计数("限流测试") + 10  # 与打包器同一计数
+
+
+def test_额度耗尽不重试():
+    错误 = _限流错误()
+    错误.code = "insufficient_quota"
+
+    def 调用(**参数):
+        raise 错误
+
+    限流器 = BTCA限流器(最大并发=8)
+    with pytest.raises(_限流错误):
+        限流器.调用(调用, {"messages": []})
+    assert 限流器.并发上限 == 8 and 限流器._在途 == 0
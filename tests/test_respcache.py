@@ -0,0 +1,23 @@
+from btca_embedding import BTCA嵌入服务
+from btca_main import BTCA调度器
+from btca_respcache import BTCA回复缓存
+
+
+def _失效嵌入(文本列表):
+    raise ConnectionError("嵌入模型不可用")
+
+
+def test_嵌入失败时退化为精确匹配(存储, 模型):
+    回复缓存 = BTCA回复缓存(BTCA嵌入服务(嵌入函数=_失效嵌入))
+    调度器 = BTCA调度器("", 存储=存储, 客户端=模型, 回复缓存=回复缓存)
+
+    回复, 审计 = 调度器.运行推演周期("今天该做什么")
+    assert "结论" in 回复 and 审计["tokens_used"] == 100
+    assert 审计["response_cache"] == "miss"
+
+    回复, 审计 = 调度器.运行推演周期("今天该做什么")
+    assert "结论" in 回复 and 审计["response_cache"] == "exact"
+    # 近似输入需要向量：嵌入失败时只能未命中，照常调用模型
+    _, 审计 = 调度器.运行推演周期("今天应该做什么")
+    assert 审计["response_cache"] == "miss" and 审计["tokens_used"] == 100
+    assert 回复缓存.统计()["embed_errors"] >= 2
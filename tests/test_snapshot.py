@@ -0,0 +1,30 @@
+import numpy as np
+
+from btca_main import BTCA存储器, BTCA免疫系统
+
+
+def _抗体(i, 关键词):
+    return {"id": f"AB_{i}", "keywords": [关键词], "source": "test", "created_at": "2026-01-01T00:00:00"}
+
+
+def test_恢复后免疫自动机随抗体库重建(tmp_path):
+    来源 = BTCA存储器(str(tmp_path / "src"))
+    来源.抗体库.添加(_抗体(1, "甲方暗号"))
+    来源.集合.add(ids=["f1"], documents=["片段"], embeddings=np.ones((1, 8), dtype=np.float32))
+    归档 = str(tmp_path / "clone.btcasnap")
+    来源.导出快照(归档)
+    来源.关闭()
+
+    目标 = BTCA存储器(str(tmp_path / "dst"))
+    for i in range(3):
+        目标.抗体库.添加(_抗体(10 + i, f"旧暗号{i}"))
+    免疫 = BTCA免疫系统(目标)
+    assert 免疫.适应性扫描("旧暗号2")
+
+    报告 = 目标.恢复快照(归档, 覆盖=True)
+    assert 报告["antibodies"] == 1 and 目标.集合.count() == 1
+    assert [a["id"] for a in 免疫.适应性扫描("甲方暗号")] == ["AB_1"]
+    # 被替换掉的抗体已移出自动机，不再产生命中（也不再给已删除的 id 记命中数）
+    assert "AB_12" not in 免疫.自动机
+    assert not 免疫.适应性扫描("旧暗号2")
+    目标.关闭()
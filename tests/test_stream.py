@@ -0,0 +1,25 @@
+from btca_audit import BTCA审计读取器
+from btca_main import BTCA调度器
+
+
+def test_中途关闭流仍结算已收到的部分(存储, 流式模型):
+    调度器 = BTCA调度器("", 存储=存储, 客户端=流式模型)
+    能量 = 存储.状态["能量储备"]
+    回合 = 调度器.运行推演周期_流式("今天该做什么")
+    块 = iter(回合)
+    assert next(块) == "推演"
+    回合.关闭()
+
+    assert 流式模型.已关闭
+    assert 回合.审计["stream_abandoned"] and 回合.审计["tokens_estimated"]
+    assert 回合.审计["tokens_used"] > 0 and 存储.状态["能量储备"] < 能量
+    assert 存储.状态["总轮次"] == 1
+    存储.审计.刷新()
+    记录 = list(BTCA审计读取器(存储.数据目录).查询(turn_id=回合.审计["turn_id"]))
+    assert len(记录) == 1 and 记录[0]["tokens_used"] == 回合.审计["tokens_used"]
+
+
+def test_完整读完的流按回传用量结算(存储, 流式模型):
+    回合 = BTCA调度器("", 存储=存储, 客户端=流式模型).运行推演周期_流式("今天该做什么")
+    assert "".join(回合).startswith("推演正文")
+    assert 回合.审计["tokens_used"] == 100 and "stream_abandoned" not in 回合.审计
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from btca_audit import BTCA审计读取器
+from btca_embedding import BTCA嵌入服务
+from btca_tenant import BTCA租户管理器, 打开租户存储, 默认最大常驻
+
+
+def test_轮次进行中驱逐租户(tmp_path, 阻塞模型, 哈希嵌入):
+    管理器 = BTCA租户管理器("", str(tmp_path), 客户端=阻塞模型)
+    管理器.嵌入服务._嵌入函数 = 哈希嵌入
+    调度器 = 管理器.获取("alice")
+    结果 = {}
+    线程 = threading.Thread(target=lambda: 结果.update(r=调度器.运行推演周期("今天该做什么")))
+    线程.start()
+    assert 阻塞模型.已进入.wait(10)
+
+    管理器.驱逐("alice")
+    assert "alice" not in 管理器
+    阻塞模型.放行.set()
+    线程.join(10)
+
+    回复, 审计 = 结果["r"]
+    assert "结论" in 回复 and 审计["tokens_used"] == 100
+    存储 = 调度器.存储
+    assert 存储.审计._文件.closed  # 最后一轮结束后才关闭
+    记录 = list(BTCA审计读取器(存储.数据目录).查询())
+    assert [r["turn_id"] for r in 记录] == [审计["turn_id"]]
+    with pytest.raises(RuntimeError):
+        调度器.运行推演周期("再来一轮")
+    # 重新获取得到新的调度器，状态从磁盘恢复
+    assert 管理器.获取("alice").存储.状态["总轮次"] == 存储.状态["总轮次"]
+    管理器.关闭()
+
+
+def test_空闲租户收起句柄后照常使用(tmp_path, 模型, 哈希嵌入):
+    管理器 = BTCA租户管理器("", str(tmp_path), 客户端=模型, 句柄空闲秒数=0.05)
+    管理器.嵌入服务._嵌入函数 = 哈希嵌入
+    甲 = 管理器.获取("alice")
+    甲.运行推演周期("第一问")
+    甲.存储.审计.刷新()
+    time.sleep(0.1)
+    管理器.获取("bob")
+
+    assert 甲.存储.审计._文件 is None
+    assert 甲.存储.审计.进程锁._fd is None and 甲.存储.状态日志.进程锁._fd is None
+    _, 审计 = 管理器.获取("alice").运行推演周期("第二问")
+    甲.存储.审计.刷新()
+    记录 = list(BTCA审计读取器(甲.存储.数据目录).查询())
+    assert len(记录) == 2 and 记录[-1]["turn_id"] == 审计["turn_id"]
+    assert 甲.存储.状态["总轮次"] == 2
+    管理器.关闭()
+
+
+def test_离线工具与管理器打开同一份租户数据(tmp_path, 哈希嵌入):
+    管理器 = BTCA租户管理器("", str(tmp_path), 客户端=object())
+    管理器.嵌入服务._嵌入函数 = 哈希嵌入
+    for 租户ID in ("default", "alice", "张三"):
+        管理器.获取(租户ID).存储.注入基因([f"{租户ID} 的基因"])
+    目录 = {租户ID: 管理器.获取(租户ID).存储.数据目录 for 租户ID in ("default", "alice", "张三")}
+    管理器.关闭()
+
+    for 租户ID in (None, "default", "alice", "张三"):
+        存储 = 打开租户存储(str(tmp_path), 租户ID, 嵌入服务=BTCA嵌入服务(嵌入函数=哈希嵌入))
+        try:
+            assert 存储.数据目录 == 目录[租户ID or "default"]
+            assert 存储.集合.get()["documents"] == [f"{租户ID or 'default'} 的基因"]
+        finally:
+            存储.关闭()
+
+
+def test_默认常驻上限随描述符上限(monkeypatch):
+    import resource
+    monkeypatch.setattr(resource, "getrlimit", lambda _: (1024, 4096))
+    assert 默认最大常驻() == 64
+    monkeypatch.setattr(resource, "getrlimit", lambda _: (256, 4096))
+    assert 默认最大常驻() == 18